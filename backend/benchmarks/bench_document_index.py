@@ -0,0 +1,99 @@
+"""
+Benchmark: indexado y consultas del índice local de documentos (SQLite FTS5 + BM25)
+
+Genera un corpus sintético con un vocabulario de frecuencias tipo Zipf y mide:
+documentos y MB por segundo al indexar por lotes, el coste de una resincronización
+en la que solo cambia una fracción de los documentos (el resto se salta por versión)
+y la latencia p50/p99 de consultas top-k con 2-4 términos.
+
+Uso: python benchmarks/bench_document_index.py [--documents 20000] [--queries 2000] [--top-k 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.document_index import Document, DocumentIndex
+
+SYLLABLES = ["ra", "lo", "ti", "ca", "men", "es", "tro", "na", "sa", "ver", "dad", "pre", "con", "cion", "mi", "tal"]
+
+
+def vocabulary(size: int, rng: random.Random):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    # Pesos de Zipf: unas pocas palabras muy frecuentes y una cola larga de raras
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return words, weights
+
+
+def make_document(i: int, words, weights, rng: random.Random, revision: int = 0) -> Document:
+    paragraphs = []
+    for _ in range(rng.randint(2, 8)):
+        sentence_words = rng.choices(words, weights, k=rng.randint(40, 120))
+        paragraphs.append(" ".join(sentence_words).capitalize() + ".")
+    title = " ".join(rng.choices(words[:2000], k=4))
+    return Document(f"bench:{i}", "\n\n".join(paragraphs) + (f" revisión {revision}" if revision else ""),
+                    title, "bench")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--changed", type=float, default=0.01, help="Fracción de documentos modificados al resincronizar")
+    parser.add_argument("--vocabulary", type=int, default=30000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    words, weights = vocabulary(args.vocabulary, rng)
+    documents = [make_document(i, words, weights, rng) for i in range(args.documents)]
+    total_chars = sum(len(document.text) for document in documents)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "documents.db")
+        index = DocumentIndex(path)
+
+        start = time.perf_counter()
+        for offset in range(0, len(documents), 500):
+            index.add_documents(documents[offset:offset + 500])
+        elapsed = time.perf_counter() - start
+        stats = index.stats()
+        size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+        print(f"Indexado: {len(documents)} documentos ({total_chars / 1e6:.1f} MB de texto, {stats['passages']} pasajes) "
+              f"en {elapsed:.2f} s -> {len(documents) / elapsed:.0f} docs/s, {total_chars / 1e6 / elapsed:.1f} MB/s; "
+              f"{size / 1e6:.1f} MB en disco")
+
+        # Resincronización: solo una fracción cambia; el resto se descarta comparando la versión
+        changed = set(rng.sample(range(len(documents)), int(len(documents) * args.changed)))
+        updated = [make_document(i, words, weights, random.Random(i), revision=1) if i in changed else document
+                   for i, document in enumerate(documents)]
+        start = time.perf_counter()
+        count = sum(index.add_documents(updated[offset:offset + 500]) for offset in range(0, len(updated), 500))
+        elapsed = time.perf_counter() - start
+        print(f"Resincronización: {count} documentos cambiados de {len(updated)} en {elapsed:.2f} s")
+
+        # Consultas con términos de frecuencia media y baja (las muy frecuentes son palabras vacías en la práctica)
+        queries = [" ".join(rng.choices(words[50:], weights[50:], k=rng.randint(2, 4))) for _ in range(args.queries)]
+        latencies, hits = [], 0
+        start = time.perf_counter()
+        for query in queries:
+            started = time.perf_counter()
+            hits += bool(index.search(query, args.top_k))
+            latencies.append((time.perf_counter() - started) * 1000)
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        print(f"Consultas top-{args.top_k}: {len(queries) / elapsed:.0f} consultas/s, "
+              f"p50 {statistics.median(latencies):.2f} ms, p99 {latencies[int(len(latencies) * 0.99) - 1]:.2f} ms, "
+              f"{hits / len(queries):.0%} con resultados")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark: extracción de colores dominantes (getcolors vs. histograma NumPy)
+
+Compara, sobre imágenes sintéticas grandes, la implementación anterior
+(resize a 150x150 + getcolors + sort, y getcolors a resolución completa para la
+descripción) con VisionService._color_palette.
+
+Uso: python benchmarks/bench_dominant_colors.py [--sizes 1024x768 4000x3000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from src.services.vision_service import VisionService
+
+
+def legacy_colors(image: Image.Image):
+    """Camino anterior: _extract_dominant_colors + getcolors de _generate_description"""
+    if image.mode == "RGB":
+        colors = image.getcolors(maxcolors=256 * 256 * 256)
+        max(colors, key=lambda x: x[0])
+    small = image.convert("RGB").resize((150, 150))
+    colors = small.getcolors(maxcolors=256 * 256 * 256)
+    colors.sort(key=lambda x: x[0], reverse=True)
+    return [f"#{c[0]:02x}{c[1]:02x}{c[2]:02x}" for _, c in colors[:5]]
+
+
+def make_image(width: int, height: int) -> Image.Image:
+    """Degradado con ruido: muchos colores distintos, como una foto real"""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    return Image.merge("RGB", (gradient, noise, gradient.rotate(90, expand=False)))
+
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", default=["1024x768", "4000x3000"])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault("VISION_WORKERS", "0")
+    service = VisionService()
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split("x"))
+        image = make_image(width, height)
+        legacy_ms = best_of(lambda: legacy_colors(image), args.repeat)
+        numpy_ms = best_of(lambda: service._color_palette(image), args.repeat)
+        print(f"{size:>10}: getcolors {legacy_ms:8.1f} ms   numpy {numpy_ms:7.1f} ms   "
+              f"x{legacy_ms / numpy_ms:5.1f}   paleta {service._color_palette(image)[:3]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark: detección de intenciones (bucles any(... in ...) vs. IntentClassifier)
+
+Compara, sobre un corpus de mensajes realistas, la detección anterior (tablas
+reconstruidas en cada llamada, lower() repetido y búsqueda de subcadenas) con la
+expresión regular compilada de IntentClassifier, y lista los mensajes en los que
+ambas difieren (falsos positivos como "go" dentro de "google").
+
+Uso: python benchmarks/bench_intent_classifier.py [--messages 20000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.intent_classifier import INTENT_TABLES, IntentClassifier
+
+PROMPTS = [
+    "¿Puedes explicar cómo funciona el decorador @property en Python?",
+    "Busca en Google las últimas noticias sobre energía solar",
+    "Necesito revisar este componente de React que no renderiza",
+    "Crear una API REST con Flask y SQLAlchemy",
+    "Haz un análisis de mercado de la industria del café en Colombia",
+    "Escribe un poema sobre el otoño en Madrid",
+    "Quiero un cuento corto para niños sobre un dragón",
+    "ir a https://developer.mozilla.org y resumir la guía de fetch",
+    "Generar un servicio en Go que lea de Kafka",
+    "Debug de un segfault en C++ con punteros colgantes",
+    "Investigar la evolución histórica de la imprenta",
+    "Diseño de un logotipo con un concepto visual minimalista",
+    "Compara el rendimiento de Rust y Java en servidores web",
+    "¿Cuál es la arquitectura recomendada para microservicios en Node?",
+    "Dame la letra de canción para un cumpleaños",
+    "Escribe un guion con una escena en un tren nocturno",
+    "Resume este paper sobre transformers y atención dispersa",
+    "Explicar la diferencia entre let y const en JavaScript",
+    "Navegar a la documentación de Spring Boot",
+    "Hola, ¿qué tal el día? Cuéntame algo interesante",
+    "Me gusta el algoritmo de Google para ordenar resultados",
+    "Hazme una lista de la compra para la semana",
+]
+
+
+def legacy_classify(user_input: str):
+    """Camino anterior: una tabla por servicio, lower() por cada palabra y subcadenas"""
+    labels = {}
+    for table, keywords_by_label in INTENT_TABLES.items():
+        tables = {label: list(keywords) for label, keywords in keywords_by_label.items()}
+        for label, keywords in tables.items():
+            if any(keyword in user_input.lower() for keyword in keywords):
+                labels[table] = label
+                break
+    return labels
+
+
+def compiled_classify(classifier: IntentClassifier, user_input: str):
+    intents = classifier._classify(user_input)
+    return {table: intents.label(table, None) for table in INTENT_TABLES if intents.best(table)}
+
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = [rng.choice(PROMPTS) + f" (#{i})" for i in range(args.messages)]
+
+    start = time.perf_counter()
+    classifier = IntentClassifier(INTENT_TABLES)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    legacy_ms = best_of(lambda: [legacy_classify(text) for text in corpus], args.repeat)
+    compiled_ms = best_of(lambda: [compiled_classify(classifier, text) for text in corpus], args.repeat)
+    cached_ms = best_of(lambda: [classifier.classify(text) for text in PROMPTS * 4], args.repeat)
+
+    print(f"{args.messages} mensajes (compilación: {compile_ms:.2f} ms)")
+    print(f"  subcadenas: {legacy_ms:8.1f} ms  ({legacy_ms * 1000 / args.messages:6.2f} µs/mensaje)")
+    print(f"  compilado:  {compiled_ms:8.1f} ms  ({compiled_ms * 1000 / args.messages:6.2f} µs/mensaje)  "
+          f"x{legacy_ms / compiled_ms:.1f}")
+    print(f"  memorizado: {cached_ms * 1000 / (len(PROMPTS) * 4):6.2f} µs/mensaje (mismo texto en varios servicios)")
+
+    print("\nDiferencias (subcadenas -> límites de palabra):")
+    for text in PROMPTS:
+        before, after = legacy_classify(text), compiled_classify(classifier, text)
+        if before != after:
+            print(f"  {text!r}\n    {before}\n    {after}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark: reintentos, modelo alternativo y hedging contra un stub con fallos
+
+Lanza peticiones secuenciales a OpenRouterService.generate_response contra el stub
+local con una fracción de errores 429/503 y de respuestas lentas, y compara la tasa
+de éxito y la latencia de cola sin y con hedging.
+
+Uso: python benchmarks/bench_llm_resilience.py [--requests 300] [--error-rate 0.2] [--slow-rate 0.05]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_openrouter import start_in_thread
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def run(service, requests: int):
+    latencies, ok, attempts_total = [], 0, 0
+    for i in range(requests):
+        attempts = []
+        started = time.perf_counter()
+        content = await service.generate_response(f"mensaje {i}", model="gpt-4o",
+                                                  fallback_models=["gpt-4o-mini"], attempts=attempts)
+        latencies.append((time.perf_counter() - started) * 1000)
+        ok += not content.startswith("Error")
+        attempts_total += len(attempts)
+    return latencies, ok, attempts_total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--hedge-percentile", type=float, default=90)
+    args = parser.parse_args()
+
+    base_url = start_in_thread(port=8798, latency=args.latency, error_rate=args.error_rate,
+                               slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+    os.environ.update(OPENROUTER_API_KEY="stub", OPENROUTER_BASE_URL=base_url,
+                      RESPONSE_CACHE_BACKEND="none", LLM_RETRY_BASE_DELAY="0.05")
+    from src.services.openrouter_service import OpenRouterService
+
+    for label, retries, hedge in [("solo modelo alternativo", 0, 0), ("reintentos", 2, 0),
+                                  (f"reintentos + hedging p{args.hedge_percentile:.0f}", 2, args.hedge_percentile)]:
+        service = OpenRouterService()
+        service.retry_policy.retries = retries
+        service.hedge_percentile = hedge
+        latencies, ok, attempts = asyncio.run(run(service, args.requests))
+        print(f"{label:>28}: éxito {ok / args.requests:6.1%}  intentos/petición {attempts / args.requests:4.2f}  "
+              f"p50 {percentile(latencies, 50):6.1f} ms  p95 {percentile(latencies, 95):6.1f} ms  "
+              f"p99 {percentile(latencies, 99):6.1f} ms")
+        service.http.close()
+
+
+if __name__ == "__main__":
+    main()
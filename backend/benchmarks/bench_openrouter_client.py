@@ -0,0 +1,90 @@
+"""
+Benchmark: cliente HTTP asíncrono con pool vs. requests.post bloqueante
+
+Lanza N llamadas a generate_response a un ritmo fijo de llegada (bucle abierto)
+contra un stub local de OpenRouter y muestra peticiones/s y latencias p50/p99 de
+ambos caminos. La latencia se mide desde el instante programado de llegada, de
+modo que el tiempo que una petición pasa esperando a un event loop bloqueado
+también cuenta.
+
+El scheduler por modelo se configura sin límites prácticos (concurrencia y cola igual
+al número de peticiones): el camino anterior no pasaba por él y aquí se compara solo el
+cliente HTTP. Con --max-concurrency se puede medir con el límite que se quiera.
+
+Uso: python benchmarks/bench_openrouter_client.py [--requests 500] [--rate 400]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from benchmarks.stub_openrouter import start_in_thread
+
+os.environ.setdefault("OPENROUTER_API_KEY", "bench-key")
+from src.services.openrouter_service import OpenRouterService
+from src.services.llm_scheduler import LLMScheduler
+
+
+async def legacy_generate(service: OpenRouterService, user_input: str, model: str) -> str:
+    """Camino anterior: requests.post sin sesión dentro de una corrutina"""
+    payload = {"model": model, "messages": [{"role": "user", "content": user_input}]}
+    response = requests.post(f"{service.base_url}/chat/completions", headers=service.headers, json=payload)
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
+
+
+async def run(call, total: int, rate: float):
+    latencies = []
+    start = time.perf_counter()
+
+    async def one(i):
+        scheduled = start + i / rate
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        await call(f"mensaje {i}")
+        latencies.append(time.perf_counter() - scheduled)
+
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=400, help="Llegadas por segundo")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--max-concurrency", type=int, default=0,
+                        help="Llamadas simultáneas por modelo en el scheduler (0 = tantas como peticiones)")
+    args = parser.parse_args()
+
+    os.environ["OPENROUTER_BASE_URL"] = start_in_thread(latency=args.latency)
+    service = OpenRouterService()
+    model = "openai/gpt-4o"
+    # Con los límites por defecto (8 en curso, 32 en cola) la ráfaga acabaría en QueueFullError
+    service.scheduler = LLMScheduler(default_concurrency=args.max_concurrency or args.requests,
+                                     max_queue=args.requests, queue_timeout=600)
+
+    results = {
+        "requests.post (anterior)": asyncio.run(run(lambda m: legacy_generate(service, m, model),
+                                                    args.requests, args.rate)),
+        "AsyncHTTPClient (pool)": asyncio.run(run(lambda m: service.generate_response(m, model=model, use_cache=False),
+                                                  args.requests, args.rate)),
+    }
+    print(f"{args.requests} peticiones a {args.rate:.0f} req/s, latencia stub {args.latency * 1000:.0f} ms")
+    for name, r in results.items():
+        print(f"{name:<26} {r['rps']:8.1f} req/s   p50 {r['p50_ms']:7.1f} ms   p99 {r['p99_ms']:7.1f} ms")
+    service.http.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: búsqueda en la caché semántica (vectores float16 con listas invertidas)
+
+Para cada tamaño llena un VectorIndex con vectores aleatorios normalizados y mide la
+latencia p50/p99 de buscar reformulaciones (un vector guardado más ruido), el acierto
+frente a la búsqueda exhaustiva y la memoria del índice, también por millón de
+entradas. Muestra además el coste de calcular el embedding de un mensaje.
+
+Uso: python benchmarks/bench_semantic_cache.py [--sizes 10000 100000 1000000] [--dim 384]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from src.services.semantic_cache import HashingEmbedder, VectorIndex
+
+
+def random_unit(rng, rows, dim):
+    vectors = rng.standard_normal((rows, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exhaustive(index, query):
+    best, best_score = -1, -2.0
+    for start in range(0, index.count, 65536):
+        scores = index._vectors[start:min(index.count, start + 65536)].astype(np.float32) @ query
+        i = int(np.argmax(scores))
+        if scores[i] > best_score:
+            best, best_score = start + i, float(scores[i])
+    return best
+
+
+def bench_size(size, dim, queries, noise, rng):
+    index = VectorIndex(dim, capacity=size)
+    start = time.perf_counter()
+    for offset in range(0, size, 65536):
+        for vector in random_unit(rng, min(65536, size - offset), dim).astype(np.float16):
+            index.add(vector, 1, 1.0)
+    added = time.perf_counter() - start
+    start = time.perf_counter()
+    index.install(index.train())
+    trained = time.perf_counter() - start
+
+    targets = rng.choice(size, queries, replace=False)
+    latencies, found, exact = [], 0, 0
+    for target in targets:
+        query = index._vectors[target].astype(np.float32) + noise * random_unit(rng, 1, dim)[0]
+        query /= np.linalg.norm(query)
+        started = time.perf_counter()
+        result = index.search(query, k=1, scope=1)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found += bool(result) and result[0][0] == target
+    # Búsqueda exhaustiva sobre unas pocas consultas (con float16 es lenta: es lo que evita el IVF)
+    sample = targets[:min(20, queries)]
+    started = time.perf_counter()
+    for target in sample:
+        exact += exhaustive(index, index._vectors[target].astype(np.float32)) == target
+    exhaustive_ms = (time.perf_counter() - started) * 1000 / len(sample)
+
+    latencies.sort()
+    memory = index.memory_bytes()
+    print(f"{size:>9} entradas: alta {size / added:,.0f}/s, agrupamiento {trained:.1f} s ({len(index._centroids)} listas); "
+          f"búsqueda p50 {statistics.median(latencies):.2f} ms, p99 {latencies[int(len(latencies) * 0.99) - 1]:.2f} ms "
+          f"(exhaustiva {exhaustive_ms:.1f} ms); acierto {found / queries:.1%}; "
+          f"memoria {memory / 2 ** 20:.1f} MiB ({memory / size * 1e6 / 2 ** 20:.0f} MiB por millón)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.03, help="Ruido de las reformulaciones (similitud ~0.95)")
+    args = parser.parse_args()
+    rng = np.random.default_rng(1)
+
+    embedder = HashingEmbedder(args.dim)
+    messages = [f"¿Cuál es la mejor forma de aprender {topic} desde cero en pocas semanas?"
+                for topic in ("python", "rust", "piano", "alemán", "estadística")] * 200
+    start = time.perf_counter()
+    for message in messages:
+        embedder.encode([message])
+    print(f"Embedding (hashing, {args.dim} dimensiones): {(time.perf_counter() - start) / len(messages) * 1e6:.0f} µs por mensaje")
+
+    for size in args.sizes:
+        bench_size(size, args.dim, args.queries, args.noise, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: descarga de páginas del WebService contra el servidor local de fixtures
+
+Compara una descarga secuencial con requests (cuerpo completo y HTML parseado al
+final) con el PageFetcher en tres situaciones: caché fría (descargas concurrentes
+con límite por host), caché fresca (sin red) y revalidación (GET condicionales que
+reciben 304). Muestra también cuántos bytes se leen de una página enorme con el
+presupuesto WEB_MAX_BYTES y la concurrencia máxima que vio el servidor.
+
+Uso: python benchmarks/bench_web_fetch.py [--pages 40] [--latency 0.05] [--per-host 8]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from benchmarks.web_fixture import start_in_thread
+from src.services.page_fetcher import HTMLTextExtractor, PageFetcher
+
+
+def sequential_baseline(urls):
+    """Una petición detrás de otra, leyendo el cuerpo entero antes de extraer el texto"""
+    session = requests.Session()
+    total = 0
+    for url in urls:
+        response = session.get(url)
+        total += len(response.content)
+        extractor = HTMLTextExtractor(max_chars=10 ** 9)
+        extractor.feed(response.text)
+        extractor.close()
+    return total
+
+
+async def timed(label, coro, count):
+    start = time.perf_counter()
+    pages = await coro
+    elapsed = time.perf_counter() - start
+    states = {}
+    for page in pages:
+        states[page.get("cache", "error")] = states.get(page.get("cache", "error"), 0) + 1
+    print(f"{label:<34} {elapsed * 1000:9.1f} ms  {count / elapsed:8.1f} páginas/s  {states}")
+    return pages
+
+
+async def run_fetcher(urls, base_url, per_host, cache_path):
+    fetcher = PageFetcher(cache_path=cache_path, per_host=per_host, fresh_for=60, allow_private=True)
+    await timed("PageFetcher (caché fría)", fetcher.fetch_many(urls), len(urls))
+    await timed("PageFetcher (caché fresca)", fetcher.fetch_many(urls), len(urls))
+    fetcher.fresh_for = 0
+    await timed("PageFetcher (revalidación 304)", fetcher.fetch_many(urls), len(urls))
+
+    big = await fetcher.fetch(f"{base_url}/big")
+    print(f"\nPágina enorme: {big['bytes_read'] / 1024:.0f} KiB leídos (presupuesto "
+          f"{fetcher.max_bytes / 1024:.0f} KiB), {len(big['text'])} caracteres, truncada={big['truncated']}")
+    fetcher.http.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--per-host", type=int, default=8)
+    args = parser.parse_args()
+
+    base_url = start_in_thread(latency=args.latency)
+    urls = [f"{base_url}/page/{i}" for i in range(args.pages)]
+
+    start = time.perf_counter()
+    sequential_baseline(urls)
+    elapsed = time.perf_counter() - start
+    print(f"{'requests secuencial':<34} {elapsed * 1000:9.1f} ms  {len(urls) / elapsed:8.1f} páginas/s")
+
+    requests.get(f"{base_url}/stats")
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run_fetcher(urls, base_url, args.per_host, os.path.join(tmp, "page_cache.db")))
+    stats = requests.get(f"{base_url}/stats").json()
+    print(f"Servidor: {stats['requests']} peticiones, {stats['not_modified']} respuestas 304, "
+          f"concurrencia máxima {stats['max_in_flight']} (límite por host {args.per_host})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Prueba de carga: escalado de /api/chat con conexiones concurrentes
+
+Arranca un stub local de OpenRouter y el backend (servidor ASGI con uvicorn o el
+servidor de desarrollo de Flask) en subprocesos, y lanza peticiones a /api/chat con
+niveles crecientes de concurrencia, mostrando peticiones/s y latencias p50/p99.
+Cada mensaje es único (nivel, número y un identificador de la ejecución) y se envía con
+"cache": false, para que ni la caché exacta ni la semántica respondan por el modelo.
+
+Uso: python benchmarks/load_test_chat.py --mode asgi --concurrency 1 10 50 100
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import aiohttp
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_COMMANDS = {
+    "asgi": [sys.executable, "-m", "uvicorn", "src.asgi:app", "--host", "127.0.0.1", "--port", "{port}",
+             "--log-level", "warning", "--no-access-log"],
+    "flask": [sys.executable, "-c",
+              "from src.main import app; app.run(host='127.0.0.1', port={port}, threaded=True)"],
+}
+
+
+async def wait_until_up(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"El servidor no respondió en {url}")
+
+
+async def run_level(url: str, concurrency: int, total: int, agent_type: str, run_id: str):
+    latencies, errors, rejected = [], 0, 0
+    queue = iter(range(total))
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def worker():
+            nonlocal errors, rejected
+            for i in queue:
+                start = time.perf_counter()
+                try:
+                    message = f"hola {i} (nivel {concurrency}, ejecución {run_id})"
+                    async with session.post(url, json={"message": message, "agent_type": agent_type,
+                                                       "cache": False}) as r:
+                        await r.read()
+                        if r.status == 429:
+                            rejected += 1
+                        elif r.status != 200:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        # Solo cuentan las respuestas del modelo: los 429 (cola llena) son rápidos y no son throughput
+        "rps": (total - errors - rejected) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "errors": errors,
+        "rejected": rejected
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=sorted(SERVER_COMMANDS), default="asgi")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--requests-per-level", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.2, help="Latencia simulada de OpenRouter (s)")
+    parser.add_argument("--agent-type", default="general")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--stub-port", type=int, default=8799)
+    args = parser.parse_args()
+
+    env = dict(os.environ,
+               OPENROUTER_API_KEY="load-test-key",
+               OPENROUTER_BASE_URL=f"http://127.0.0.1:{args.stub_port}/api/v1",
+               FLASK_ENV="production")
+    stub = subprocess.Popen([sys.executable, "-m", "benchmarks.stub_openrouter", "--port", str(args.stub_port),
+                             "--latency", str(args.latency)], cwd=BACKEND_DIR, env=env)
+    command = [part.format(port=args.port) for part in SERVER_COMMANDS[args.mode]]
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f"http://127.0.0.1:{args.port}"
+        asyncio.run(wait_until_up(f"{base}/api/health"))
+        print(f"Modo {args.mode}, latencia OpenRouter simulada {args.latency * 1000:.0f} ms, "
+              f"{args.requests_per_level} peticiones por nivel")
+        run_id = uuid.uuid4().hex[:8]
+        for concurrency in args.concurrency:
+            r = asyncio.run(run_level(f"{base}/api/chat", concurrency, args.requests_per_level, args.agent_type,
+                                      run_id))
+            print(f"concurrencia {concurrency:>4}: {r['rps']:8.1f} req/s   p50 {r['p50_ms']:7.1f} ms   "
+                  f"p99 {r['p99_ms']:7.1f} ms   429 {r['rejected']}   errores {r['errors']}")
+    finally:
+        server.terminate()
+        stub.terminate()
+        server.wait()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
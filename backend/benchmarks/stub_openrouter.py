@@ -0,0 +1,124 @@
+"""
+Stub OpenRouter - Servidor local que imita la API de OpenRouter para benchmarks
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from aiohttp import web
+
+
+STREAM_TOKENS = ["Respuesta ", "simulada ", "del ", "stub."]
+STUB_MODELS = [
+    {"id": "openai/gpt-4o", "name": "OpenAI: GPT-4o", "context_length": 128000,
+     "pricing": {"prompt": "0.0000025", "completion": "0.00001"}, "architecture": {"modality": "text+image->text"}},
+    {"id": "openai/gpt-4o-mini", "name": "OpenAI: GPT-4o-mini", "context_length": 128000,
+     "pricing": {"prompt": "0.00000015", "completion": "0.0000006"}, "architecture": {"modality": "text+image->text"}},
+    {"id": "anthropic/claude-3.5-sonnet", "name": "Anthropic: Claude 3.5 Sonnet", "context_length": 200000,
+     "pricing": {"prompt": "0.000003", "completion": "0.000015"}, "architecture": {"modality": "text+image->text"}},
+    {"id": "deepseek/deepseek-chat", "name": "DeepSeek: DeepSeek V3", "context_length": 64000,
+     "pricing": {"prompt": "0.00000027", "completion": "0.0000011"}, "architecture": {"modality": "text->text"}}
+]
+
+
+def create_app(latency: float = 0.05, error_rate: float = 0.0, slow_rate: float = 0.0,
+               slow_latency: float = 1.0, failing_models=()) -> web.Application:
+    """Crea la aplicación stub con una latencia simulada por petición.
+
+    error_rate: fracción de peticiones que responden 429/503 (para probar reintentos).
+    slow_rate: fracción de peticiones que tardan slow_latency (cola de latencia, para hedging).
+    failing_models: modelos que siempre responden 503 (para probar el circuit breaker).
+    """
+
+    async def stream_completion(request: web.Request, payload: dict) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(b": OPENROUTER PROCESSING\n\n")
+        # La latencia se reparte entre los fragmentos: el primero llega antes que la respuesta completa
+        for token in STREAM_TOKENS:
+            await asyncio.sleep(latency / len(STREAM_TOKENS))
+            chunk = {"model": payload.get("model"), "choices": [{"delta": {"content": token}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        if (payload.get("usage") or {}).get("include"):
+            usage = {"prompt_tokens": 10, "completion_tokens": len(STREAM_TOKENS), "total_tokens": 10 + len(STREAM_TOKENS)}
+            await response.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        if payload.get("model") in failing_models:
+            return web.json_response({"error": {"code": 503, "message": "stub model down"}}, status=503)
+        if random.random() < error_rate:
+            status = random.choice([429, 503])
+            return web.json_response({"error": {"code": status, "message": "stub error"}}, status=status,
+                                     headers={"Retry-After": "0"} if status == 429 else None)
+        if payload.get("stream"):
+            return await stream_completion(request, payload)
+        await asyncio.sleep(slow_latency if random.random() < slow_rate else latency)
+        return web.json_response({
+            "id": f"stub-{time.time_ns()}",
+            "model": payload.get("model"),
+            "choices": [{"message": {"role": "assistant", "content": "Respuesta simulada del stub."}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+        })
+
+    async def models(request: web.Request) -> web.Response:
+        return web.json_response({"data": STUB_MODELS})
+
+    app = web.Application()
+    app.router.add_post("/api/v1/chat/completions", chat_completions)
+    app.router.add_get("/api/v1/models", models)
+    return app
+
+
+def start_in_thread(host: str = "127.0.0.1", port: int = 8799, latency: float = 0.05, timeout: float = 10.0,
+                    **faults) -> str:
+    """Arranca el stub en un hilo de fondo y devuelve su base_url.
+
+    Con port=0 se usa un puerto libre. Si el servidor no puede arrancar (p. ej. el puerto
+    está ocupado) se relanza aquí su excepción en lugar de esperar para siempre.
+    """
+    ready = threading.Event()
+    state = {}
+
+    def _serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            runner = web.AppRunner(create_app(latency, **faults))
+            loop.run_until_complete(runner.setup())
+            loop.run_until_complete(web.TCPSite(runner, host, port, backlog=1024).start())
+            state["port"] = runner.addresses[0][1]
+        except Exception as e:
+            state["error"] = e
+            loop.close()
+            return
+        finally:
+            ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=_serve, name="stub-openrouter", daemon=True).start()
+    if not ready.wait(timeout):
+        raise RuntimeError(f"El stub de OpenRouter no arrancó en {timeout:g}s")
+    if "error" in state:
+        raise state["error"]
+    return f"http://{host}:{state['port']}/api/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub local de la API de OpenRouter")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency", type=float, default=0.05, help="Latencia simulada en segundos")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 429/503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fracción de peticiones lentas")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="Latencia de las peticiones lentas")
+    parser.add_argument("--failing-models", nargs="*", default=[], help="Modelos que siempre responden 503")
+    args = parser.parse_args()
+    print(f"Stub OpenRouter en http://{args.host}:{args.port}/api/v1 (latencia {args.latency}s)")
+    web.run_app(create_app(args.latency, args.error_rate, args.slow_rate, args.slow_latency, args.failing_models),
+                host=args.host, port=args.port, print=None)
@@ -0,0 +1,84 @@
+"""
+Informe de trazas: qué etapa domina la latencia de cola por tipo de agente
+
+Lee el fichero que escribe TRACING_EXPORTER=file (OTLP/JSON, un lote por línea),
+agrupa los spans por traza y, para cada tipo de agente, muestra el p50/p99 de cada
+etapa y cuánto tiempo se lleva cada una en las trazas más lentas (las que están por
+encima del p99 de la petición completa).
+
+Uso: python benchmarks/trace_report.py [src/database/traces.jsonl] [--percentile 99]
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "src", "database", "traces.jsonl")
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def load_spans(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for resource in json.loads(line)["resourceSpans"]:
+                for scope in resource["scopeSpans"]:
+                    for span in scope["spans"]:
+                        attributes = {item["key"]: next(iter(item["value"].values())) for item in span["attributes"]}
+                        yield {"trace_id": span["traceId"], "span_id": span["spanId"],
+                               "parent": span["parentSpanId"], "name": span["name"],
+                               "ms": (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6,
+                               "attributes": attributes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    parser.add_argument("--percentile", type=float, default=99)
+    args = parser.parse_args()
+
+    traces = defaultdict(list)
+    for span in load_spans(args.path):
+        traces[span["trace_id"]].append(span)
+
+    # Por tipo de agente: duración de cada traza y tiempo por etapa (suma de los spans del mismo nombre)
+    by_agent = defaultdict(list)
+    for spans in traces.values():
+        # Raíz: el span cuyo padre no está en la traza (sin padre, o padre remoto de `traceparent`)
+        span_ids = {span["span_id"] for span in spans}
+        root = next((span for span in spans if span["parent"] not in span_ids), None)
+        if root is None or "agent_type" not in root["attributes"]:
+            continue
+        stages = defaultdict(float)
+        for span in spans:
+            if span is not root:
+                stages[span["name"]] += span["ms"]
+        by_agent[root["attributes"]["agent_type"]].append((root["ms"], stages))
+
+    if not by_agent:
+        sys.exit(f"No hay trazas de chat en {args.path}")
+
+    for agent_type, requests in sorted(by_agent.items()):
+        totals = [total for total, _ in requests]
+        threshold = percentile(totals, args.percentile)
+        tail = [stages for total, stages in requests if total >= threshold]
+        print(f"\n{agent_type}: {len(requests)} peticiones, p50 {percentile(totals, 50):.1f} ms, "
+              f"p{args.percentile:.0f} {threshold:.1f} ms")
+        names = sorted({name for _, stages in requests for name in stages})
+        rows = []
+        for name in names:
+            values = [stages.get(name, 0.0) for _, stages in requests]
+            tail_mean = sum(stages.get(name, 0.0) for stages in tail) / len(tail)
+            rows.append((tail_mean, name, percentile(values, 50), percentile(values, args.percentile)))
+        print(f"  {'etapa':<34} {'p50 ms':>9} {'p' + format(args.percentile, '.0f') + ' ms':>9} {'cola ms':>9}")
+        for tail_mean, name, p50, tail_pct in sorted(rows, reverse=True):
+            print(f"  {name:<34} {p50:9.1f} {tail_pct:9.1f} {tail_mean:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
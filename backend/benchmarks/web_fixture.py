@@ -0,0 +1,142 @@
+"""
+Web fixture - Servidor local de páginas para probar y medir el WebService sin salir a Internet
+
+Rutas:
+  /page/<n>        HTML con ETag y Last-Modified; responde 304 a los GET condicionales
+  /big             HTML de varios MB enviado por bloques (para el presupuesto de bytes)
+  /redirect/<n>    302 hacia /page/<n>
+  /search?q=...    página de resultados con enlaces /l/?uddg=<url> al estilo de DuckDuckGo
+  /image.png       contenido binario (se rechaza sin leerlo)
+  /stats           peticiones, respuestas 304, bytes enviados y concurrencia máxima observada
+"""
+import argparse
+import asyncio
+import hashlib
+import threading
+from urllib.parse import quote
+from aiohttp import web
+
+LAST_MODIFIED = "Mon, 05 Oct 2026 10:00:00 GMT"
+PARAGRAPH = ("RALT Agent descarga páginas reales, extrae el texto visible y lo guarda en caché "
+             "para revalidarlo después con peticiones condicionales. ")
+
+
+def page_html(n: int, paragraphs: int = 40) -> str:
+    body = "".join(f"<p>{PARAGRAPH}Párrafo {i} de la página {n}.</p>" for i in range(paragraphs))
+    return (f"<!doctype html><html><head><title>Página {n}</title><meta charset='utf-8'>"
+            f"<style>p {{ color: #333 }}</style><script>var tracking = {n};</script></head>"
+            f"<body><nav><a href='/page/{n + 1}'>Siguiente</a></nav><h1>Página {n}</h1>{body}</body></html>")
+
+
+def create_app(latency: float = 0.05) -> web.Application:
+    """Crea la aplicación con una latencia simulada por página"""
+    stats = {"requests": 0, "not_modified": 0, "bytes_sent": 0, "in_flight": 0, "max_in_flight": 0}
+
+    @web.middleware
+    async def track(request: web.Request, handler):
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            return await handler(request)
+        finally:
+            stats["in_flight"] -= 1
+
+    async def page(request: web.Request) -> web.Response:
+        n = int(request.match_info["n"])
+        await asyncio.sleep(float(request.query.get("latency", latency)))
+        html = page_html(n)
+        etag = '"%s"' % hashlib.sha1(html.encode("utf-8")).hexdigest()[:16]
+        headers = {"ETag": etag, "Last-Modified": LAST_MODIFIED, "Cache-Control": "max-age=60"}
+        if request.headers.get("If-None-Match") == etag or request.headers.get("If-Modified-Since") == LAST_MODIFIED:
+            stats["not_modified"] += 1
+            return web.Response(status=304, headers=headers)
+        body = html.encode("utf-8")
+        stats["bytes_sent"] += len(body)
+        return web.Response(body=body, content_type="text/html", charset="utf-8", headers=headers)
+
+    async def big(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/html; charset=utf-8"})
+        await response.prepare(request)
+        chunk = ("<div><p>" + PARAGRAPH * 20 + "</p></div>").encode("utf-8")
+        try:
+            await response.write(b"<html><head><title>Grande</title></head><body>")
+            for _ in range(int(request.query.get("chunks", 2000))):
+                await response.write(chunk)
+                stats["bytes_sent"] += len(chunk)
+            await response.write(b"</body></html>")
+        except (ConnectionResetError, asyncio.CancelledError):
+            # El cliente dejó de leer al agotar su presupuesto
+            pass
+        return response
+
+    async def redirect(request: web.Request) -> web.Response:
+        raise web.HTTPFound(f"/page/{request.match_info['n']}")
+
+    async def search(request: web.Request) -> web.Response:
+        query = request.query.get("q", "")
+        host = f"http://{request.host}"
+        results = "".join(
+            f"<div class='result'><a class='result__a' href='/l/?uddg={quote(f'{host}/page/{i}', safe='')}'>"
+            f"{query} - resultado {i}</a><a href='/settings'></a></div>" for i in range(1, 11))
+        return web.Response(text=f"<html><head><title>{query} en Fixture</title></head><body>{results}</body></html>",
+                            content_type="text/html")
+
+    async def image(request: web.Request) -> web.Response:
+        return web.Response(body=b"\x89PNG\r\n\x1a\n" + bytes(4096), content_type="image/png")
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application(middlewares=[track])
+    app.router.add_get("/page/{n:\\d+}", page)
+    app.router.add_get("/big", big)
+    app.router.add_get("/redirect/{n:\\d+}", redirect)
+    app.router.add_get("/search", search)
+    app.router.add_get("/image.png", image)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def start_in_thread(host: str = "127.0.0.1", port: int = 8798, latency: float = 0.05,
+                    timeout: float = 10.0) -> str:
+    """Arranca el servidor en un hilo de fondo y devuelve su base_url.
+
+    Con port=0 se usa un puerto libre. Si el servidor no puede arrancar (p. ej. el puerto
+    está ocupado) se relanza aquí su excepción en lugar de esperar para siempre.
+    """
+    ready = threading.Event()
+    state = {}
+
+    def _serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            runner = web.AppRunner(create_app(latency))
+            loop.run_until_complete(runner.setup())
+            loop.run_until_complete(web.TCPSite(runner, host, port, backlog=1024).start())
+            state["port"] = runner.addresses[0][1]
+        except Exception as e:
+            state["error"] = e
+            loop.close()
+            return
+        finally:
+            ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=_serve, name="web-fixture", daemon=True).start()
+    if not ready.wait(timeout):
+        raise RuntimeError(f"El servidor de páginas no arrancó en {timeout:g}s")
+    if "error" in state:
+        raise state["error"]
+    return f"http://{host}:{state['port']}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local de páginas para el WebService")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8798)
+    parser.add_argument("--latency", type=float, default=0.05, help="Latencia simulada por página en segundos")
+    args = parser.parse_args()
+    print(f"Web fixture en http://{args.host}:{args.port} (latencia {args.latency}s)")
+    web.run_app(create_app(args.latency), host=args.host, port=args.port, print=None)
@@ -0,0 +1,203 @@
+"""
+ASGI - Punto de entrada de producción con un event loop de larga duración
+
+Las rutas de chat (/api/chat, /api/chat/stream y /api/chat/batch) se atienden de forma
+nativa sobre el loop del servidor, de modo que process_agent_message, los servicios y
+las llamadas a OpenRouter comparten un único loop y se ejecutan concurrentemente. El
+resto de rutas se delegan en la aplicación Flask a través del adaptador WSGI de asgiref.
+
+Uso:
+    uvicorn src.asgi:app --host 0.0.0.0 --port 5000 --workers 4
+    gunicorn src.asgi:app -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:5000
+"""
+import asyncio
+import re
+import time
+from asgiref.wsgi import WsgiToAsgi
+from src.main import app as flask_app, CORS_ORIGINS
+from src.routes import chat as chat_routes
+from src.routes import jobs as jobs_routes
+from src.services.http_client import bind_clients_to_loop, close_clients
+from src.services.metrics import observe_http
+from src.routes.admin import request_profiler
+
+
+class RaltASGIApp:
+    def __init__(self, wsgi_app):
+        self.flask_app = wsgi_app
+        self.wsgi = WsgiToAsgi(wsgi_app)
+        self.routes = {
+            ("POST", "/api/chat"): self.chat,
+            ("POST", "/api/chat/stream"): self.chat_stream,
+            ("POST", "/api/chat/batch"): self.chat_batch,
+        }
+        # Rutas con parámetros: (método, patrón, plantilla para las métricas, handler)
+        self.pattern_routes = [
+            ("GET", re.compile(r"^/api/jobs/(?P<job_id>[0-9a-f]{32})/events$"), "/api/jobs/<job_id>/events",
+             self.job_events),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] == "http":
+            handler = self.routes.get((scope["method"], scope["path"]))
+            if handler:
+                with self.flask_app.app_context():
+                    return await self.instrumented(handler, scope, receive, send)
+            for method, pattern, route, handler in self.pattern_routes:
+                match = pattern.match(scope["path"]) if scope["method"] == method else None
+                if match:
+                    with self.flask_app.app_context():
+                        return await self.instrumented(handler, {**scope, "path_params": match.groupdict()},
+                                                       receive, send, route)
+        return await self.wsgi(scope, receive, send)
+
+    async def instrumented(self, handler, scope, receive, send, route=None):
+        """Métricas HTTP, Server-Timing y perfilado de las rutas nativas (el resto los gestiona Flask)"""
+        started = time.perf_counter()
+        response = {"status": 500, "size": 0}
+        profile = None
+        if request_profiler.enabled:
+            request_headers = dict(scope["headers"])
+            profile = request_profiler.start(scope["method"], scope["path"],
+                                             request_headers.get(b"x-profile", b"").decode("latin-1"),
+                                             request_headers.get(b"x-admin-token", b"").decode("latin-1"))
+
+        async def send_instrumented(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                timing = f"app;dur={(time.perf_counter() - started) * 1000:.2f}".encode("latin-1")
+                headers = list(message.get("headers", []))
+                for i, (name, value) in enumerate(headers):
+                    if name == b"server-timing":
+                        headers[i] = (name, value + b", " + timing)
+                        break
+                else:
+                    headers.append((b"server-timing", timing))
+                if profile is not None:
+                    headers.append((b"x-profile-id", profile.id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await handler(scope, receive, send_instrumented)
+        finally:
+            content_length = dict(scope["headers"]).get(b"content-length")
+            observe_http(scope["method"], route or scope["path"], response["status"], time.perf_counter() - started,
+                         int(content_length) if content_length and content_length.isdigit() else None,
+                         response["size"])
+            if profile is not None:
+                await asyncio.to_thread(profile.finish, response["status"])
+
+    async def lifespan(self, receive, send):
+        """Enlaza los clientes HTTP al loop del servidor y los cierra al apagar"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                bind_clients_to_loop(asyncio.get_running_loop())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_clients()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def read_json(self, receive):
+        """Lee el cuerpo completo de la petición y lo decodifica como JSON"""
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        try:
+            return self.flask_app.json.loads(b"".join(chunks) or b"null")
+        except ValueError:
+            return None
+
+    @staticmethod
+    def request_headers(scope):
+        """Cabeceras de la petición con el nombre en minúsculas (traceparent, x-request-id...)"""
+        return {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+
+    def response_headers(self, scope, content_type):
+        headers = [(b"content-type", content_type.encode("latin-1"))]
+        origin = dict(scope["headers"]).get(b"origin", b"").decode("latin-1")
+        if origin in CORS_ORIGINS:
+            headers.append((b"access-control-allow-origin", origin.encode("latin-1")))
+            headers.append((b"vary", b"Origin"))
+        return headers
+
+    async def send_json(self, scope, send, body, status=200, extra_headers=None):
+        payload = self.flask_app.json.dumps(body).encode("utf-8") + b"\n"
+        headers = self.response_headers(scope, "application/json")
+        headers.append((b"content-length", str(len(payload)).encode("latin-1")))
+        for name, value in (extra_headers or {}).items():
+            headers.append((name.lower().encode("latin-1"), str(value).encode("latin-1")))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": payload})
+
+    async def chat(self, scope, receive, send):
+        """Equivalente ASGI de chat() en routes/chat.py"""
+        try:
+            body, status, headers = await chat_routes.handle_chat(await self.read_json(receive),
+                                                                self.request_headers(scope))
+            await self.send_json(scope, send, body, status, headers)
+
+        except Exception as e:
+            await self.send_json(scope, send, {"success": False, "error": str(e)}, 500)
+
+    async def chat_stream(self, scope, receive, send):
+        """Equivalente ASGI de chat_stream() en routes/chat.py"""
+        error, events, extra_headers = await chat_routes.prepare_chat_stream(await self.read_json(receive),
+                                                                            self.request_headers(scope))
+        if error:
+            return await self.send_json(scope, send, *error)
+        await self.send_stream(scope, receive, send, events, "text/event-stream", extra_headers)
+
+    async def chat_batch(self, scope, receive, send):
+        """Equivalente ASGI de chat_batch() en routes/chat.py"""
+        error, lines, extra_headers = chat_routes.prepare_chat_batch(await self.read_json(receive),
+                                                                    self.request_headers(scope))
+        if error:
+            return await self.send_json(scope, send, *error)
+        await self.send_stream(scope, receive, send, lines, "application/x-ndjson", extra_headers)
+
+    async def job_events(self, scope, receive, send):
+        """Equivalente ASGI de job_events() en routes/jobs.py (sin ocupar el hilo de las rutas WSGI)"""
+        job_id = scope["path_params"]["job_id"]
+        if jobs_routes.job_queue.snapshot(job_id) is None:
+            return await self.send_json(scope, send, {"error": f"Job not found: {job_id}"}, 404)
+        await self.send_stream(scope, receive, send, jobs_routes.job_sse_events(job_id), "text/event-stream", {})
+
+    async def send_stream(self, scope, receive, send, chunks, content_type, extra_headers):
+        """Envía los fragmentos de un generador asíncrono según se producen"""
+        headers = self.response_headers(scope, content_type)
+        headers += [(b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]
+        headers += [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in extra_headers.items()]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+
+        stream_task = asyncio.current_task()
+
+        async def watch_disconnect():
+            # Si el cliente se desconecta, cancelar la generación en curso
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            stream_task.cancel()
+
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            async for chunk in chunks:
+                await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        except asyncio.CancelledError:
+            pass
+        finally:
+            watcher.cancel()
+            await chunks.aclose()
+
+app = RaltASGIApp(flask_app)
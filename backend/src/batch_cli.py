@@ -0,0 +1,144 @@
+"""
+Batch CLI - Envía un fichero JSONL de mensajes a /api/chat/batch y guarda los resultados
+
+Cada línea de entrada es un elemento de /api/chat ({"id", "message", "agent_type", ...});
+sin `id` se usa el número de línea. Los resultados se añaden al fichero de salida según
+llegan, y ese mismo fichero sirve de checkpoint: al relanzar el comando se omiten los
+elementos cuyo último resultado fue correcto (código 200) y se reintentan los demás.
+
+Uso:
+    python src/batch_cli.py prompts.jsonl --output resultados.jsonl --url http://127.0.0.1:5000
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def load_items(path, defaults):
+    """Lee los elementos del fichero de entrada (id por defecto: número de línea)"""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"message": item}
+            items.append({**defaults, "id": number, **item})
+    return items
+
+
+def load_checkpoint(path):
+    """Ids con un resultado correcto en el fichero de salida (gana la última línea de cada id).
+
+    Los fallos del LLM llegan con 502; aun así, un resultado marcado con `metadata.llm_failed`
+    nunca cuenta como hecho.
+    """
+    done = {}
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # Última línea a medio escribir si el proceso se interrumpió
+                continue
+            if "id" in result:
+                failed = (result.get("metadata") or {}).get("llm_failed")
+                done[json.dumps(result["id"])] = result.get("status") == 200 and not failed
+    return {key for key, ok in done.items() if ok}
+
+
+def ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class BatchRunner:
+    def __init__(self, url, output, concurrency, timeout):
+        self.url = url.rstrip("/") + "/api/chat/batch"
+        self.output = output
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.statuses = {}
+
+    def run_chunk(self, items):
+        """Envía un lote y escribe cada resultado en cuanto llega; devuelve cuántos se recibieron"""
+        received = 0
+        try:
+            with requests.post(self.url, json={"items": items, "concurrency": self.concurrency},
+                               stream=True, timeout=self.timeout) as response:
+                if response.status_code != 200:
+                    print(f"Lote rechazado ({response.status_code}): {response.text[:200]}", file=sys.stderr)
+                    return 0
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    result = json.loads(line)
+                    if "summary" in result:
+                        continue
+                    self.write(result)
+                    received += 1
+        except requests.RequestException as e:
+            # Los elementos sin resultado se reintentan al relanzar el comando
+            print(f"Error en el lote: {e}", file=sys.stderr)
+        return received
+
+    def write(self, result):
+        with self.lock:
+            self.output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self.output.flush()
+            status = str(result.get("status"))
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat por lotes contra /api/chat/batch con reanudación")
+    parser.add_argument("input", help="Fichero JSONL con un elemento (o un mensaje) por línea")
+    parser.add_argument("--output", help="Resultados NDJSON y checkpoint (por defecto <input>.results.jsonl)")
+    parser.add_argument("--url", default=os.environ.get("RALT_API_URL", "http://127.0.0.1:5000"))
+    parser.add_argument("--agent-type", default="general", help="agent_type de los elementos que no lo indican")
+    parser.add_argument("--priority", default="low", choices=["high", "normal", "low"])
+    parser.add_argument("--chunk-size", type=int, default=200, help="Elementos por petición")
+    parser.add_argument("--concurrency", type=int, default=8, help="Elementos en curso por petición")
+    parser.add_argument("--streams", type=int, default=2,
+                        help="Peticiones simultáneas (solapa el final de un lote con el siguiente)")
+    parser.add_argument("--timeout", type=float, default=600, help="Segundos sin datos antes de abandonar un lote")
+    args = parser.parse_args()
+
+    output_path = args.output or args.input + ".results.jsonl"
+    items = load_items(args.input, {"agent_type": args.agent_type, "priority": args.priority})
+    done = load_checkpoint(output_path)
+    pending = [item for item in items if json.dumps(item["id"]) not in done]
+    print(f"{len(items)} elementos, {len(items) - len(pending)} ya completados, {len(pending)} pendientes",
+          file=sys.stderr)
+    if not pending:
+        return 0
+
+    chunks = [pending[i:i + args.chunk_size] for i in range(0, len(pending), args.chunk_size)]
+    started = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as output:
+        if output.tell() and not ends_with_newline(output_path):
+            # Separar la línea a medio escribir de una ejecución interrumpida
+            output.write("\n")
+        runner = BatchRunner(args.url, output, args.concurrency, args.timeout)
+        with ThreadPoolExecutor(max_workers=max(1, args.streams)) as pool:
+            received = sum(pool.map(runner.run_chunk, chunks))
+    elapsed = time.perf_counter() - started
+
+    print(f"{received}/{len(pending)} resultados en {elapsed:.1f}s ({received / elapsed:.1f} elementos/s), "
+          f"códigos: {runner.statuses}", file=sys.stderr)
+    return 0 if runner.statuses.get("200", 0) == len(pending) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
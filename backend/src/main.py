@@ -2,13 +2,23 @@ import os
 import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-from flask import Flask, send_from_directory, jsonify
+from flask import Flask, Response, send_from_directory, jsonify, request, g
 from flask_cors import CORS
 from src.models.user import db
+from src.models import conversation  # registra los modelos de conversación para create_all
+from src.models import job  # registra el modelo de trabajos en segundo plano para create_all
 from src.routes.user import user_bp
-from src.routes.chat import chat_bp
+from src.routes.chat import (chat_bp, openrouter_service, vision_service, web_service, document_index, semantic_cache,
+                             history_manager, agent_router)
+from src.routes.conversation import conversation_bp
+from src.routes.jobs import jobs_bp, job_queue
+from src.routes.models import models_bp, model_registry
+from src.routes.admin import admin_bp, request_profiler
+from src.services.metrics import metrics, observe_http, CONTENT_TYPE as METRICS_CONTENT_TYPE
 from dotenv import load_dotenv
+from datetime import datetime, timezone
 import os
+import time
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 load_dotenv()
@@ -16,11 +26,16 @@ load_dotenv()
 app.config['SECRET_KEY'] = 'ralt-agent-secret-key-2025'
 
 # Habilitar CORS para todas las rutas
-CORS(app, origins=['http://localhost:5173', 'http://127.0.0.1:5173'])
+CORS_ORIGINS = ['http://localhost:5173', 'http://127.0.0.1:5173']
+CORS(app, origins=CORS_ORIGINS)
 
 # Registrar blueprints
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(chat_bp, url_prefix='/api')
+app.register_blueprint(conversation_bp, url_prefix='/api')
+app.register_blueprint(jobs_bp, url_prefix='/api')
+app.register_blueprint(models_bp, url_prefix='/api')
+app.register_blueprint(admin_bp, url_prefix='/api')
 
 # Configuración de base de datos
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
@@ -29,6 +44,50 @@ db.init_app(app)
 with app.app_context():
     db.create_all()
 
+# Catálogo de modelos: instantánea de disco ya cargada, refresco en segundo plano
+model_registry.start()
+# Índice de documentos del agente de investigación: sincroniza RESEARCH_DOCS_DIR en segundo plano
+document_index.start()
+# Caché semántica: carga el modelo de embeddings y las entradas guardadas en segundo plano
+semantic_cache.start()
+# Trabajos en segundo plano: workers que ejecutan los trabajos guardados en app.db
+job_queue.start(app)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if request_profiler.enabled:
+        g.profile = request_profiler.start(request.method, request.path, request.headers.get('X-Profile'),
+                                           request.headers.get('X-Admin-Token'))
+
+@app.after_request
+def record_request_metrics(response):
+    """Métricas HTTP y cabecera Server-Timing (en streaming, el tiempo hasta enviar las cabeceras)"""
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe_http(request.method, route, response.status_code, elapsed,
+                 request.content_length, None if response.is_streamed else response.content_length)
+    timing = f"app;dur={elapsed * 1000:.2f}"
+    existing = response.headers.get('Server-Timing')
+    response.headers['Server-Timing'] = f"{existing}, {timing}" if existing else timing
+
+    profile = g.pop('profile', None)
+    if profile is not None:
+        # Al cerrar la respuesta, para que en streaming se perfile también la generación
+        response.headers['X-Profile-Id'] = profile.id
+        response.call_on_close(lambda: profile.finish(response.status_code))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    if not metrics.enabled:
+        return jsonify({'error': 'Métricas desactivadas (METRICS_ENABLED=false)'}), 404
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/api/status', methods=['GET'])
 def status():
     """Endpoint de estado del servidor"""
@@ -48,18 +107,39 @@ def status():
         ],
         'endpoints': {
             'chat': '/api/chat',
+            'chat_stream': '/api/chat/stream',
+            'chat_batch': '/api/chat/batch',
+            'jobs': '/api/jobs',
+            'conversations': '/api/conversations',
             'agents': '/api/agents',
-            'status': '/api/status'
-        }
+            'models': '/api/models',
+            'status': '/api/status',
+            'metrics': '/metrics'
+        },
+        'response_cache': openrouter_service.cache.stats(),
+        'image_cache': vision_service.cache_stats(),
+        'page_cache': web_service.fetcher.stats(),
+        'document_index': document_index.stats(),
+        'semantic_cache': semantic_cache.stats(),
+        'history_summaries': history_manager.stats(),
+        'agent_routing': agent_router.stats(),
+        'llm_queues': openrouter_service.scheduler.stats(),
+        'model_catalog': model_registry.stats(),
+        'jobs': job_queue.stats()
     }), 200
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (incluye el estado de los circuit breakers de cada modelo y los
+    modelos configurados que no existen en el catálogo de OpenRouter)"""
+    breakers = openrouter_service.breakers
+    unresolved = model_registry.unresolved_models
     return jsonify({
-        'status': 'healthy',
-        'timestamp': '2025-07-30T22:00:00Z',
-        'version': '2.0.0'
+        'status': 'healthy' if breakers.healthy() and not unresolved else 'degraded',
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'version': '2.0.0',
+        'models': breakers.states(),
+        'unresolved_models': unresolved
     }), 200
 
 @app.route('/', defaults={'path': ''})
@@ -87,7 +167,7 @@ def not_found(error):
     return jsonify({
         'error': 'Endpoint not found',
         'message': 'The requested endpoint does not exist',
-        'available_endpoints': ['/api/status', '/api/health', '/api/chat', '/api/agents']
+        'available_endpoints': ['/api/status', '/api/health', '/api/chat', '/api/chat/stream', '/api/chat/batch', '/api/jobs', '/api/conversations', '/api/agents', '/api/models', '/metrics']
     }), 404
 
 @app.errorhandler(500)
@@ -0,0 +1,67 @@
+import uuid
+from datetime import datetime
+from src.models.user import db
+
+class Conversation(db.Model):
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    agent_type = db.Column(db.String(32), nullable=False, default='general')
+    title = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<Conversation {self.id}>'
+
+    def recent_messages(self, limit):
+        """Últimos `limit` mensajes en orden cronológico (usa el índice conversación + fecha)"""
+        rows = (Message.query
+                .filter_by(conversation_id=self.id)
+                .order_by(Message.created_at.desc(), Message.id.desc())
+                .limit(limit)
+                .all())
+        return [row.to_context() for row in reversed(rows)]
+
+    def add_message(self, message_type, content, agent_type=None):
+        message = Message(conversation_id=self.id, type=message_type, content=content,
+                          agent_type=agent_type or self.agent_type)
+        db.session.add(message)
+        self.updated_at = datetime.utcnow()
+        return message
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'agent_type': self.agent_type,
+            'title': self.title,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+class Message(db.Model):
+    __table_args__ = (
+        db.Index('ix_message_conversation_created', 'conversation_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.String(32), db.ForeignKey('conversation.id', ondelete='CASCADE'), nullable=False)
+    type = db.Column(db.String(16), nullable=False)  # 'user' | 'agent', como en el frontend
+    content = db.Column(db.Text, nullable=False)
+    agent_type = db.Column(db.String(32))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Message {self.id} ({self.type})>'
+
+    def to_context(self):
+        """Formato de mensaje de `context` que usa /api/chat"""
+        return {'type': self.type, 'content': self.content}
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'conversation_id': self.conversation_id,
+            'type': self.type,
+            'content': self.content,
+            'agent_type': self.agent_type,
+            'created_at': self.created_at.isoformat()
+        }
@@ -0,0 +1,119 @@
+import uuid
+from datetime import datetime, timedelta
+from src.models.user import db
+
+# Estados de un trabajo: queued -> running -> succeeded | failed | cancelled
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+class Job(db.Model):
+    """Trabajo en segundo plano (una petición de chat) con su progreso y resultado"""
+    __table_args__ = (
+        db.Index('ix_job_status_priority_created', 'status', 'priority', 'created_at'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    agent_type = db.Column(db.String(32))
+    priority = db.Column(db.Integer, nullable=False, default=1)
+    request = db.Column(db.JSON, nullable=False)
+    progress = db.Column(db.JSON)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(80))
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    traceparent = db.Column(db.String(55))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<Job {self.id} ({self.status})>'
+
+    @classmethod
+    def claim(cls, worker):
+        """Pasa a running el siguiente trabajo en cola (por prioridad y antigüedad) y devuelve su id.
+
+        Es una sola sentencia UPDATE, así que dos procesos nunca reclaman el mismo trabajo.
+        """
+        now = datetime.utcnow()
+        next_job = (db.select(cls.id)
+                    .where(cls.status == 'queued')
+                    .order_by(cls.priority, cls.created_at)
+                    .limit(1)
+                    .scalar_subquery())
+        job_id = db.session.execute(
+            db.update(cls)
+            .where(cls.id == next_job, cls.status == 'queued')
+            .values(status='running', worker=worker, started_at=now, heartbeat_at=now, attempts=cls.attempts + 1)
+            .returning(cls.id)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        db.session.commit()
+        return job_id
+
+    @classmethod
+    def recover_stale(cls, stale_after, max_attempts):
+        """Devuelve a la cola los trabajos running sin latido reciente (su proceso murió).
+
+        Los que ya agotaron max_attempts se marcan como fallidos. Devuelve (reencolados, fallidos).
+        """
+        now = datetime.utcnow()
+        stale = (cls.status == 'running') & (cls.heartbeat_at < now - timedelta(seconds=stale_after))
+        failed = db.session.execute(
+            db.update(cls)
+            .where(stale, cls.attempts >= max_attempts)
+            .values(status='failed', error='Worker lost (max attempts reached)', finished_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        requeued = db.session.execute(
+            db.update(cls)
+            .where(stale)
+            .values(status='queued', worker=None, progress=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return requeued, failed
+
+    @classmethod
+    def purge_finished(cls, older_than):
+        """Borra los trabajos terminados hace más de `older_than` segundos"""
+        deleted = db.session.execute(
+            db.delete(cls)
+            .where(cls.status.in_(FINISHED_STATUSES),
+                   cls.finished_at < datetime.utcnow() - timedelta(seconds=older_than))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return deleted
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def timings(self):
+        """Espera en cola y duración de la ejecución (la última, si hubo reintentos) en ms"""
+        timings = {}
+        if self.started_at:
+            # started_at se toma antes de esperar el bloqueo de SQLite: puede quedar un poco por detrás
+            timings['queue_wait_ms'] = round(max(0.0, (self.started_at - self.created_at).total_seconds()) * 1000, 2)
+        if self.started_at and self.finished_at:
+            timings['run_ms'] = round((self.finished_at - self.started_at).total_seconds() * 1000, 2)
+        return timings
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'agent_type': self.agent_type,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'timings': self.timings()
+        }
@@ -0,0 +1,35 @@
+from flask import Blueprint, jsonify, request, send_file
+from src.services.profiler import RequestProfiler
+
+admin_bp = Blueprint('admin', __name__)
+request_profiler = RequestProfiler.from_env()
+
+@admin_bp.before_request
+def check_admin_token():
+    if not request_profiler.enabled:
+        return jsonify({'error': 'Perfilado desactivado (PROFILING_ENABLED=false)'}), 404
+    if request_profiler.admin_token is None:
+        return jsonify({'error': 'Configura PROFILE_ADMIN_TOKEN para usar los endpoints de administración'}), 403
+    if not request_profiler.authorized(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'X-Admin-Token no válido'}), 403
+
+@admin_bp.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Perfiles guardados, del más reciente al más antiguo (?limit=20)"""
+    profiles = request_profiler.list(request.args.get('limit', 20, type=int))
+    return jsonify({
+        'success': True,
+        'count': len(profiles),
+        'profiles': profiles,
+        'sample_rate': request_profiler.sample_rate,
+        'interval_ms': request_profiler.interval * 1000
+    })
+
+@admin_bp.route('/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Pilas colapsadas del perfil (se pueden abrir en speedscope.app o con flamegraph.pl)"""
+    path = request_profiler.path_for(profile_id)
+    if path is None:
+        return jsonify({'error': 'Perfil no encontrado'}), 404
+    return send_file(path, mimetype='text/plain', as_attachment=request.args.get('download') == '1',
+                     download_name=f'{profile_id}.folded')
@@ -1,6 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+import asyncio
+import contextvars
+import hashlib
 import json
+import math
 import os
+import time
 from datetime import datetime
 from src.services.openrouter_service import OpenRouterService
 from src.services.vision_service import VisionService
@@ -8,83 +13,429 @@ from src.services.web_service import WebService
 from src.services.code_service import CodeService
 from src.services.research_service import ResearchService
 from src.services.creative_service import CreativeService
+from src.services.document_index import Document, DocumentIndex
+from src.services.semantic_cache import SemanticCache
+from src.services.orchestrator import ServiceOrchestrator
+from src.services.history_manager import HistoryManager
+from src.services.agent_router import AgentRouter
+from src.services.llm_scheduler import PRIORITIES, QueueFullError
+from src.services.metrics import observe_chat_timings, observe_batch_item, server_timing, ERRORS
+from src.services.tracing import tracer, extract_context, request_id_for
+from src.models.user import db
+from src.models.conversation import Conversation
 
 chat_bp = Blueprint("chat", __name__)
 openrouter_service = OpenRouterService()
 vision_service = VisionService()
-web_service = WebService()
+document_index = DocumentIndex.from_env()
+# Guardar en el índice local las respuestas del LLM para reutilizarlas en investigaciones posteriores
+INDEX_ANSWERS = os.environ.get("RESEARCH_INDEX_ANSWERS", "true").lower() == "true"
+web_service = WebService(index=document_index)
 code_service = CodeService()
-research_service = ResearchService()
+research_service = ResearchService(document_index)
+# Caché de respuestas por similitud del mensaje, para los agentes donde se repiten preguntas parecidas
+semantic_cache = SemanticCache.from_env()
+SEMANTIC_CACHE_AGENTS = set(filter(None, os.environ.get("SEMANTIC_CACHE_AGENTS", "general,research").split(",")))
 creative_service = CreativeService()
+# Servicio especializado de cada tipo de agente y texto por defecto si no devuelve 'result'
+AGENT_SERVICES = {
+    'vision': vision_service,
+    'web': web_service,
+    'code': code_service,
+    'research': research_service,
+    'creative': creative_service
+}
+SERVICE_DEFAULT_RESULTS = {
+    'vision': 'Análisis de visión completado.',
+    'web': 'Navegación web completada.',
+    'code': 'Asistencia de código completada.',
+    'research': 'Investigación completada.',
+    'creative': 'Contenido creativo generado.'
+}
+history_manager = HistoryManager.from_env()
+# Mensajes que se cargan del almacén de conversaciones en cada turno
+CONVERSATION_WINDOW = int(os.environ.get("CONVERSATION_WINDOW", 50))
+orchestrator = ServiceOrchestrator(AGENT_SERVICES, default_timeout=float(os.environ.get("SERVICE_TIMEOUT", 10)))
 AGENT_TYPES = {
     'general': {
         'name': 'General Chat',
         'description': 'Conversación general y asistencia',
         'capabilities': ['chat', 'qa', 'general_assistance'],
-        'model': 'gpt-4o'
+        'model': 'gpt-4o',
+        'fallback_models': ['gpt-4o-mini'],
+        'history_budget': 4000,
+        'max_concurrency': 16
     },
     'vision': {
         'name': 'Vision Agent',
         'description': 'Análisis de imágenes y contenido visual',
         'capabilities': ['image_analysis', 'ocr', 'visual_qa'],
-        'model': 'gpt-4o-vision'
+        'model': 'gpt-4o-vision',
+        'fallback_models': ['gpt-4o'],
+        'history_budget': 2000,
+        'max_concurrency': 4
     },
     'web': {
         'name': 'Web Navigator',
         'description': 'Navegación y automatización web',
         'capabilities': ['web_scraping', 'automation', 'research'],
-        'model': 'gpt-4o'
+        'model': 'gpt-4o',
+        'fallback_models': ['gpt-4o-mini'],
+        'history_budget': 4000,
+        'max_concurrency': 16
     },
     'code': {
         'name': 'Code Assistant',
         'description': 'Programación y desarrollo',
         'capabilities': ['code_generation', 'debugging', 'review'],
-        'model': 'deepseek-coder'
+        'model': 'deepseek-coder',
+        'fallback_models': ['gpt-4o'],
+        'history_budget': 8000,
+        'max_concurrency': 8
     },
     'research': {
         'name': 'Research Agent',
         'description': 'Investigación profunda y análisis',
         'capabilities': ['deep_research', 'data_analysis', 'synthesis'],
-        'model': 'claude-3.5-sonnet'
+        'model': 'claude-3.5-sonnet',
+        'fallback_models': ['gpt-4o'],
+        'history_budget': 8000,
+        'max_concurrency': 4,
+        'rate_limit': 2
     },
     'creative': {
         'name': 'Creative Agent',
         'description': 'Contenido creativo y multimedia',
         'capabilities': ['content_creation', 'design', 'storytelling'],
-        'model': 'gpt-4o'
+        'model': 'gpt-4o',
+        'fallback_models': ['gpt-4o-mini'],
+        'history_budget': 4000,
+        'max_concurrency': 16
     }
 }
 
+# Límites por modelo (max_concurrency simultáneas, rate_limit peticiones/s); si varios
+# agentes comparten modelo se aplica el más estricto
+for _agent_config in AGENT_TYPES.values():
+    openrouter_service.scheduler.configure(_agent_config['model'], _agent_config.get('max_concurrency'),
+                                           _agent_config.get('rate_limit'))
+
+# Lotes de /api/chat/batch: elementos en curso a la vez, tamaño máximo y reintentos por cola llena
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 8))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", 64))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 1000))
+BATCH_MAX_RETRIES = int(os.environ.get("BATCH_MAX_RETRIES", 5))
+
+# agent_type especial: el agente lo elige AgentRouter a partir del mensaje
+AUTO_AGENT = 'auto'
+agent_router = AgentRouter.from_env(list(AGENT_TYPES))
+
+def validate_chat_request(data):
+    """Valida el cuerpo de una petición de chat; devuelve un mensaje de error o None"""
+    if not data:
+        return 'No data provided'
+    if not data.get('message', ''):
+        return 'Message is required'
+    agent_type = data.get('agent_type', 'general')
+    if agent_type not in AGENT_TYPES and agent_type != AUTO_AGENT:
+        return f'Invalid agent type: {agent_type}'
+    for key in ('services', 'llm_inputs'):
+        names = data.get(key)
+        if names is None:
+            continue
+        if not isinstance(names, list):
+            return f'{key} must be a list'
+        unknown = [name for name in names if name not in AGENT_SERVICES]
+        if unknown:
+            return f'Invalid service: {unknown[0]}'
+    service_timeout = data.get('service_timeout')
+    if service_timeout is not None and (isinstance(service_timeout, bool) or
+                                        not isinstance(service_timeout, (int, float)) or service_timeout <= 0):
+        return 'service_timeout must be a positive number'
+    if data.get('priority', 'normal') not in PRIORITIES:
+        return f"Invalid priority: {data.get('priority')}"
+    context = data.get('context')
+    if context is not None and not isinstance(context, (list, dict)):
+        return 'context must be a list of messages'
+    if isinstance(context, list) and not all(isinstance(entry, dict) for entry in context):
+        return 'context entries must be objects'
+    return None
+
+def chat_options(data):
+    """Extrae del cuerpo de la petición las opciones de procesamiento del chat"""
+    return {
+        # "cache": false fuerza una llamada nueva al modelo
+        'use_cache': data.get('cache', True) is not False,
+        # Orquestación multiagente: servicios adicionales a ejecutar en paralelo y cuáles
+        # de ellos deben terminar antes de lanzar la llamada al LLM (por defecto, todos)
+        'services': data.get('services'),
+        'llm_inputs': data.get('llm_inputs'),
+        'service_timeout': data.get('service_timeout'),
+        # Prioridad en la cola del modelo cuando está saturado: high | normal | low
+        'priority': PRIORITIES[data.get('priority', 'normal')]
+    }
+
+def load_conversation(data):
+    """Carga la conversación indicada por conversation_id y su ventana de mensajes recientes.
+
+    Devuelve (conversación, contexto, error). Sin conversation_id se usa el `context`
+    enviado por el cliente, como antes.
+    """
+    conversation_id = data.get('conversation_id')
+    if not conversation_id:
+        return None, normalize_context(data.get('context')), None
+    conversation = db.session.get(Conversation, str(conversation_id))
+    if conversation is None:
+        return None, None, f'Conversation not found: {conversation_id}'
+    return conversation, conversation.recent_messages(CONVERSATION_WINDOW), None
+
+def normalize_context(context):
+    """Contexto como lista de mensajes. El formato antiguo ({"images", "files"}) pasa a ser una
+    entrada sin `type`: aporta sus imágenes pero no cuenta como mensaje del historial."""
+    if isinstance(context, dict):
+        return [context]
+    return context or []
+
+def save_conversation_turn(conversation, agent_type, message, content):
+    """Guarda el mensaje del usuario y la respuesta del agente"""
+    conversation.add_message('user', message, agent_type)
+    conversation.add_message('agent', content, agent_type)
+    db.session.commit()
+
+async def resolve_agent_type(data, context):
+    """Tipo de agente de la petición; con "auto" lo elige el router. Devuelve (tipo, decisión)"""
+    agent_type = data.get('agent_type', 'general')
+    if agent_type != AUTO_AGENT:
+        return agent_type, None
+    routing = await agent_router.route(data.get('message', ''), context)
+    return routing['agent_type'], routing
+
+def build_chat_response(agent_type, response, routing=None):
+    """Construye el cuerpo JSON de respuesta del chat"""
+    if routing is not None:
+        response['metadata']['routing'] = routing
+    return {
+        'success': True,
+        'response': response['content'],
+        'agent_type': agent_type,
+        'model_used': AGENT_TYPES[agent_type]['model'],
+        'capabilities_used': response['capabilities_used'],
+        'metadata': response['metadata'],
+        'timestamp': datetime.now().isoformat()
+    }
+
+def queue_full_response(error):
+    """Respuesta 429 con Retry-After cuando la cola del modelo está llena; (cuerpo, código, cabeceras)"""
+    retry_after = math.ceil(error.retry_after)
+    return ({'success': False, 'error': str(error), 'retry_after': retry_after},
+            429, {'Retry-After': str(retry_after)})
+
+def format_sse(event, data):
+    """Serializa un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def iter_async(agen):
+    """Recorre un generador asíncrono desde código síncrono (respuestas en streaming de Flask).
+
+    Todos los pasos se ejecutan en el mismo contexto de contextvars, para que el span
+    activo del generador se conserve de un fragmento al siguiente.
+    """
+    loop = asyncio.new_event_loop()
+    context = contextvars.copy_context()
+
+    async def step(awaitable):
+        return await awaitable
+
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(loop.create_task(step(agen.__anext__()), context=context))
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(loop.create_task(step(agen.aclose()), context=context))
+        loop.close()
+
+async def handle_chat(data, headers=None):
+    """Procesa una petición de /api/chat; devuelve (cuerpo, código HTTP, cabeceras).
+
+    `headers` (cabeceras de la petición) aporta `traceparent` y `X-Request-Id`; el id de
+    la petición se devuelve en el cuerpo (`request_id`) y en la cabecera X-Request-Id.
+    """
+    with tracer.span('POST /api/chat', parent=extract_context(headers), kind='server') as span:
+        body, status, response_headers = await process_chat_request(data)
+        request_id = request_id_for(headers, span)
+        span.set_attributes({'http.status_code': status, 'request.id': request_id})
+        if 'agent_type' in body:
+            span.set_attribute('agent_type', body['agent_type'])
+    body['request_id'] = request_id
+    return body, status, {**response_headers, 'X-Request-Id': request_id}
+
+async def process_chat_request(data):
+    """Valida y atiende una petición de /api/chat; devuelve (cuerpo, código HTTP, cabeceras)"""
+    error = validate_chat_request(data)
+    if error:
+        return {'error': error}, 400, {}
+
+    conversation, context, error = load_conversation(data)
+    if error:
+        return {'error': error}, 404, {}
+
+    message = data.get('message', '')
+    agent_type, routing = await resolve_agent_type(data, context)
+
+    # Procesar el mensaje según el tipo de agente
+    try:
+        response = await process_agent_message(message, agent_type, context, **chat_options(data))
+    except QueueFullError as e:
+        return queue_full_response(e)
+    body = build_chat_response(agent_type, response, routing)
+    if conversation is not None:
+        save_conversation_turn(conversation, agent_type, message, response['content'])
+        body['conversation_id'] = conversation.id
+    extra = {'routing': routing['latency_ms']} if routing else {}
+    return body, 200, {'Server-Timing': server_timing(response['metadata']['timings_ms'], **extra)}
+
+async def prepare_chat_stream(data, headers=None):
+    """Valida una petición de /api/chat/stream.
+
+    Devuelve (error, eventos SSE, cabeceras): error es None o (cuerpo, código HTTP, cabeceras).
+    """
+    # El span raíz se activa y termina en stream_chat_events, que dura lo que dura el stream
+    span = tracer.start_span('POST /api/chat/stream', parent=extract_context(headers), kind='server')
+    request_id = request_id_for(headers, span)
+    span.set_attribute('request.id', request_id)
+    error, events = await open_chat_stream(data, span, request_id)
+    if error:
+        span.set_attribute('http.status_code', error[1])
+        span.end()
+        body, status, response_headers = error
+        return (body, status, {**response_headers, 'X-Request-Id': request_id}), None, None
+    return None, events, {'X-Request-Id': request_id}
+
+async def open_chat_stream(data, span, request_id):
+    """Valida la petición y crea el generador de eventos SSE; devuelve (error, eventos)"""
+    error = validate_chat_request(data)
+    if error:
+        return ({'error': error}, 400, {}), None
+
+    conversation, context, error = load_conversation(data)
+    if error:
+        return ({'error': error}, 404, {}), None
+
+    agent_type, routing = await resolve_agent_type(data, context)
+    if agent_type not in AGENT_SERVICES:
+        # Sin servicio propio siempre se llama al LLM: rechazar antes de abrir el stream
+        try:
+            openrouter_service.scheduler.check_admission(AGENT_TYPES[agent_type]['model'])
+        except QueueFullError as e:
+            return queue_full_response(e), None
+
+    span.set_attribute('agent_type', agent_type)
+    events = stream_chat_events(data.get('message', ''), agent_type, context, conversation=conversation,
+                                routing=routing, span=span, request_id=request_id, **chat_options(data))
+    return None, events
+
+def validate_batch_request(data):
+    """Valida el cuerpo de una petición de /api/chat/batch; devuelve un mensaje de error o None.
+
+    Cada elemento se valida al procesarlo: uno inválido produce su línea con código 400
+    pero no anula el resto del lote.
+    """
+    if not data:
+        return 'No data provided'
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return 'items must be a non-empty list'
+    if len(items) > BATCH_MAX_ITEMS:
+        return f'Too many items: {len(items)} (max {BATCH_MAX_ITEMS})'
+    concurrency = data.get('concurrency', BATCH_CONCURRENCY)
+    if not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1:
+        return 'concurrency must be a positive integer'
+    if not isinstance(data.get('defaults', {}), dict):
+        return 'defaults must be an object'
+    return None
+
+def prepare_chat_batch(data, headers=None):
+    """Valida una petición de /api/chat/batch.
+
+    Devuelve (error, líneas NDJSON, cabeceras): error es None o (cuerpo, código HTTP, cabeceras).
+    """
+    span = tracer.start_span('POST /api/chat/batch', parent=extract_context(headers), kind='server')
+    request_id = request_id_for(headers, span)
+    span.set_attribute('request.id', request_id)
+    error = validate_batch_request(data)
+    if error:
+        span.set_attribute('http.status_code', 400)
+        span.end()
+        return ({'error': error}, 400, {'X-Request-Id': request_id}), None, None
+
+    # Por defecto los lotes ceden el paso al tráfico interactivo en la cola del modelo
+    defaults = {'priority': 'low', **data.get('defaults', {})}
+    concurrency = min(data.get('concurrency', BATCH_CONCURRENCY), BATCH_MAX_CONCURRENCY)
+    span.set_attributes({'batch.items': len(data['items']), 'batch.concurrency': concurrency})
+    lines = run_chat_batch(data['items'], defaults, concurrency, span=span, request_id=request_id)
+    return None, lines, {'X-Request-Id': request_id}
+
+async def process_batch_item(index, item, defaults):
+    """Atiende un elemento del lote como una petición de /api/chat; devuelve su línea de resultado.
+
+    Los rechazos por cola llena (429) se reintentan tras su Retry-After, de modo que el
+    ritmo del lote lo marcan los límites de cada modelo y no el cliente.
+    """
+    data = {**defaults, **item} if isinstance(item, dict) else None
+    item_id = data.get('id', index) if data else index
+    retries = 0
+    with tracer.span('chat.batch.item', {'batch.index': index}) as span:
+        while True:
+            try:
+                body, status, _ = await process_chat_request(data)
+            except Exception as e:
+                ERRORS.inc('chat_batch', type(e).__name__)
+                body, status = {'success': False, 'error': str(e)}, 500
+            if status != 429 or retries >= BATCH_MAX_RETRIES:
+                break
+            retries += 1
+            await asyncio.sleep(body['retry_after'])
+        if status == 200 and body['metadata'].get('llm_failed'):
+            # La respuesta es el texto de error del LLM: el elemento queda pendiente para reintentarlo
+            body = {**body, 'success': False, 'error': body['response']}
+            status = 502
+        span.set_attributes({'http.status_code': status, 'batch.retries': retries})
+    observe_batch_item(status, retries)
+    return {'id': item_id, 'index': index, 'status': status, 'retries': retries, **body}
+
+async def run_chat_batch(items, defaults, concurrency, span=None, request_id=None):
+    """Genera una línea NDJSON por elemento según van terminando y una línea final `summary`"""
+    with tracer.use_span(span or tracer.start_span('chat.batch')):
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(concurrency)
+        statuses = {}
+
+        async def run_item(index, item):
+            async with semaphore:
+                return await process_batch_item(index, item, defaults)
+
+        tasks = [asyncio.create_task(run_item(index, item)) for index, item in enumerate(items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                statuses[str(line['status'])] = statuses.get(str(line['status']), 0) + 1
+                yield json.dumps(line, ensure_ascii=False) + '\n'
+            summary = {'items': len(items), 'succeeded': statuses.get('200', 0), 'statuses': statuses,
+                       'concurrency': concurrency, 'elapsed_ms': elapsed_ms(started), 'request_id': request_id}
+            yield json.dumps({'summary': summary}, ensure_ascii=False) + '\n'
+        finally:
+            # Cliente desconectado: no seguir gastando llamadas al modelo
+            for task in tasks:
+                task.cancel()
+
 @chat_bp.route("/chat", methods=["POST"])
 async def chat():
     """Endpoint principal para el chat con agentes"""
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-        
-        message = data.get('message', '')
-        agent_type = data.get('agent_type', 'general')
-        context = data.get('context', [])
-        
-        if not message:
-            return jsonify({'error': 'Message is required'}), 400
-        
-        if agent_type not in AGENT_TYPES:
-            return jsonify({'error': f'Invalid agent type: {agent_type}'}), 400
-        
-        # Procesar el mensaje según el tipo de agente
-        response = await process_agent_message(message, agent_type, context)        
-        return jsonify({
-            'success': True,
-            'response': response['content'],
-            'agent_type': agent_type,
-            'model_used': AGENT_TYPES[agent_type]['model'],
-            'capabilities_used': response['capabilities_used'],
-            'metadata': response['metadata'],
-            'timestamp': datetime.now().isoformat()
-        })
+        body, status, headers = await handle_chat(request.get_json(), request.headers)
+        return jsonify(body), status, headers
         
     except Exception as e:
         return jsonify({
@@ -92,12 +443,73 @@ async def chat():
             'error': str(e)
         }), 500
 
+@chat_bp.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """Chat en streaming (Server-Sent Events).
+
+    Emite eventos `delta` con cada fragmento de texto según lo genera el modelo y un
+    evento final `done` con el mismo cuerpo que /api/chat (metadata, service_results).
+    """
+    # Vista síncrona: stream_with_context debe crearse en el contexto de la petición
+    error, events, headers = asyncio.run(prepare_chat_stream(request.get_json(silent=True), request.headers))
+    if error:
+        body, status, headers = error
+        return jsonify(body), status, headers
+
+    return Response(
+        stream_with_context(iter_async(events)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', **headers}
+    )
+
+@chat_bp.route("/chat/batch", methods=["POST"])
+def chat_batch():
+    """Chat por lotes (NDJSON).
+
+    Recibe {"items": [{"id", "message", "agent_type", ...}], "concurrency", "defaults"}; cada
+    elemento admite las mismas opciones que /api/chat. Responde con una línea JSON por
+    elemento en el orden en que terminan (con su `id`, `index` y `status`) y una línea
+    final `summary`.
+    """
+    error, lines, headers = prepare_chat_batch(request.get_json(silent=True), request.headers)
+    if error:
+        body, status, headers = error
+        return jsonify(body), status, headers
+
+    return Response(
+        stream_with_context(iter_async(lines)),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', **headers}
+    )
+
+async def stream_chat_events(message, agent_type, context, conversation=None, routing=None,
+                             span=None, request_id=None, **options):
+    """Genera los eventos SSE de una respuesta de chat en streaming"""
+    with tracer.use_span(span or tracer.start_span('chat.stream')):
+        try:
+            async for event, payload in stream_agent_message(message, agent_type, context, **options):
+                if event == 'done':
+                    if conversation is not None:
+                        save_conversation_turn(conversation, agent_type, message, payload['content'])
+                    payload = build_chat_response(agent_type, payload, routing)
+                    if conversation is not None:
+                        payload['conversation_id'] = conversation.id
+                    if request_id is not None:
+                        payload['request_id'] = request_id
+                yield format_sse(event, payload)
+        except QueueFullError as e:
+            yield format_sse('error', {**queue_full_response(e)[0], 'request_id': request_id})
+        except Exception as e:
+            ERRORS.inc('chat_stream', type(e).__name__)
+            yield format_sse('error', {'success': False, 'error': str(e), 'request_id': request_id})
+
 @chat_bp.route('/agents', methods=['GET'])
 def get_agents():
     """Obtener lista de agentes disponibles"""
     return jsonify({
         'success': True,
-        'agents': AGENT_TYPES
+        'agents': AGENT_TYPES,
+        'auto_agent': AUTO_AGENT
     })
 
 @chat_bp.route('/agent/<agent_type>/capabilities', methods=['GET'])
@@ -111,34 +523,85 @@ def get_agent_capabilities(agent_type):
         'agent': AGENT_TYPES[agent_type]
     })
 
-async def process_agent_message(message, agent_type, context):
-    """Procesa un mensaje según el tipo de agente, integrando servicios multimodales."""
-    agent_config = AGENT_TYPES[agent_type]
-    service_results = {}
-    agent_response_content = ""
-
-    # 1. Intentar usar servicios específicos si el tipo de agente lo requiere
-    if agent_type == 'vision' and vision_service.is_available():
-        # Aquí se debería añadir lógica para detectar si el mensaje contiene una imagen
-        # Por ahora, simulamos que el servicio de visión procesa la entrada de texto
-        service_results['vision'] = await vision_service.process(message, context)
-        agent_response_content = service_results['vision'].get('result', 'Análisis de visión completado.')
-    elif agent_type == 'web' and web_service.is_available():
-        service_results['web'] = await web_service.process(message, context)
-        agent_response_content = service_results['web'].get('result', 'Navegación web completada.')
-    elif agent_type == 'code' and code_service.is_available():
-        service_results['code'] = await code_service.process(message, context)
-        agent_response_content = service_results['code'].get('result', 'Asistencia de código completada.')
-    elif agent_type == 'research' and research_service.is_available():
-        service_results['research'] = await research_service.process(message, context)
-        agent_response_content = service_results['research'].get('result', 'Investigación completada.')
-    elif agent_type == 'creative' and creative_service.is_available():
-        service_results['creative'] = await creative_service.process(message, context)
-        agent_response_content = service_results['creative'].get('result', 'Contenido creativo generado.')
-    
-    # 2. Si no se usó un servicio específico o se necesita una respuesta más elaborada, usar OpenRouter
-    if not agent_response_content or agent_type == 'general' or (agent_type != 'general' and 'error' in agent_response_content.lower()):
-        agent_context_prompt = f"""
+@chat_bp.route('/vision/thumbnails/<content_hash>', methods=['GET'])
+def get_vision_thumbnail(content_hash):
+    """Miniatura JPEG de una imagen ya analizada (content_hash del análisis)"""
+    thumbnail = vision_service.get_cached_thumbnail(content_hash)
+    if thumbnail is None:
+        return jsonify({'error': f'Thumbnail not found: {content_hash}'}), 404
+    # El hash identifica el contenido: la miniatura no cambia nunca
+    return Response(thumbnail, mimetype='image/jpeg', headers={'Cache-Control': 'public, max-age=31536000, immutable'})
+
+def start_agent_services(message, agent_type, context, services=None, llm_inputs=None, service_timeout=None):
+    """Lanza en paralelo el servicio del agente y los servicios adicionales solicitados.
+
+    Devuelve la ejecución en curso y los servicios que deben terminar antes de llamar al
+    LLM: siempre el del propio agente (decide si hace falta el LLM) más los de llm_inputs.
+    """
+    primary = [agent_type] if agent_type in AGENT_SERVICES else []
+    run = orchestrator.start(primary + list(services or []), message, context, service_timeout)
+    required = primary + list(run.tasks if llm_inputs is None else llm_inputs)
+    return run, required
+
+def primary_service_content(agent_type, service_results):
+    """Texto de respuesta del servicio especializado del agente, si se ejecutó.
+
+    Si el servicio falló (timeout o excepción) devuelve "" para que responda el LLM en
+    lugar del texto por defecto de éxito.
+    """
+    if agent_type not in service_results or 'error' in service_results[agent_type]:
+        return ""
+    return service_results[agent_type].get('result', SERVICE_DEFAULT_RESULTS[agent_type])
+
+def needs_llm(agent_type, agent_response_content, service_results=None):
+    """Indica si hace falta una respuesta de OpenRouter además del servicio especializado
+    (también si el propio servicio lo pide, p. ej. investigación a partir de pasajes recuperados)"""
+    if (service_results or {}).get(agent_type, {}).get('needs_llm'):
+        return True
+    return not agent_response_content or agent_type == 'general' or (agent_type != 'general' and 'error' in agent_response_content.lower())
+
+def remember_answer(message, agent_type, content, outcome, semantic=None):
+    """Encola una respuesta del LLM para el índice local de documentos y la caché semántica (en segundo plano).
+
+    Solo respuestas completas (`outcome` de OpenRouter): nunca textos de error ni streams cortados.
+    A la caché semántica solo van las del modelo del agente, que es el de su ámbito, no las
+    de un modelo alternativo.
+    """
+    if not message.strip() or not content or not outcome.get('complete'):
+        return
+    if semantic is not None and outcome.get('model') == AGENT_TYPES[agent_type]['model']:
+        semantic_cache.submit(message, semantic['scope'], content, semantic['vector'])
+    if INDEX_ANSWERS:
+        doc_id = 'answer:' + hashlib.sha256(f'{agent_type}:{message.strip()}'.encode('utf-8')).hexdigest()[:32]
+        document_index.submit(Document(doc_id, content, message.strip()[:200], 'answer'))
+
+async def semantic_lookup(message, agent_type, context, use_cache, service_results, timings):
+    """Busca en la caché semántica una pregunta parecida ya respondida por el mismo agente y modelo.
+
+    Solo para preguntas sin historial. Devuelve None si no aplica o {'answer', 'scope', 'vector'}:
+    `answer` es la respuesta reutilizable tal cual (o None); si la pregunta solo se parece, la
+    pareja anterior se añade a service_results como contexto para el LLM.
+    """
+    if not use_cache or context or agent_type not in SEMANTIC_CACHE_AGENTS or not semantic_cache.ready:
+        return None
+    started = time.perf_counter()
+    scope = f"{agent_type}:{AGENT_TYPES[agent_type]['model']}"
+    vector = await asyncio.to_thread(semantic_cache.embed, message)
+    match = await asyncio.to_thread(semantic_cache.lookup, message, scope, vector)
+    timings['semantic_cache'] = elapsed_ms(started)
+    answer = None
+    if match is not None:
+        service_results['semantic_cache'] = {'similarity': match.similarity, 'matched_message': match.message,
+                                             'answered': match.answered}
+        if match.answered:
+            answer = match.answer
+        else:
+            service_results['semantic_cache']['previous_answer'] = match.answer
+    return {'answer': answer, 'scope': scope, 'vector': vector}
+
+def build_agent_context_prompt(agent_config):
+    """Construye el prompt de sistema del agente"""
+    return f"""
 Eres un {agent_config["name"]} especializado en {agent_config["description"]}.
 
 Tus capacidades principales incluyen:
@@ -147,32 +610,173 @@ Tus capacidades principales incluyen:
 Responde a la siguiente consulta del usuario, utilizando tus capacidades especializadas. Si la consulta requiere una capacidad multimodal que no puedes simular, indica al usuario qué tipo de entrada necesitas (ej. "Por favor, sube una imagen para que pueda analizarla").
 """
 
-        chat_history_formatted = []
-        for msg in context:
-            if msg["type"] == "user":
-                chat_history_formatted.append({"role": "user", "content": msg["content"]})
-            elif msg["type"] == "agent":
-                chat_history_formatted.append({"role": "assistant", "content": msg["content"]})
+def format_chat_history(context):
+    """Convierte el historial del frontend (type/content) al formato de la API (role/content)"""
+    chat_history_formatted = []
+    for msg in context:
+        if msg.get("type") == "user":
+            chat_history_formatted.append({"role": "user", "content": msg.get("content", "")})
+        elif msg.get("type") == "agent":
+            chat_history_formatted.append({"role": "assistant", "content": msg.get("content", "")})
+    return chat_history_formatted
 
-        try:
-            response_content = await openrouter_service.generate_response(
-                user_input=message,
-                model=agent_config["model"],
-                agent_context=agent_context_prompt,
-                service_results=service_results, # Pasar resultados de servicios al LLM
-                chat_history=chat_history_formatted
-            )
-            agent_response_content = response_content
-        except Exception as e:
-            agent_response_content = "Ocurrió un error al procesar la solicitud."
-            service_results["error"] = str(e)
+def prepare_chat_history(agent_config, context):
+    """Historial en formato de la API, compactado al presupuesto de tokens del agente"""
+    with tracer.span('history.compact'):
+        return history_manager.compact(format_chat_history(context), agent_config.get('history_budget'))
+
+def build_agent_result(agent_config, content, service_results, timings=None, history_stats=None, llm_attempts=None,
+                       llm_failed=False):
+    """Construye el resultado de process_agent_message (`llm_failed`: el contenido es un texto de error del LLM)"""
     return {
-        'content': agent_response_content,
+        'content': content,
         'capabilities_used': agent_config["capabilities"],
         'metadata': {
             'response_source': 'openrouter' if not service_results else 'multimodal_orchestration',
             'model_name': agent_config["model"],
-            'service_results': service_results
+            'service_results': service_results,
+            'timings_ms': timings or {},
+            'history': history_stats or {},
+            'llm_attempts': llm_attempts or [],
+            'llm_failed': llm_failed
         }
     }
 
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
+
+async def process_agent_message(message, agent_type, context, use_cache=True,
+                                services=None, llm_inputs=None, service_timeout=None, priority=PRIORITIES['normal']):
+    """Procesa un mensaje según el tipo de agente, integrando servicios multimodales."""
+    agent_config = AGENT_TYPES[agent_type]
+    started = time.perf_counter()
+    timings = {}
+    llm_attempts = []
+    llm_outcome = {}
+    llm_failed = False
+
+    with tracer.span('agent.process', {'agent_type': agent_type}) as span:
+        # 1. Lanzar en paralelo los servicios específicos y esperar a los que alimentan al LLM
+        run, required = start_agent_services(message, agent_type, context, services, llm_inputs, service_timeout)
+        try:
+            service_results = await run.wait(required)
+            agent_response_content = primary_service_content(agent_type, service_results)
+
+            # 2. Si no se usó un servicio específico o se necesita una respuesta más elaborada, usar OpenRouter
+            #    (los servicios que no son entrada del LLM siguen ejecutándose mientras tanto)
+            history_stats = None
+            llm_needed = needs_llm(agent_type, agent_response_content, service_results)
+            semantic = await semantic_lookup(message, agent_type, context, use_cache, service_results,
+                                             timings) if llm_needed else None
+            if semantic and semantic['answer'] is not None:
+                agent_response_content = semantic['answer']
+            elif llm_needed:
+                llm_started = time.perf_counter()
+                chat_history, history_stats = prepare_chat_history(agent_config, context)
+                try:
+                    response_content = await openrouter_service.generate_response(
+                        user_input=message,
+                        model=agent_config["model"],
+                        agent_context=build_agent_context_prompt(agent_config),
+                        service_results=service_results, # Pasar resultados de servicios al LLM
+                        chat_history=chat_history,
+                        use_cache=use_cache,
+                        priority=priority,
+                        fallback_models=agent_config.get('fallback_models'),
+                        attempts=llm_attempts,
+                        outcome=llm_outcome
+                    )
+                    agent_response_content = response_content
+                    llm_failed = not llm_outcome.get('ok')
+                    remember_answer(message, agent_type, agent_response_content, llm_outcome, semantic)
+                except QueueFullError:
+                    raise
+                except Exception as e:
+                    agent_response_content = "Ocurrió un error al procesar la solicitud."
+                    service_results["error"] = str(e)
+                    llm_failed = True
+                timings['llm'] = elapsed_ms(llm_started)
+
+            service_results = {**await run.finish(), **service_results}
+        finally:
+            run.cancel()
+
+        timings['services'] = run.timings
+        timings['total'] = elapsed_ms(started)
+        observe_chat_timings(agent_type, timings, service_results)
+        span.set_attributes({'llm.attempts': len(llm_attempts), 'duration_ms': timings['total']})
+        return build_agent_result(agent_config, agent_response_content, service_results, timings, history_stats,
+                                  llm_attempts, llm_failed)
+
+async def stream_agent_message(message, agent_type, context, use_cache=True,
+                               services=None, llm_inputs=None, service_timeout=None, priority=PRIORITIES['normal']):
+    """Variante en streaming de process_agent_message.
+
+    Genera tuplas (evento, datos): un `delta` por fragmento de texto y un `done` final
+    con el resultado completo en el formato de process_agent_message.
+    """
+    agent_config = AGENT_TYPES[agent_type]
+    started = time.perf_counter()
+    timings = {}
+    llm_attempts = []
+    llm_outcome = {}
+    llm_failed = False
+
+    with tracer.span('agent.stream', {'agent_type': agent_type}) as span:
+        run, required = start_agent_services(message, agent_type, context, services, llm_inputs, service_timeout)
+        try:
+            service_results = await run.wait(required)
+            agent_response_content = primary_service_content(agent_type, service_results)
+
+            history_stats = None
+            llm_needed = needs_llm(agent_type, agent_response_content, service_results)
+            semantic = await semantic_lookup(message, agent_type, context, use_cache, service_results,
+                                             timings) if llm_needed else None
+            if semantic and semantic['answer'] is not None:
+                agent_response_content = semantic['answer']
+                yield 'delta', {'content': agent_response_content}
+            elif llm_needed:
+                chunks = []
+                llm_started = time.perf_counter()
+                chat_history, history_stats = prepare_chat_history(agent_config, context)
+                try:
+                    async for delta in openrouter_service.stream_response(
+                        user_input=message,
+                        model=agent_config["model"],
+                        agent_context=build_agent_context_prompt(agent_config),
+                        service_results=service_results,
+                        chat_history=chat_history,
+                        use_cache=use_cache,
+                        priority=priority,
+                        fallback_models=agent_config.get('fallback_models'),
+                        attempts=llm_attempts,
+                        outcome=llm_outcome
+                    ):
+                        if not chunks:
+                            timings['llm_first_token'] = elapsed_ms(llm_started)
+                        chunks.append(delta)
+                        yield 'delta', {'content': delta}
+                    agent_response_content = "".join(chunks)
+                    llm_failed = not llm_outcome.get('ok')
+                    remember_answer(message, agent_type, agent_response_content, llm_outcome, semantic)
+                except QueueFullError:
+                    raise
+                except Exception as e:
+                    agent_response_content = "Ocurrió un error al procesar la solicitud."
+                    service_results["error"] = str(e)
+                    llm_failed = True
+                    yield 'delta', {'content': agent_response_content}
+                timings['llm'] = elapsed_ms(llm_started)
+            else:
+                yield 'delta', {'content': agent_response_content}
+
+            service_results = {**await run.finish(), **service_results}
+        finally:
+            run.cancel()
+
+        timings['services'] = run.timings
+        timings['total'] = elapsed_ms(started)
+        observe_chat_timings(agent_type, timings, service_results)
+        span.set_attributes({'llm.attempts': len(llm_attempts), 'duration_ms': timings['total']})
+        yield 'done', build_agent_result(agent_config, agent_response_content, service_results, timings, history_stats,
+                                         llm_attempts, llm_failed)
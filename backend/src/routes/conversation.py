@@ -0,0 +1,35 @@
+from flask import Blueprint, jsonify, request
+from src.models.user import db
+from src.models.conversation import Conversation, Message
+
+conversation_bp = Blueprint('conversation', __name__)
+
+@conversation_bp.route('/conversations', methods=['POST'])
+def create_conversation():
+    data = request.get_json(silent=True) or {}
+    conversation = Conversation(agent_type=data.get('agent_type', 'general'), title=data.get('title'))
+    db.session.add(conversation)
+    db.session.commit()
+    return jsonify(conversation.to_dict()), 201
+
+@conversation_bp.route('/conversations/<conversation_id>', methods=['GET'])
+def get_conversation(conversation_id):
+    conversation = db.get_or_404(Conversation, conversation_id)
+    limit = request.args.get('limit', 50, type=int)
+    messages = (Message.query
+                .filter_by(conversation_id=conversation.id)
+                .order_by(Message.created_at.desc(), Message.id.desc())
+                .limit(limit)
+                .all())
+    return jsonify({
+        **conversation.to_dict(),
+        'messages': [message.to_dict() for message in reversed(messages)]
+    })
+
+@conversation_bp.route('/conversations/<conversation_id>', methods=['DELETE'])
+def delete_conversation(conversation_id):
+    conversation = db.get_or_404(Conversation, conversation_id)
+    Message.query.filter_by(conversation_id=conversation.id).delete()
+    db.session.delete(conversation)
+    db.session.commit()
+    return '', 204
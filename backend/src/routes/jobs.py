@@ -0,0 +1,108 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+import asyncio
+from src.models.user import db
+from src.models.job import Job
+from src.models.conversation import Conversation
+from src.routes.chat import (validate_chat_request, load_conversation, resolve_agent_type, chat_options,
+                             build_chat_response, save_conversation_turn, stream_agent_message, format_sse,
+                             iter_async)
+from src.services.job_queue import JobQueue
+from src.services.llm_scheduler import PRIORITIES, QueueFullError
+from src.services.tracing import tracer, extract_context, format_traceparent
+
+jobs_bp = Blueprint('jobs', __name__)
+
+async def run_chat_job(data, progress):
+    """Ejecuta un trabajo de chat como /api/chat, informando del progreso (etapa y texto generado).
+
+    Si la cola del modelo está llena se espera su Retry-After y se vuelve a intentar: un
+    trabajo en segundo plano no tiene un cliente esperando al que devolver un 429. Si falla
+    la llamada al LLM devuelve 502, y el trabajo acaba como `failed`.
+    """
+    conversation, context, error = load_conversation(data)
+    if error:
+        return {'error': error}, 404
+
+    message = data.get('message', '')
+    agent_type, routing = await resolve_agent_type(data, context)
+    while True:
+        progress.update('services')
+        try:
+            async for event, payload in stream_agent_message(message, agent_type, context, **chat_options(data)):
+                if event == 'delta':
+                    progress.append(payload['content'])
+                else:
+                    response = payload
+            break
+        except QueueFullError as e:
+            progress.update('waiting_for_model')
+            await asyncio.sleep(e.retry_after)
+
+    body = build_chat_response(agent_type, response, routing)
+    if response['metadata'].get('llm_failed'):
+        # El contenido es el texto de error del LLM: el trabajo falla y no se guarda en la conversación
+        return {**body, 'success': False, 'error': response['content']}, 502
+    if conversation is not None:
+        save_conversation_turn(conversation, agent_type, message, response['content'])
+        body['conversation_id'] = conversation.id
+    return body, 200
+
+job_queue = JobQueue.from_env(run_chat_job)
+
+@jobs_bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """Encola una petición de chat (mismo cuerpo que /api/chat) y devuelve el id del trabajo al momento"""
+    data = request.get_json(silent=True)
+    error = validate_chat_request(data)
+    if error:
+        return jsonify({'error': error}), 400
+    conversation_id = data.get('conversation_id')
+    if conversation_id and db.session.get(Conversation, str(conversation_id)) is None:
+        return jsonify({'error': f'Conversation not found: {conversation_id}'}), 404
+
+    with tracer.span('POST /api/jobs', parent=extract_context(request.headers), kind='server') as span:
+        job = job_queue.submit(data, data.get('agent_type', 'general'), PRIORITIES[data.get('priority', 'normal')],
+                               format_traceparent(span))
+        span.set_attribute('job.id', job.id)
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/api/jobs/{job.id}',
+        'events_url': f'/api/jobs/{job.id}/events'
+    }), 202, {'Location': f'/api/jobs/{job.id}'}
+
+@jobs_bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Trabajos más recientes (filtrables por ?status=)"""
+    query = Job.query
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    jobs = query.order_by(Job.created_at.desc()).limit(limit).all()
+    return jsonify({'success': True, 'jobs': [job.to_dict() for job in jobs]})
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = db.get_or_404(Job, job_id)
+    return jsonify(job.to_dict())
+
+@jobs_bp.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = db.get_or_404(Job, job_id)
+    return jsonify(job_queue.cancel(job).to_dict())
+
+async def job_sse_events(job_id):
+    """Eventos SSE de un trabajo (ver JobQueue.events)"""
+    async for event, payload in job_queue.events(job_id):
+        yield format_sse(event, payload)
+
+@jobs_bp.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Progreso de un trabajo en Server-Sent Events: `status`, `progress` y un `done` final"""
+    db.get_or_404(Job, job_id)
+    return Response(
+        stream_with_context(iter_async(job_sse_events(job_id))),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
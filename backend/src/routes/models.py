@@ -0,0 +1,42 @@
+from flask import Blueprint, jsonify, request
+from src.routes.chat import openrouter_service, AGENT_TYPES
+from src.services.model_registry import ModelRegistry
+
+models_bp = Blueprint('models', __name__)
+model_registry = ModelRegistry.from_env(openrouter_service)
+model_registry.expect([name for config in AGENT_TYPES.values()
+                       for name in [config['model']] + config.get('fallback_models', [])])
+
+@models_bp.route('/models', methods=['GET'])
+def list_models():
+    """Catálogo de modelos servido desde memoria.
+
+    Filtros opcionales: provider, min_context, max_price (USD por token de entrada), q,
+    sort (id | context_length | price) y limit.
+    """
+    try:
+        models = model_registry.search(
+            provider=request.args.get('provider'),
+            min_context=request.args.get('min_context', type=int),
+            max_prompt_price=request.args.get('max_price', type=float),
+            query=request.args.get('q'),
+            sort=request.args.get('sort', 'id'),
+            limit=request.args.get('limit', type=int)
+        )
+        return jsonify({
+            'success': True,
+            'count': len(models),
+            'models': models,
+            'catalog': model_registry.stats(),
+            'agent_models': model_registry.validate(model_registry.expected_models)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@models_bp.route('/models/<path:model_id>', methods=['GET'])
+def get_model(model_id):
+    model_id = model_registry.resolve(model_id) or model_id
+    model = model_registry.get(model_id)
+    if model is None:
+        return jsonify({'success': False, 'error': f'Model not found: {model_id}'}), 404
+    return jsonify({'success': True, 'model': model})
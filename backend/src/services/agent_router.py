@@ -0,0 +1,201 @@
+"""
+Agent Router - Enrutado automático de mensajes al tipo de agente (agent_type "auto")
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from src.services.intent_classifier import IntentClassifier, intent_classifier
+from src.services.vision_service import context_images
+
+_URL = re.compile(r"https?://|www\.", re.IGNORECASE)
+_CODE_MARKERS = re.compile(r"```|\bdef |\bimport |=>|;\s*$|\{\s*$", re.MULTILINE)
+# Referencias a imágenes en el mensaje: ficheros, data URLs y miniaturas de /api/vision
+_IMAGE_REF = re.compile(r"\.(?:png|jpe?g|gif|webp|bmp|tiff?|heic)\b|data:image/|/vision/thumbnails/", re.IGNORECASE)
+
+# Peso de cada tabla de intenciones en la puntuación de cada agente
+FEATURE_WEIGHTS = {
+    "agent.route": 1.0,
+    "code.language": 1.5,
+    "code.action": 0.25,
+    "research.type": 1.0,
+    "creative.type": 1.25,
+    "web.action": 1.0
+}
+# Agente que puntúa cada tabla (las tablas de agent.route usan su propia etiqueta)
+TABLE_AGENTS = {
+    "code.language": "code",
+    "code.action": "code",
+    "research.type": "research",
+    "creative.type": "creative",
+    "web.action": "web"
+}
+# Ejemplos por agente para el modelo de embeddings opcional
+AGENT_EXAMPLES = {
+    "general": ["Hola, ¿qué tal?", "¿Qué me recomiendas para cenar?", "Cuéntame un dato curioso"],
+    "vision": ["Describe esta imagen", "¿Qué texto aparece en la foto?", "Analiza la captura de pantalla"],
+    "web": ["Busca en internet las últimas noticias", "Abre esta página web y resúmela"],
+    "code": ["Corrige este error en mi función", "Escribe una consulta SQL", "¿Por qué falla este script?"],
+    "research": ["Haz un informe comparando estas tecnologías", "Analiza el mercado de coches eléctricos"],
+    "creative": ["Escribe un poema sobre el mar", "Inventa un cuento para niños", "Propón un eslogan"]
+}
+
+
+class AgentRouter:
+    """Elige el tipo de agente de un mensaje con un clasificador local barato.
+
+    Puntúa cada agente con las coincidencias de palabras clave del IntentClassifier
+    compartido (más señales como URLs o bloques de código) y, si ningún agente supera
+    el umbral, consulta un modelo de embeddings pequeño en CPU cuando está configurado
+    (ROUTER_EMBEDDING_MODEL, requiere sentence-transformers). Las decisiones recientes
+    se guardan en una caché LRU indexada por el mensaje normalizado.
+    """
+
+    def __init__(self,
+                 agent_types: List[str],
+                 classifier: IntentClassifier = intent_classifier,
+                 default_agent: str = "general",
+                 threshold: float = 1.0,
+                 cache_entries: int = 2048,
+                 embedding_model: Optional[str] = None,
+                 embedding_threshold: float = 0.35):
+        self.agent_types = agent_types
+        self.classifier = classifier
+        self.default_agent = default_agent
+        self.threshold = threshold
+        self.cache_entries = cache_entries
+        self.embedding_model = embedding_model
+        self.embedding_threshold = embedding_threshold
+        self._decisions: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._embedder = None
+        self._centroids = None
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, agent_types: List[str]) -> "AgentRouter":
+        router = cls(
+            agent_types,
+            threshold=float(os.environ.get("ROUTER_THRESHOLD", 1.0)),
+            cache_entries=int(os.environ.get("ROUTER_CACHE_ENTRIES", 2048)),
+            embedding_model=os.environ.get("ROUTER_EMBEDDING_MODEL") or None
+        )
+        if router.embedding_model:
+            # La carga del modelo tarda segundos: se hace en segundo plano, nunca en una petición
+            threading.Thread(target=router.load_embedder, name="router-embedder", daemon=True).start()
+        return router
+
+    async def route(self, message: str, context=None) -> Dict[str, Any]:
+        """Devuelve la decisión de enrutado: agente elegido, puntuaciones, origen y latencia.
+
+        Las palabras clave deciden solas cuando superan el umbral; si no, el modelo de
+        embeddings (si hay) se ejecuta en un hilo para no bloquear el event loop.
+        """
+        started = time.perf_counter()
+        key, decision = self._cached(message, context)
+        cache_hit = decision is not None
+        if not cache_hit:
+            decision = self._keyword_decision(message, key[1])
+            if decision["source"] != "keywords" and self._centroids is not None:
+                decision = await asyncio.to_thread(self._embedding_decision, message, decision["scores"])
+            self._store(key, decision)
+        return {**decision, "cache_hit": cache_hit, "latency_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+    @staticmethod
+    def has_images(message: str, context=None) -> bool:
+        """Si el mensaje hace referencia a imágenes o el contexto trae imágenes que el agente de
+        visión pueda analizar (las mismas que recoge context_images)"""
+        return bool(_IMAGE_REF.search(message or "")) or bool(context_images(context))
+
+    def _cached(self, message: str, context) -> tuple:
+        """Clave de la caché del mensaje y decisión guardada (o None)"""
+        key = (" ".join(message.lower().split()), self.has_images(message, context))
+        with self._lock:
+            decision = self._decisions.get(key)
+            if decision is not None:
+                self._decisions.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        return key, decision
+
+    def _store(self, key: tuple, decision: Dict[str, Any]) -> None:
+        with self._lock:
+            self._decisions[key] = decision
+            while len(self._decisions) > self.cache_entries:
+                self._decisions.popitem(last=False)
+
+    def _keyword_decision(self, message: str, has_images: bool) -> Dict[str, Any]:
+        """Decisión por palabras clave; si ningún agente supera el umbral, la del agente por defecto"""
+        scores = self._keyword_scores(message, has_images)
+        best = max(scores, key=scores.get) if scores else None
+        if best is not None and scores[best] >= self.threshold:
+            return {"agent_type": best, "source": "keywords", "scores": scores}
+        return {"agent_type": self.default_agent, "source": "default", "scores": scores}
+
+    def _embedding_decision(self, message: str, scores: Dict[str, float]) -> Dict[str, Any]:
+        semantic = self._embedding_route(message)
+        if semantic is not None:
+            return {"agent_type": semantic[0], "source": "embeddings", "scores": scores,
+                    "similarity": semantic[1]}
+        return {"agent_type": self.default_agent, "source": "default", "scores": scores}
+
+    def _keyword_scores(self, message: str, has_images: bool) -> Dict[str, float]:
+        """Suma de pesos de las coincidencias por agente (solo agentes con puntuación)"""
+        scores: Dict[str, float] = {}
+        for match in self.classifier.classify(message).matches:
+            weight = FEATURE_WEIGHTS.get(match.table)
+            if weight is None:
+                continue
+            agent = TABLE_AGENTS.get(match.table, match.label)
+            scores[agent] = scores.get(agent, 0.0) + weight
+        if has_images:
+            scores["vision"] = scores.get("vision", 0.0) + 3.0
+        if _URL.search(message):
+            scores["web"] = scores.get("web", 0.0) + 1.0
+        if _CODE_MARKERS.search(message):
+            scores["code"] = scores.get("code", 0.0) + 2.0
+        return {agent: round(score, 2) for agent, score in scores.items() if agent in self.agent_types}
+
+    def _embedding_route(self, message: str) -> Optional[tuple]:
+        """Agente más parecido según el modelo de embeddings, o None si no hay modelo o no se parece"""
+        if self._centroids is None:
+            return None
+        vector = self._embedder.encode([message], normalize_embeddings=True)[0]
+        similarities = {agent: float(centroid @ vector) for agent, centroid in self._centroids.items()}
+        agent = max(similarities, key=similarities.get)
+        if similarities[agent] < self.embedding_threshold:
+            return None
+        return agent, round(similarities[agent], 4)
+
+    def load_embedder(self) -> bool:
+        """Carga el modelo de embeddings y los centroides de cada agente"""
+        if self._centroids is None and self.embedding_model:
+            try:
+                from sentence_transformers import SentenceTransformer
+                embedder = SentenceTransformer(self.embedding_model, device="cpu")
+                centroids = {}
+                for agent, examples in AGENT_EXAMPLES.items():
+                    if agent in self.agent_types:
+                        vectors = embedder.encode(examples, normalize_embeddings=True)
+                        centroid = vectors.mean(axis=0)
+                        centroids[agent] = centroid / ((centroid @ centroid) ** 0.5)
+                self._embedder, self._centroids = embedder, centroids
+                # Las decisiones tomadas sin modelo ya no son válidas
+                with self._lock:
+                    self._decisions.clear()
+            except Exception as e:
+                print(f"Modelo de embeddings del router no disponible ({self.embedding_model}): {e}")
+                self.embedding_model = None
+        return self._centroids is not None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"cached_decisions": len(self._decisions), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "embedding_model": self.embedding_model}
@@ -0,0 +1,166 @@
+"""
+Circuit Breaker - Corte de llamadas a modelos degradados, con sondeo en semiabierto
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """El circuito del modelo está abierto: no se le envían peticiones"""
+    outcome = "circuit_open"
+
+    def __init__(self, model: str, retry_in: float):
+        super().__init__(f"Circuito abierto para el modelo {model}; reintento en {retry_in:.0f}s")
+        self.model = model
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Estado de salud de un modelo según sus resultados recientes.
+
+    Guarda los resultados de una ventana deslizante de `window` segundos. Si hay al menos
+    `min_calls` y la tasa de errores o de llamadas lentas supera su umbral, el circuito se
+    abre durante `cooldown` segundos; después pasa a semiabierto y deja pasar
+    `half_open_probes` peticiones de prueba: si salen bien se cierra, si no vuelve a abrirse.
+    """
+
+    def __init__(self, model: str, window: float = 30.0, min_calls: int = 10,
+                 error_threshold: float = 0.5, slow_call_seconds: float = 20.0, slow_threshold: float = 0.8,
+                 cooldown: float = 30.0, half_open_probes: int = 2):
+        self.model = model
+        self.window = window
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_threshold = slow_threshold
+        self.cooldown = cooldown
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._calls: deque = deque(maxlen=10000)  # (instante, ok, lenta)
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _prune(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+    def allow(self) -> None:
+        """Lanza CircuitOpenError si no se debe llamar ahora al modelo"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self.opened_at < self.cooldown:
+                    raise CircuitOpenError(self.model, self.cooldown - (now - self.opened_at))
+                self.state, self._probes_in_flight, self._probe_successes = HALF_OPEN, 0, 0
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    raise CircuitOpenError(self.model, 1)
+                self._probes_in_flight += 1
+
+    def record(self, ok: bool, seconds: float) -> None:
+        """Registra el resultado de una llamada permitida por allow()"""
+        with self._lock:
+            now = time.monotonic()
+            slow = seconds >= self.slow_call_seconds
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if not ok or slow:
+                    self._open(now)
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_probes:
+                        self.state, self.opened_at = CLOSED, None
+                        self._calls.clear()
+                return
+
+            self._calls.append((now, ok, slow))
+            self._prune(now)
+            if self.state == CLOSED and len(self._calls) >= self.min_calls:
+                error_rate, slow_rate = self._rates()
+                if error_rate >= self.error_threshold or slow_rate >= self.slow_threshold:
+                    self._open(now)
+
+    def release(self) -> None:
+        """La llamada permitida no llegó a hacerse (p. ej. se canceló): liberar el sondeo"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _open(self, now: float) -> None:
+        self.state, self.opened_at = OPEN, now
+        self.times_opened += 1
+        print(f"Circuito abierto para el modelo {self.model}")
+
+    def _rates(self):
+        total = len(self._calls) or 1
+        errors = sum(1 for _, ok, _ in self._calls if not ok)
+        slow = sum(1 for _, _, is_slow in self._calls if is_slow)
+        return errors / total, slow / total
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._prune(time.monotonic())
+            error_rate, slow_rate = self._rates()
+            stats = {"state": self.state, "calls": len(self._calls), "error_rate": round(error_rate, 4),
+                     "slow_rate": round(slow_rate, 4), "times_opened": self.times_opened}
+            if self.state == OPEN:
+                stats["retry_in"] = round(max(0.0, self.cooldown - (time.monotonic() - self.opened_at)), 1)
+            return stats
+
+
+class CircuitBreakerRegistry:
+    """Un CircuitBreaker por modelo, creado al primer uso con la misma configuración"""
+
+    def __init__(self, enabled: bool = True, **settings):
+        self.enabled = enabled
+        self.settings = settings
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreakerRegistry":
+        return cls(
+            enabled=os.environ.get("CIRCUIT_BREAKER_ENABLED", "true").lower() != "false",
+            window=float(os.environ.get("CIRCUIT_BREAKER_WINDOW", 30)),
+            min_calls=int(os.environ.get("CIRCUIT_BREAKER_MIN_CALLS", 10)),
+            error_threshold=float(os.environ.get("CIRCUIT_BREAKER_ERROR_RATE", 0.5)),
+            slow_call_seconds=float(os.environ.get("CIRCUIT_BREAKER_SLOW_CALL", 20)),
+            slow_threshold=float(os.environ.get("CIRCUIT_BREAKER_SLOW_RATE", 0.8)),
+            cooldown=float(os.environ.get("CIRCUIT_BREAKER_COOLDOWN", 30))
+        )
+
+    def get(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(model, **self.settings)
+            return self._breakers[model]
+
+    def allow(self, model: str) -> None:
+        if self.enabled:
+            self.get(model).allow()
+
+    def record(self, model: str, ok: bool, seconds: float) -> None:
+        if self.enabled:
+            self.get(model).record(ok, seconds)
+
+    def release(self, model: str) -> None:
+        if self.enabled:
+            self.get(model).release()
+
+    def states(self) -> Dict[str, Dict[str, Any]]:
+        return {model: breaker.stats() for model, breaker in list(self._breakers.items())}
+
+    def healthy(self) -> bool:
+        """False si algún modelo tiene el circuito abierto"""
+        return all(breaker.state != OPEN for breaker in list(self._breakers.values()))
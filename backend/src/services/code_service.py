@@ -1,5 +1,5 @@
-import json
 from typing import Dict, Any, Optional
+from src.services.intent_classifier import intent_classifier
 
 class CodeService:
     def __init__(self):
@@ -11,31 +11,13 @@ class CodeService:
 
     async def process(self, user_input: str, context: Optional[Dict] = None) -> Dict[str, Any]:
         """Procesa una solicitud relacionada con código"""
+        intents = intent_classifier.classify(user_input)
+
         # Detectar lenguaje de programación
-        languages = {
-            "python": ["python", "py", "django", "flask"],
-            "javascript": ["javascript", "js", "node", "react", "vue"],
-            "java": ["java", "spring"],
-            "cpp": ["c++", "cpp"],
-            "go": ["go", "golang"],
-            "rust": ["rust"]
-        }
-        
-        detected_language = "general"
-        for lang, keywords in languages.items():
-            if any(keyword in user_input.lower() for keyword in keywords):
-                detected_language = lang
-                break
-        
+        detected_language = intents.label("code.language", "general")
+
         # Detectar tipo de solicitud
-        if "generar" in user_input.lower() or "crear" in user_input.lower():
-            action = "generate"
-        elif "revisar" in user_input.lower() or "debug" in user_input.lower():
-            action = "review"
-        elif "explicar" in user_input.lower():
-            action = "explain"
-        else:
-            action = "general"
+        action = intents.label("code.action", "general")
         
         return {
             "type": "code",
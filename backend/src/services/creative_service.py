@@ -1,5 +1,5 @@
-import json
 from typing import Dict, Any, Optional
+from src.services.intent_classifier import intent_classifier
 
 class CreativeService:
     def __init__(self):
@@ -12,19 +12,7 @@ class CreativeService:
     async def process(self, user_input: str, context: Optional[Dict] = None) -> Dict[str, Any]:
         """Procesa una solicitud creativa"""
         # Detectar tipo de contenido creativo
-        content_types = {
-            "story": ["historia", "cuento", "narrativa"],
-            "poem": ["poema", "poesía", "verso"],
-            "script": ["guion", "escena", "diálogo"],
-            "design_concept": ["diseño", "concepto visual", "idea gráfica"],
-            "song_lyrics": ["letra de canción", "canción"]
-        }
-        
-        detected_type = "general_creative"
-        for c_type, keywords in content_types.items():
-            if any(keyword in user_input.lower() for keyword in keywords):
-                detected_type = c_type
-                break
+        detected_type = intent_classifier.classify(user_input).label("creative.type", "general_creative")
         
         # Extraer tema creativo
         topic = user_input.replace("crear", "").replace("generar", "").strip()
@@ -0,0 +1,341 @@
+"""
+Document Index - Índice de texto completo local (SQLite FTS5 con ranking BM25) para el agente de investigación
+"""
+import hashlib
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional
+
+from src.services.page_fetcher import HTMLTextExtractor
+
+# Extensiones de los ficheros que se indexan desde RESEARCH_DOCS_DIR
+TEXT_EXTENSIONS = {".txt", ".md", ".markdown", ".rst", ".csv", ".json", ".py", ".js", ".ts", ".yaml", ".yml"}
+HTML_EXTENSIONS = {".html", ".htm"}
+
+# Palabras vacías que no aportan a la búsqueda (español e inglés)
+STOPWORDS = set("""
+a al algo ante como con contra cual cuando de del desde donde el ella ellos en entre era es esa ese eso esta este
+esto fue ha han hay la las le les lo los mas me mi muy no nos o para pero por que qué quien se sin sobre son su sus
+también te tiene un una uno unos unas y ya yo cómo cuál dónde investigar analizar buscar información sobre
+an and are as at be by for from how in is it of on or that the this to was what when where which who why with
+""".split())
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+_PARAGRAPHS = re.compile(r"\n\s*\n|\n(?=[#*\-] )")
+_SENTENCES = re.compile(r"(?<=[.!?])\s+")
+
+
+class Document(NamedTuple):
+    """Documento a indexar; `version` (hash del contenido si no se indica) evita reindexar lo que no cambió"""
+    doc_id: str
+    text: str
+    title: str = ""
+    source: str = ""
+    url: str = ""
+    version: Optional[str] = None
+
+
+def split_passages(text: str, size: int) -> List[str]:
+    """Divide un texto en pasajes de hasta `size` caracteres respetando párrafos y, si hace falta, frases"""
+    passages, current = [], ""
+    for paragraph in _PARAGRAPHS.split(text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        pieces = [paragraph] if len(paragraph) <= size else _SENTENCES.split(paragraph)
+        for piece in pieces:
+            while len(piece) > size:
+                passages.append(piece[:size])
+                piece = piece[size:]
+            if current and len(current) + len(piece) + 1 > size:
+                passages.append(current)
+                current = ""
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        passages.append(current)
+    return passages
+
+
+def build_match_query(text: str, prefix: bool = False, max_terms: int = 12) -> str:
+    """Consulta FTS5 a partir de texto libre: términos entre comillas unidos con OR.
+
+    Con `prefix`, los términos de 5 o más letras se buscan como prefijo ("investigación"
+    -> "investigaci"*), lo que cubre plurales y variantes sin un stemmer. BM25 ya puntúa
+    más alto los pasajes que contienen más términos y los más raros.
+    """
+    terms = []
+    for word in _WORDS.findall(text.lower()):
+        if len(word) < 2 or word in STOPWORDS or word.isdigit() and len(word) < 3:
+            continue
+        term = f'"{word[:-2]}"*' if prefix and len(word) >= 5 else f'"{word}"'
+        if term not in terms:
+            terms.append(term)
+    return " OR ".join(terms[:max_terms])
+
+
+class DocumentIndex:
+    """Índice invertido de pasajes en SQLite FTS5 con actualizaciones incrementales.
+
+    - Los documentos se trocean en pasajes; cada pasaje es una fila de `passages`, y
+      la tabla FTS5 `passages_fts` (contenido externo, mantenida con triggers) guarda
+      el índice invertido. Reindexar un documento borra e inserta solo sus pasajes.
+    - `search` devuelve los k mejores pasajes por BM25 (el título pesa el doble). Busca
+      primero los términos exactos y solo si no llega a k pasajes prueba por prefijo
+      (las consultas por prefijo recorren muchas más listas de ocurrencias).
+    - Los documentos que llegan durante las peticiones (páginas descargadas, respuestas
+      anteriores) se encolan con submit() y los escribe por lotes un hilo en segundo
+      plano, que también sincroniza periódicamente el directorio `docs_dir`.
+    """
+
+    def __init__(self, path: str, docs_dir: Optional[str] = None, passage_chars: int = 1200,
+                 max_document_chars: int = 500_000, refresh_interval: float = 300.0):
+        self.path = path
+        self.docs_dir = docs_dir
+        self.passage_chars = passage_chars
+        self.max_document_chars = max_document_chars
+        self.refresh_interval = refresh_interval
+        self.synced_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.searches = 0
+        self.search_ms = 0.0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls) -> "DocumentIndex":
+        default_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "database", "documents.db")
+        return cls(os.environ.get("RESEARCH_INDEX_PATH", default_path),
+                   docs_dir=os.environ.get("RESEARCH_DOCS_DIR") or None,
+                   passage_chars=int(os.environ.get("RESEARCH_PASSAGE_CHARS", 1200)),
+                   refresh_interval=float(os.environ.get("RESEARCH_DOCS_REFRESH", 300)))
+
+    def _connect(self) -> sqlite3.Connection:
+        """Abre la base de datos bajo demanda (debe llamarse con el lock tomado)"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_id TEXT PRIMARY KEY, source TEXT NOT NULL, title TEXT NOT NULL, url TEXT NOT NULL,
+                    version TEXT NOT NULL, passages INTEGER NOT NULL, chars INTEGER NOT NULL, updated_at REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS passages (
+                    id INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, position INTEGER NOT NULL,
+                    title TEXT NOT NULL, body TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS ix_passages_doc_id ON passages (doc_id);
+                CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts USING fts5(
+                    title, body, content='passages', content_rowid='id', tokenize='unicode61 remove_diacritics 2');
+                CREATE TRIGGER IF NOT EXISTS passages_ai AFTER INSERT ON passages BEGIN
+                    INSERT INTO passages_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+                END;
+                CREATE TRIGGER IF NOT EXISTS passages_ad AFTER DELETE ON passages BEGIN
+                    INSERT INTO passages_fts (passages_fts, rowid, title, body)
+                    VALUES ('delete', old.id, old.title, old.body);
+                END;
+            """)
+            # Ranking por defecto (columna `rank`): BM25 con el título pesando el doble que el cuerpo
+            conn.execute("INSERT INTO passages_fts (passages_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0)')")
+            self._conn = conn
+        return self._conn
+
+    def add_documents(self, documents: Iterable[Document]) -> int:
+        """Indexa (o reindexa) documentos en una sola transacción; devuelve cuántos cambiaron"""
+        changed = 0
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            try:
+                for document in documents:
+                    changed += self._add(conn, document)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return changed
+
+    def add_document(self, doc_id: str, text: str, title: str = "", source: str = "", url: str = "",
+                     version: Optional[str] = None) -> bool:
+        return self.add_documents([Document(doc_id, text, title, source, url, version)]) == 1
+
+    def _add(self, conn: sqlite3.Connection, document: Document) -> int:
+        text = document.text[:self.max_document_chars]
+        version = document.version or hashlib.sha256(text.encode("utf-8")).hexdigest()
+        row = conn.execute("SELECT version FROM documents WHERE doc_id = ?", (document.doc_id,)).fetchone()
+        if row is not None and row[0] == version:
+            return 0
+        conn.execute("DELETE FROM passages WHERE doc_id = ?", (document.doc_id,))
+        passages = split_passages(text, self.passage_chars)
+        conn.executemany(
+            "INSERT INTO passages (doc_id, position, title, body) VALUES (?, ?, ?, ?)",
+            [(document.doc_id, position, document.title, body) for position, body in enumerate(passages)]
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (doc_id, source, title, url, version, passages, chars, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (document.doc_id, document.source, document.title, document.url, version, len(passages), len(text),
+             time.time())
+        )
+        return 1
+
+    def remove_document(self, doc_id: str) -> bool:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            conn.execute("DELETE FROM passages WHERE doc_id = ?", (doc_id,))
+            removed = conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount
+            conn.execute("COMMIT")
+        return removed > 0
+
+    def search(self, query: str, k: int = 5, per_document: int = 2) -> List[Dict[str, Any]]:
+        """Los k pasajes más relevantes para un texto libre (como mucho `per_document` por documento)"""
+        started = time.perf_counter()
+        results: List[Dict[str, Any]] = []
+        for prefix in (False, True):
+            match = build_match_query(query, prefix=prefix)
+            if not match or len(results) >= k:
+                break
+            results = self._merge(results, self._query(match, k * per_document * 2), k, per_document)
+        self.searches += 1
+        self.search_ms += (time.perf_counter() - started) * 1000
+        return results
+
+    def _query(self, match: str, limit: int) -> List[tuple]:
+        # El top-k se calcula solo sobre el índice FTS; las tablas se consultan para esas filas
+        sql = ("SELECT p.id, p.doc_id, p.position, p.title, p.body, d.source, d.url, top.rank FROM"
+               " (SELECT rowid, rank FROM passages_fts WHERE passages_fts MATCH ? ORDER BY rank LIMIT ?) AS top"
+               " JOIN passages p ON p.id = top.rowid JOIN documents d ON d.doc_id = p.doc_id ORDER BY top.rank")
+        with self._lock:
+            return self._connect().execute(sql, (match, limit)).fetchall()
+
+    @staticmethod
+    def _merge(results: List[Dict[str, Any]], rows: List[tuple], k: int, per_document: int) -> List[Dict[str, Any]]:
+        seen = {result["id"] for result in results}
+        per_doc: Dict[str, int] = {}
+        for result in results:
+            per_doc[result["doc_id"]] = per_doc.get(result["doc_id"], 0) + 1
+        for passage_id, doc_id, position, title, body, source, url, rank in rows:
+            if len(results) >= k:
+                break
+            if passage_id in seen or per_doc.get(doc_id, 0) >= per_document:
+                continue
+            per_doc[doc_id] = per_doc.get(doc_id, 0) + 1
+            results.append({"id": passage_id, "doc_id": doc_id, "position": position, "title": title, "text": body,
+                            "source": source, "url": url, "score": round(-rank, 6)})
+        return results
+
+    def index_directory(self, root: str) -> Dict[str, int]:
+        """Sincroniza los ficheros de texto de un directorio: indexa nuevos y modificados, borra los eliminados"""
+        root = os.path.abspath(root)
+        prefix = f"file:{root}{os.sep}"
+        with self._lock:
+            known = dict(self._connect().execute(
+                "SELECT doc_id, version FROM documents WHERE doc_id >= ? AND doc_id < ?", (prefix, prefix + "\uffff")
+            ).fetchall())
+
+        seen, batch, changed = set(), [], 0
+        for directory, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(directory, name)
+                extension = os.path.splitext(name)[1].lower()
+                if extension not in TEXT_EXTENSIONS | HTML_EXTENSIONS:
+                    continue
+                doc_id = f"file:{path}"
+                seen.add(doc_id)
+                try:
+                    stat = os.stat(path)
+                    # Versión por fecha y tamaño: los ficheros sin cambios no se vuelven a leer
+                    version = f"{stat.st_mtime_ns}:{stat.st_size}"
+                    if known.get(doc_id) == version:
+                        continue
+                    with open(path, encoding="utf-8", errors="replace") as f:
+                        text = f.read(self.max_document_chars * 2)
+                except OSError as e:
+                    print(f"No se pudo indexar {path}: {e}")
+                    continue
+                title = os.path.relpath(path, root)
+                if extension in HTML_EXTENSIONS:
+                    extractor = HTMLTextExtractor(max_chars=self.max_document_chars)
+                    extractor.feed(text)
+                    extractor.close()
+                    text, title = extractor.text, " ".join(extractor.title.split()) or title
+                batch.append(Document(doc_id, text, title, "file", path, version))
+                if len(batch) >= 100:
+                    changed += self.add_documents(batch)
+                    batch = []
+        changed += self.add_documents(batch)
+
+        removed = [doc_id for doc_id in known if doc_id not in seen]
+        for doc_id in removed:
+            self.remove_document(doc_id)
+        return {"indexed": changed, "removed": len(removed), "files": len(seen)}
+
+    def submit(self, document: Document) -> None:
+        """Encola un documento para indexarlo en segundo plano (sin bloquear la petición)"""
+        self.start()
+        self._queue.put(document)
+
+    def start(self) -> None:
+        """Arranca (una sola vez) el hilo que escribe lo encolado y sincroniza `docs_dir`"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="document-index", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        next_sync = time.monotonic()
+        while not self._stop.is_set():
+            if self.docs_dir and time.monotonic() >= next_sync:
+                try:
+                    self.index_directory(self.docs_dir)
+                    self.synced_at, self.last_error = time.time(), None
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"Error indexando {self.docs_dir}: {e}")
+                next_sync = time.monotonic() + self.refresh_interval
+            timeout = max(0.1, next_sync - time.monotonic()) if self.docs_dir and self.refresh_interval > 0 else 1.0
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+                while len(batch) < 100:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                try:
+                    self.add_documents(batch)
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"Error indexando {len(batch)} documentos: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT source, COUNT(*), COALESCE(SUM(passages), 0), COALESCE(SUM(chars), 0)"
+                " FROM documents GROUP BY source"
+            ).fetchall()
+        return {
+            "path": self.path,
+            "docs_dir": self.docs_dir,
+            "documents": sum(row[1] for row in rows),
+            "passages": sum(row[2] for row in rows),
+            "by_source": {source or "other": {"documents": count, "passages": passages, "chars": chars}
+                          for source, count, passages, chars in rows},
+            "searches": self.searches,
+            "avg_search_ms": round(self.search_ms / self.searches, 3) if self.searches else None,
+            "synced_at": self.synced_at,
+            "last_error": self.last_error,
+            "pending": self._queue.qsize()
+        }
@@ -0,0 +1,133 @@
+"""
+History Manager - Compactación del historial de chat según un presupuesto de tokens
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida de tokens (~4 caracteres por token, más la sobrecarga por mensaje)"""
+    return len(text) // 4 + 4
+
+
+class HistoryManager:
+    """Mantiene los turnos recientes literales y resume o descarta los antiguos.
+
+    El resumen es extractivo (primera frase de cada mensaje) y se guarda indexado por el
+    hash encadenado del prefijo de la conversación, de modo que en el turno siguiente solo
+    se resumen los mensajes que acaban de salir de la ventana reciente.
+    """
+
+    def __init__(self,
+                 default_budget: int = 4000,
+                 keep_recent: int = 8,
+                 summary_ratio: float = 0.25,
+                 line_chars: int = 160,
+                 max_summary_lines: int = 200,
+                 cache_entries: int = 1000):
+        self.default_budget = default_budget
+        self.keep_recent = keep_recent
+        self.summary_ratio = summary_ratio
+        self.line_chars = line_chars
+        self.max_summary_lines = max_summary_lines
+        self.cache_entries = cache_entries
+        self._summaries: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.summary_hits = 0
+        self.summary_misses = 0
+
+    @classmethod
+    def from_env(cls) -> "HistoryManager":
+        return cls(
+            default_budget=int(os.environ.get("HISTORY_TOKEN_BUDGET", 4000)),
+            keep_recent=int(os.environ.get("HISTORY_KEEP_RECENT", 8)),
+            summary_ratio=float(os.environ.get("HISTORY_SUMMARY_RATIO", 0.25))
+        )
+
+    def compact(self, messages: List[Dict], budget: Optional[int] = None) -> Tuple[List[Dict], Dict[str, Any]]:
+        """Reduce el historial (formato role/content) para que quepa en `budget` tokens.
+
+        Devuelve los mensajes a enviar (un mensaje de sistema con el resumen, si lo hay,
+        seguido de los turnos recientes) y estadísticas de la compactación.
+        """
+        budget = budget or self.default_budget
+        tokens = [estimate_tokens(msg["content"]) for msg in messages]
+        stats = {"messages_in": len(messages), "tokens_in": sum(tokens), "budget": budget}
+
+        if stats["tokens_in"] <= budget:
+            stats.update(messages_kept=len(messages), messages_summarized=0, tokens_out=stats["tokens_in"])
+            return messages, stats
+
+        # 1. Turnos recientes literales, de más nuevo a más antiguo, mientras quepan
+        recent_budget = budget - int(budget * self.summary_ratio)
+        cut, used = len(messages), 0
+        while cut > 0 and len(messages) - cut < self.keep_recent and used + tokens[cut - 1] <= recent_budget:
+            cut -= 1
+            used += tokens[cut]
+
+        # 2. Resumen (incremental) de lo anterior, recortado al presupuesto restante
+        summary_lines = self._summarize_prefix(messages, cut)
+        summary_budget = budget - used
+        summary_tokens = sum(estimate_tokens(line) for line in summary_lines)
+        while summary_lines and summary_tokens > summary_budget:
+            summary_tokens -= estimate_tokens(summary_lines.pop(0))
+
+        compacted = messages[cut:]
+        if summary_lines:
+            summary = "Resumen de la conversación anterior:\n" + "\n".join(summary_lines)
+            compacted = [{"role": "system", "content": summary}] + compacted
+            used += estimate_tokens(summary)
+
+        stats.update(messages_kept=len(messages) - cut, messages_summarized=len(summary_lines), tokens_out=used)
+        return compacted, stats
+
+    def _summarize_prefix(self, messages: List[Dict], cut: int) -> List[str]:
+        """Líneas de resumen de messages[:cut], reutilizando el resumen del prefijo más largo ya calculado"""
+        if cut == 0:
+            return []
+
+        chain, digest = [], hashlib.sha1()
+        for msg in messages[:cut]:
+            digest.update(msg["role"].encode("utf-8") + b"\0" + msg["content"].encode("utf-8") + b"\0")
+            chain.append(digest.copy().hexdigest())
+
+        start, lines = 0, []
+        with self._lock:
+            for i in range(cut - 1, -1, -1):
+                cached = self._summaries.get(chain[i])
+                if cached is not None:
+                    self._summaries.move_to_end(chain[i])
+                    start, lines = i + 1, list(cached)
+                    break
+
+        if start == cut:
+            self.summary_hits += 1
+            return lines
+        self.summary_misses += 1
+
+        lines.extend(self._summarize_message(msg) for msg in messages[start:cut])
+        lines = lines[-self.max_summary_lines:]
+        with self._lock:
+            self._summaries[chain[cut - 1]] = list(lines)
+            while len(self._summaries) > self.cache_entries:
+                self._summaries.popitem(last=False)
+        return lines
+
+    def _summarize_message(self, msg: Dict) -> str:
+        """Primera frase del mensaje, acotada a line_chars caracteres"""
+        speaker = "Usuario" if msg["role"] == "user" else "Asistente" if msg["role"] == "assistant" else "Sistema"
+        text = " ".join(msg["content"].split())
+        sentence = _SENTENCE_END.split(text, maxsplit=1)[0]
+        if len(sentence) > self.line_chars:
+            sentence = sentence[:self.line_chars - 1].rstrip() + "…"
+        return f"- {speaker}: {sentence}"
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cached_summaries": len(self._summaries),
+                "summary_hits": self.summary_hits, "summary_misses": self.summary_misses}
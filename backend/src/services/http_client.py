@@ -0,0 +1,268 @@
+"""
+HTTP Client - Cliente HTTP asíncrono con pool de conexiones keep-alive compartido
+"""
+import asyncio
+import atexit
+import threading
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+
+# Registro de clientes creados, para enlazarlos/cerrarlos en bloque desde el servidor ASGI
+_clients: "weakref.WeakSet[AsyncHTTPClient]" = weakref.WeakSet()
+
+
+class AsyncHTTPClient:
+    """Cliente HTTP no bloqueante con pool de conexiones reutilizable entre peticiones.
+
+    La sesión de aiohttp vive en un event loop propio de larga duración (en un hilo
+    dedicado), de modo que las conexiones TCP/TLS se reutilizan aunque cada petición
+    de Flask se ejecute en un loop distinto. Si el llamador ya está en ese loop, las
+    corrutinas se ejecutan directamente sin saltos entre hilos; bajo el servidor ASGI
+    el cliente se enlaza al loop del servidor con bind_loop().
+    """
+
+    def __init__(self,
+                 pool_size: int = 100,
+                 pool_size_per_host: int = 0,
+                 max_concurrency: int = 64,
+                 timeout: float = 60.0,
+                 connect_timeout: float = 10.0,
+                 keepalive_timeout: float = 30.0,
+                 name: str = "http-client",
+                 resolver_factory: Optional[Callable[[], AbstractResolver]] = None):
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.name = name
+        # Se llama en el loop de E/S al crear la sesión (los resolvers de aiohttp son del loop)
+        self.resolver_factory = resolver_factory
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        _clients.add(self)
+
+    @property
+    def in_flight(self) -> int:
+        """Número de peticiones actualmente en curso"""
+        return self._in_flight
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Arranca (una sola vez) el event loop de E/S en un hilo dedicado"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name=f"{self.name}-loop", daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+                atexit.register(self.close)
+            return self._loop
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Usa un event loop existente y de larga duración en lugar del hilo propio"""
+        if self._loop is loop:
+            return
+        if self._thread is not None:
+            self.close()
+        with self._lock:
+            self._loop, self._thread = loop, None
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Devuelve la sesión compartida; debe llamarse desde el loop de E/S"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+                resolver=self.resolver_factory() if self.resolver_factory else None
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, sock_connect=self.connect_timeout)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def run(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Ejecuta fn(*args, **kwargs) en el loop de E/S y espera su resultado"""
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is loop:
+            return await fn(*args, **kwargs)
+        future = asyncio.run_coroutine_threadsafe(fn(*args, **kwargs), loop)
+        return await asyncio.wrap_future(future)
+
+    def run_sync(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Variante bloqueante de run() para código síncrono (hilos, scripts)"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(fn(*args, **kwargs), loop).result()
+
+    async def _request_json(self, method: str, url: str,
+                            headers: Optional[Dict[str, str]] = None,
+                            json: Optional[Any] = None,
+                            params: Optional[Dict[str, Any]] = None,
+                            timeout: Optional[float] = None) -> Any:
+        session = self._get_session()
+        extra = {}
+        if timeout:
+            extra["timeout"] = aiohttp.ClientTimeout(total=timeout, sock_connect=self.connect_timeout)
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                async with session.request(method, url, headers=headers, json=json, params=params,
+                                           **extra) as response:
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+            finally:
+                self._in_flight -= 1
+
+    async def request_json(self, method: str, url: str, **kwargs) -> Any:
+        """Realiza una petición y devuelve el cuerpo JSON.
+
+        Lanza aiohttp.ClientError ante errores HTTP/red y asyncio.TimeoutError si se
+        supera el timeout (por defecto el del cliente, o `timeout` por llamada).
+        """
+        return await self.run(self._request_json, method, url, **kwargs)
+
+    async def _request_with(self, method: str, url: str, handler: Callable[[aiohttp.ClientResponse], Awaitable[Any]],
+                            headers: Optional[Dict[str, str]] = None,
+                            params: Optional[Dict[str, Any]] = None,
+                            timeout: Optional[float] = None,
+                            allow_redirects: bool = True) -> Any:
+        session = self._get_session()
+        extra = {}
+        if timeout:
+            extra["timeout"] = aiohttp.ClientTimeout(total=timeout, sock_connect=self.connect_timeout)
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                async with session.request(method, url, headers=headers, params=params,
+                                           allow_redirects=allow_redirects, **extra) as response:
+                    return await handler(response)
+            finally:
+                self._in_flight -= 1
+
+    async def request_with(self, method: str, url: str, handler, **kwargs) -> Any:
+        """Realiza una petición y devuelve lo que devuelva `await handler(response)`.
+
+        El handler se ejecuta en el loop de E/S con la respuesta abierta: puede leer
+        cabeceras y cuerpo por bloques y dejar de leer cuando quiera (la conexión se
+        libera al volver). No lanza por códigos HTTP de error; eso lo decide el handler.
+        """
+        return await self.run(self._request_with, method, url, handler, **kwargs)
+
+    async def _stream_lines(self, method: str, url: str,
+                            headers: Optional[Dict[str, str]] = None,
+                            json: Optional[Any] = None,
+                            params: Optional[Dict[str, Any]] = None,
+                            timeout: Optional[float] = None) -> AsyncIterator[bytes]:
+        session = self._get_session()
+        # En streaming el timeout limita la espera entre fragmentos, no la duración total
+        stream_timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout,
+                                               sock_read=timeout or self.timeout)
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                async with session.request(method, url, headers=headers, json=json, params=params,
+                                           timeout=stream_timeout) as response:
+                    response.raise_for_status()
+                    async for line in response.content:
+                        yield line
+            finally:
+                self._in_flight -= 1
+
+    async def stream_lines(self, method: str, url: str, **kwargs) -> AsyncIterator[bytes]:
+        """Realiza una petición y va devolviendo el cuerpo línea a línea según llega.
+
+        Si el llamador está en otro event loop, las líneas se reenvían a través de una
+        cola; cerrar el generador cancela la petición en curso.
+        """
+        loop = self._ensure_loop()
+        consumer = asyncio.get_running_loop()
+        if consumer is loop:
+            async for line in self._stream_lines(method, url, **kwargs):
+                yield line
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        def forward(item):
+            try:
+                consumer.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass  # el loop consumidor ya se cerró
+
+        async def pump():
+            try:
+                async for line in self._stream_lines(method, url, **kwargs):
+                    forward(line)
+            except Exception as e:
+                forward(e)
+            else:
+                forward(finished)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), loop)
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    async def _close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def aclose(self) -> None:
+        """Cierra la sesión desde código asíncrono (p. ej. al apagar el servidor ASGI)"""
+        if self._thread is None:
+            if self._loop is asyncio.get_running_loop():
+                await self._close()
+            self._loop = None
+        else:
+            await asyncio.to_thread(self.close)
+
+    def close(self) -> None:
+        """Cierra la sesión y detiene el loop de E/S"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop, self._thread = None, None
+        if loop is None or loop.is_closed() or thread is None:
+            # Un loop ajeno (enlazado con bind_loop) lo gestiona y cierra su dueño
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close(), loop).result(timeout=5)
+        except Exception as e:
+            print(f"Error al cerrar el cliente HTTP {self.name}: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=5)
+        loop.close()
+
+
+def bind_clients_to_loop(loop: asyncio.AbstractEventLoop) -> None:
+    """Enlaza todos los clientes HTTP existentes al event loop indicado"""
+    for client in list(_clients):
+        client.bind_loop(loop)
+
+
+async def close_clients() -> None:
+    """Cierra todos los clientes HTTP existentes"""
+    for client in list(_clients):
+        await client.aclose()
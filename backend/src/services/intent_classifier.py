@@ -0,0 +1,123 @@
+"""
+Intent Classifier - Detección de intenciones por palabras clave, compartida entre servicios
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Tablas de palabras clave por servicio. El orden de las etiquetas es la prioridad
+# cuando un mensaje contiene palabras de varias (la primera gana, como antes).
+INTENT_TABLES: Dict[str, Dict[str, List[str]]] = {
+    "code.language": {
+        "python": ["python", "py", "django", "flask"],
+        "javascript": ["javascript", "js", "node", "react", "vue"],
+        "java": ["java", "spring"],
+        "cpp": ["c++", "cpp"],
+        "go": ["go", "golang"],
+        "rust": ["rust"]
+    },
+    "code.action": {
+        "generate": ["generar", "crear"],
+        "review": ["revisar", "debug"],
+        "explain": ["explicar"]
+    },
+    "research.type": {
+        "academic": ["académico", "paper", "papers", "estudio", "estudios", "investigación científica"],
+        "market": ["mercado", "competencia", "industria", "análisis de mercado"],
+        "technical": ["técnico", "tecnología", "implementación", "arquitectura"],
+        "historical": ["historia", "historias", "histórico", "evolución", "cronología"]
+    },
+    "creative.type": {
+        "story": ["historia", "historias", "cuento", "cuentos", "narrativa"],
+        "poem": ["poema", "poemas", "poesía", "poesías", "verso", "versos"],
+        "script": ["guion", "guiones", "escena", "escenas", "diálogo", "diálogos"],
+        "design_concept": ["diseño", "diseños", "concepto visual", "conceptos visuales", "idea gráfica", "ideas gráficas"],
+        "song_lyrics": ["letra de canción", "letras de canciones", "canción", "canciones"]
+    },
+    "web.action": {
+        "search": ["buscar", "investigar"],
+        "navigate": ["navegar", "ir a"]
+    },
+    # Señales adicionales para el enrutado automático de agentes (agent_type "auto")
+    "agent.route": {
+        "vision": ["imagen", "imágenes", "foto", "fotos", "fotografía", "fotografías", "captura de pantalla",
+                   "capturas de pantalla", "ocr", "image", "images", "photo", "photos"],
+        "code": ["código", "códigos", "función", "funciones", "programa", "programas", "script", "scripts", "bug", "bugs",
+                 "compilar", "compilación", "api", "apis", "clase", "clases", "algoritmo", "algoritmos", "sql", "regex", "stack trace", "excepción", "excepciones", "refactorizar",
+                 "code", "function", "functions"],
+        "web": ["página web", "páginas web", "sitio web", "sitios web", "url", "urls", "enlace", "enlaces", "web",
+                "website", "websites", "noticias"],
+        "research": ["investigación", "investigaciones", "analizar", "análisis", "comparar", "fuentes", "informe", "informes",
+                     "estadísticas", "research"],
+        "creative": ["escribe", "escribir", "inventa", "poema", "poemas", "relato", "relatos", "eslogan", "eslóganes",
+                     "story", "stories", "poem", "poems"]
+    }
+}
+
+
+class IntentMatch(NamedTuple):
+    table: str
+    label: str
+    keyword: str
+    start: int
+    end: int
+
+
+class IntentMatches:
+    """Coincidencias de un mensaje, con posiciones sobre el texto en minúsculas"""
+
+    def __init__(self, text: str, matches: Tuple[IntentMatch, ...], priorities: Dict[str, Dict[str, int]]):
+        self.text = text
+        self.matches = matches
+        self._priorities = priorities
+
+    def for_table(self, table: str) -> List[IntentMatch]:
+        return [match for match in self.matches if match.table == table]
+
+    def best(self, table: str) -> Optional[IntentMatch]:
+        """Primera coincidencia de la etiqueta con más prioridad en la tabla"""
+        priority = self._priorities[table]
+        found = self.for_table(table)
+        return min(found, key=lambda match: (priority[match.label], match.start)) if found else None
+
+    def label(self, table: str, default: str) -> str:
+        match = self.best(table)
+        return match.label if match else default
+
+
+class IntentClassifier:
+    """Compila todas las tablas en una sola expresión regular con límites de palabra.
+
+    Las alternativas se ordenan de más larga a más corta para que las frases
+    ("análisis de mercado") ganen a sus palabras sueltas, y los límites se expresan
+    con lookarounds en lugar de \\b para admitir claves como "c++". Así "go" ya no
+    coincide dentro de "google" ni "js" dentro de "ajsdf". No se añade ningún sufijo de
+    plural genérico ("goes" no es "go", "técnicoes" no existe): los plurales que
+    interesan ("poemas", "canciones") se listan explícitamente en las tablas.
+    """
+
+    def __init__(self, tables: Dict[str, Dict[str, List[str]]], cache_size: int = 256):
+        self.tables = tables
+        self._priorities = {table: {label: i for i, label in enumerate(labels)} for table, labels in tables.items()}
+        self._owners: Dict[str, List[Tuple[str, str]]] = {}
+        for table, labels in tables.items():
+            for label, keywords in labels.items():
+                for keyword in keywords:
+                    self._owners.setdefault(keyword.lower(), []).append((table, label))
+
+        alternatives = "|".join(re.escape(keyword) for keyword in sorted(self._owners, key=len, reverse=True))
+        self._pattern = re.compile(rf"(?<!\w)(?P<keyword>{alternatives})(?!\w)")
+        # El mismo mensaje lo clasifican varios servicios en paralelo: se memoriza
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    def _classify(self, text: str) -> IntentMatches:
+        lowered = text.lower()
+        matches = []
+        for found in self._pattern.finditer(lowered):
+            keyword = found.group("keyword")
+            for table, label in self._owners[keyword]:
+                matches.append(IntentMatch(table, label, keyword, found.start(), found.end()))
+        return IntentMatches(lowered, tuple(matches), self._priorities)
+
+
+intent_classifier = IntentClassifier(INTENT_TABLES)
@@ -0,0 +1,313 @@
+"""
+Job Queue - Trabajos de chat en segundo plano persistidos en la base de datos de la aplicación
+
+Los trabajos se guardan en la tabla `job` de app.db. Un hilo con su propio event loop
+ejecuta hasta JOB_WORKERS trabajos a la vez; cada worker reclama el siguiente en cola
+con un UPDATE atómico, así que varios procesos (workers de uvicorn/gunicorn) comparten
+la misma cola. Mientras un trabajo se ejecuta se guardan su progreso y un latido: si el
+proceso muere, los trabajos sin latido vuelven a la cola (hasta JOB_MAX_ATTEMPTS intentos).
+"""
+import asyncio
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from src.models.user import db
+from src.models.job import Job, FINISHED_STATUSES
+from src.services.metrics import observe_job, JOBS
+from src.services.tracing import tracer, extract_context
+
+
+class JobProgress:
+    """Progreso de un trabajo en curso: etapa y texto generado hasta ahora"""
+
+    def __init__(self):
+        self.stage = "starting"
+        self.chunks = []
+        self.version = 0
+        self.cancelled = False
+
+    def update(self, stage: str) -> None:
+        """Cambia de etapa y descarta el texto de un intento anterior"""
+        self.stage = stage
+        self.chunks = []
+        self.version += 1
+
+    def append(self, text: str) -> None:
+        self.stage = "generating"
+        self.chunks.append(text)
+        self.version += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"stage": self.stage, "content": "".join(self.chunks)}
+
+
+# Ejecuta la petición guardada en el trabajo; devuelve (cuerpo de la respuesta, código HTTP)
+JobRunner = Callable[[Dict[str, Any], JobProgress], Awaitable[Tuple[Dict[str, Any], int]]]
+
+
+class JobQueue:
+    def __init__(self, runner: JobRunner, workers: int = 4, poll_interval: float = 1.0,
+                 progress_interval: float = 0.5, heartbeat_interval: float = 10.0, stale_after: float = 60.0,
+                 max_attempts: int = 3, timeout: float = 900.0, retention: float = 7 * 86400):
+        self.runner = runner
+        self.workers = workers
+        # Sin avisos de este proceso, cada cuánto se mira si otro proceso encoló algo
+        self.poll_interval = poll_interval
+        # Cada cuánto se guarda el progreso (y se reenvía a los suscriptores SSE)
+        self.progress_interval = progress_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.retention = retention
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.last_error: Optional[str] = None
+        self._app = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Trabajos en ejecución en este proceso: id -> (tarea, progreso)
+        self._active: Dict[str, Tuple[asyncio.Task, JobProgress]] = {}
+
+    @classmethod
+    def from_env(cls, runner: JobRunner) -> "JobQueue":
+        return cls(runner,
+                   workers=int(os.environ.get("JOB_WORKERS", 4)),
+                   poll_interval=float(os.environ.get("JOB_POLL_INTERVAL", 1.0)),
+                   progress_interval=float(os.environ.get("JOB_PROGRESS_INTERVAL", 0.5)),
+                   heartbeat_interval=float(os.environ.get("JOB_HEARTBEAT_INTERVAL", 10)),
+                   stale_after=float(os.environ.get("JOB_STALE_AFTER", 60)),
+                   max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", 3)),
+                   timeout=float(os.environ.get("JOB_TIMEOUT", 900)),
+                   retention=float(os.environ.get("JOB_RETENTION", 7 * 86400)))
+
+    def start(self, app) -> None:
+        """Arranca (una sola vez) el hilo de los workers; necesita la app para el contexto de la base de datos"""
+        if self.workers <= 0 or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._app = app
+                self._thread = threading.Thread(target=self._serve, name="job-queue", daemon=True)
+                self._thread.start()
+
+    def submit(self, request: Dict[str, Any], agent_type: str, priority: int,
+               traceparent: Optional[str] = None) -> Job:
+        """Guarda un trabajo en cola y avisa a los workers de este proceso"""
+        job = Job(request=request, agent_type=agent_type, priority=priority, traceparent=traceparent)
+        db.session.add(job)
+        db.session.commit()
+        JOBS.inc("queued")
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return job
+
+    def cancel(self, job: Job) -> Job:
+        """Cancela un trabajo en cola; si se está ejecutando, lo detiene su worker (en este proceso,
+        al momento; en otro, en su siguiente latido)"""
+        if not job.finished:
+            cancelled = db.session.execute(
+                db.update(Job)
+                .where(Job.id == job.id, Job.status == "queued")
+                .values(status="cancelled", cancel_requested=True, finished_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not cancelled:
+                job.cancel_requested = True
+            db.session.commit()
+            if cancelled:
+                JOBS.inc("cancelled")
+            active = self._active.get(job.id)
+            if active is not None:
+                task, progress = active
+                progress.cancelled = True
+                self._loop.call_soon_threadsafe(task.cancel)
+        db.session.refresh(job)
+        return job
+
+    def snapshot(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado actual del trabajo leído de la base de datos (puede ejecutarlo otro proceso)"""
+        job = db.session.get(Job, job_id, populate_existing=True)
+        data = job.to_dict() if job is not None else None
+        # Cerrar la transacción de lectura para ver los cambios de los workers en la siguiente
+        db.session.rollback()
+        return data
+
+    async def events(self, job_id: str, interval: Optional[float] = None) -> AsyncIterator[Tuple[str, Dict]]:
+        """Genera (evento, datos) de un trabajo: `status` al cambiar de estado, `progress` con el
+        texto nuevo desde el evento anterior y un `done` final con el trabajo completo"""
+        interval = interval or self.progress_interval
+        status, sent = None, ""
+        while True:
+            job = self.snapshot(job_id)
+            if job is None:
+                yield "error", {"success": False, "error": f"Job not found: {job_id}"}
+                return
+            if job["status"] != status:
+                status = job["status"]
+                yield "status", {"job_id": job_id, "status": status, "attempts": job["attempts"]}
+            progress = job["progress"] or {}
+            content = progress.get("content", "")
+            if content != sent and status == "running":
+                if content.startswith(sent):
+                    yield "progress", {"stage": progress.get("stage"), "delta": content[len(sent):]}
+                else:
+                    # Reintento tras perder el worker: el texto empieza de nuevo
+                    yield "progress", {"stage": progress.get("stage"), "content": content, "reset": True}
+                sent = content
+            if status in FINISHED_STATUSES:
+                yield "done", job
+                return
+            await asyncio.sleep(interval)
+
+    def _serve(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._wakeup = asyncio.Event()
+        self._loop = loop
+        # Contexto para reclamar y mantener la cola (sentencias sueltas, sin await a mitad de
+        # una transacción); cada trabajo abre el suyo y con él su propia sesión
+        with self._app.app_context():
+            loop.run_until_complete(asyncio.gather(self._maintain(),
+                                                   *(self._work() for _ in range(self.workers))))
+
+    async def _maintain(self) -> None:
+        """Reencola los trabajos de procesos caídos y borra los terminados antiguos"""
+        while True:
+            try:
+                requeued, failed = Job.recover_stale(self.stale_after, self.max_attempts)
+                if requeued or failed:
+                    print(f"Trabajos sin latido: {requeued} reencolados, {failed} fallidos")
+                    JOBS.inc("requeued", amount=requeued)
+                    JOBS.inc("failed", amount=failed)
+                    self._wakeup.set()
+                Job.purge_finished(self.retention)
+            except Exception as e:
+                db.session.rollback()
+                self.last_error = str(e)
+                print(f"Error en el mantenimiento de la cola de trabajos: {e}")
+            await asyncio.sleep(max(1.0, self.stale_after / 2))
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                job_id = Job.claim(self.worker_id)
+            except Exception as e:
+                db.session.rollback()
+                self.last_error = str(e)
+                print(f"Error reclamando un trabajo: {e}")
+                job_id = None
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            await self._run(job_id)
+
+    async def _run(self, job_id: str) -> None:
+        """Ejecuta un trabajo en su propio contexto de aplicación (y su propia sesión de base de datos)"""
+        with self._app.app_context():
+            await self._execute(job_id)
+
+    async def _execute(self, job_id: str) -> None:
+        job = db.session.get(Job, job_id, populate_existing=True)
+        request, agent_type = job.request, job.agent_type or "general"
+        queue_wait = max(0.0, (job.started_at - job.created_at).total_seconds())
+        progress = JobProgress()
+        status, result, error = "failed", None, None
+        started = time.perf_counter()
+
+        with tracer.span("job.run", {"job.id": job_id, "job.attempt": job.attempts, "agent_type": agent_type},
+                         parent=extract_context({"traceparent": job.traceparent})) as span:
+            task = asyncio.create_task(self.runner(request, progress))
+            self._active[job_id] = (task, progress)
+            watcher = asyncio.create_task(self._watch(job_id, task, progress))
+            try:
+                result, code = await asyncio.wait_for(task, self.timeout)
+                status = "succeeded" if code == 200 else "failed"
+                error = None if code == 200 else result.get("error")
+            except asyncio.TimeoutError:
+                error = f"Job timed out after {self.timeout:g}s"
+            except asyncio.CancelledError:
+                if not progress.cancelled:
+                    raise
+                status = "cancelled"
+            except Exception as e:
+                error = str(e)
+            finally:
+                watcher.cancel()
+                self._active.pop(job_id, None)
+            span.set_attribute("job.status", status)
+
+        self._finish(job_id, status, result, error, progress)
+        observe_job(agent_type, status, queue_wait, time.perf_counter() - started)
+
+    def _finish(self, job_id, status, result, error, progress) -> None:
+        try:
+            db.session.execute(
+                db.update(Job)
+                # Si otro proceso lo dio por perdido y lo reclamó, el resultado ya no es nuestro
+                .where(Job.id == job_id, Job.status == "running", Job.worker == self.worker_id)
+                .values(status=status, result=result, error=error, progress=progress.snapshot(),
+                        finished_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.last_error = str(e)
+            print(f"Error guardando el resultado del trabajo {job_id}: {e}")
+
+    async def _watch(self, job_id: str, task: asyncio.Task, progress: JobProgress) -> None:
+        """Guarda el progreso y el latido del trabajo y atiende las cancelaciones pedidas desde otro proceso.
+
+        Usa una sesión propia para no confirmar a medias lo que esté escribiendo el trabajo.
+        """
+        with self._app.app_context():
+            await self._beat(job_id, task, progress)
+
+    async def _beat(self, job_id: str, task: asyncio.Task, progress: JobProgress) -> None:
+        written, last_beat = 0, time.monotonic()
+        while not task.done():
+            await asyncio.sleep(self.progress_interval)
+            if progress.version == written and time.monotonic() - last_beat < self.heartbeat_interval:
+                continue
+            values = {"heartbeat_at": datetime.utcnow()}
+            if progress.version != written:
+                values["progress"], written = progress.snapshot(), progress.version
+            try:
+                cancel_requested = db.session.execute(
+                    db.update(Job)
+                    .where(Job.id == job_id)
+                    .values(**values)
+                    .returning(Job.cancel_requested)
+                    .execution_options(synchronize_session=False)
+                ).scalar()
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error guardando el progreso del trabajo {job_id}: {e}")
+                continue
+            last_beat = time.monotonic()
+            if cancel_requested:
+                progress.cancelled = True
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict(db.session.execute(db.select(Job.status, db.func.count()).group_by(Job.status)).all())
+        oldest = db.session.execute(db.select(db.func.min(Job.created_at)).where(Job.status == "queued")).scalar()
+        return {
+            "workers": self.workers,
+            "worker_id": self.worker_id,
+            "running_here": len(self._active),
+            "jobs": counts,
+            "oldest_queued_s": round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else None,
+            "last_error": self.last_error
+        }
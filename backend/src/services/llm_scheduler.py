@@ -0,0 +1,240 @@
+"""
+LLM Scheduler - Límites de concurrencia por modelo, cola con prioridad y rechazo rápido
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+# Prioridades de la cola (menor = antes)
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class QueueFullError(Exception):
+    """La cola del modelo está llena (o la espera superó el límite): responder 429"""
+    outcome = "queue_full"
+
+    def __init__(self, model: str, retry_after: float, reason: str = "cola llena"):
+        super().__init__(f"Modelo {model} saturado ({reason}); reintentar en {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("loop", "future", "granted", "cancelled", "queued_at")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+        self.cancelled = False
+        self.queued_at = time.perf_counter()
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class ModelLimiter:
+    """Semáforo + token bucket de un modelo, con cola de espera acotada y con prioridad.
+
+    Es seguro entre event loops (cada petición de Flask usa el suyo): el estado se
+    protege con un lock de hilos y los que esperan se despiertan en su propio loop.
+    """
+
+    def __init__(self, model: str, max_concurrency: int = 8, rate_per_sec: float = 0.0,
+                 burst: Optional[float] = None, max_queue: int = 32, queue_timeout: float = 30.0):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst or max(1.0, rate_per_sec)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._lock = threading.Lock()
+        self._heap = []
+        self._seq = itertools.count()
+        self._timer: Optional[threading.Timer] = None
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def _refill(self) -> None:
+        if not self.rate_per_sec:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_sec)
+        self._refilled_at = now
+
+    def _can_start(self) -> bool:
+        return self.active < self.max_concurrency and (not self.rate_per_sec or self._tokens >= 1)
+
+    def _start(self) -> None:
+        self.active += 1
+        self.admitted += 1
+        if self.rate_per_sec:
+            self._tokens -= 1
+
+    def retry_after(self) -> float:
+        """Estimación conservadora (en segundos) de cuándo habrá hueco"""
+        if self.rate_per_sec:
+            return max(1.0, (self.queued + 1) / self.rate_per_sec)
+        return max(1.0, min(self.queue_timeout, self.queued / max(1, self.max_concurrency)))
+
+    def check_admission(self) -> None:
+        """Lanza QueueFullError si una petición nueva no cabría en la cola"""
+        with self._lock:
+            self._refill()
+            if self.queued >= self.max_queue and not self._can_start():
+                self.rejected += 1
+                raise QueueFullError(self.model, self.retry_after())
+
+    async def acquire(self, priority: int = PRIORITIES["normal"]) -> None:
+        with self._lock:
+            self._refill()
+            if not self.queued and self._can_start():
+                self._start()
+                return
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(self.model, self.retry_after())
+            waiter = _Waiter(asyncio.get_running_loop())
+            heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+            self.queued += 1
+            self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter.granted:
+                    # Se concedió justo a la vez que se abandonaba la espera: devolver el hueco
+                    self.active -= 1
+                    self._dispatch()
+                else:
+                    waiter.cancelled = True
+                    self.queued -= 1
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timed_out += 1
+            if isinstance(e, asyncio.TimeoutError):
+                raise QueueFullError(self.model, self.retry_after(), "espera agotada") from None
+            raise
+
+        wait_ms = (time.perf_counter() - waiter.queued_at) * 1000
+        with self._lock:
+            self.wait_ms_total += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+
+    def release(self) -> None:
+        with self._lock:
+            self.active -= 1
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Concede huecos a los primeros de la cola; se llama con el lock tomado"""
+        self._refill()
+        while self._heap:
+            _, _, waiter = self._heap[0]
+            if waiter.cancelled:
+                heapq.heappop(self._heap)
+                continue
+            if not self._can_start():
+                break
+            heapq.heappop(self._heap)
+            self.queued -= 1
+            self._start()
+            waiter.granted = True
+            try:
+                waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+            except RuntimeError:
+                # El loop del que esperaba ya no existe
+                self.active -= 1
+
+        # Si solo falta que se recargue el bucket, programar un nuevo reparto
+        if self._heap and self.rate_per_sec and self.active < self.max_concurrency and self._timer is None:
+            delay = (1 - self._tokens) / self.rate_per_sec
+            self._timer = threading.Timer(max(delay, 0.001), self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        waited = self.admitted or 1
+        return {"active": self.active, "queued": self.queued, "max_concurrency": self.max_concurrency,
+                "rate_per_sec": self.rate_per_sec, "max_queue": self.max_queue, "admitted": self.admitted,
+                "rejected": self.rejected, "timed_out": self.timed_out,
+                "avg_wait_ms": round(self.wait_ms_total / waited, 2), "max_wait_ms": round(self.wait_ms_max, 2)}
+
+
+class LLMScheduler:
+    """Limitadores por modelo delante de las llamadas al LLM"""
+
+    def __init__(self, default_concurrency: int = 8, default_rate: float = 0.0,
+                 max_queue: int = 32, queue_timeout: float = 30.0):
+        self.default_concurrency = default_concurrency
+        self.default_rate = default_rate
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        return cls(
+            default_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", 8)),
+            default_rate=float(os.environ.get("LLM_RATE_LIMIT", 0)),
+            max_queue=int(os.environ.get("LLM_QUEUE_SIZE", 32)),
+            queue_timeout=float(os.environ.get("LLM_QUEUE_TIMEOUT", 30))
+        )
+
+    def configure(self, model: str, max_concurrency: Optional[int] = None, rate_per_sec: Optional[float] = None) -> None:
+        """Fija los límites de un modelo; si varios agentes lo comparten, se queda el más estricto"""
+        with self._lock:
+            limiter = self._limiters.get(model)
+            concurrency = max_concurrency or self.default_concurrency
+            rate = rate_per_sec if rate_per_sec is not None else self.default_rate
+            if limiter is not None:
+                concurrency = min(concurrency, limiter.max_concurrency)
+                rates = [r for r in (rate, limiter.rate_per_sec) if r]
+                rate = min(rates) if rates else 0.0
+            self._limiters[model] = ModelLimiter(model, concurrency, rate, max_queue=self.max_queue,
+                                                 queue_timeout=self.queue_timeout)
+
+    def limiter(self, model: str) -> ModelLimiter:
+        with self._lock:
+            if model not in self._limiters:
+                self._limiters[model] = ModelLimiter(model, self.default_concurrency, self.default_rate,
+                                                     max_queue=self.max_queue, queue_timeout=self.queue_timeout)
+            return self._limiters[model]
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: int = PRIORITIES["normal"]):
+        """Ocupa un hueco del modelo durante el bloque; lanza QueueFullError si no hay sitio"""
+        limiter = self.limiter(model)
+        await limiter.acquire(priority)
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    def check_admission(self, model: str) -> None:
+        """Rechazo rápido antes de empezar a responder (p. ej. en streaming)"""
+        self.limiter(model).check_admission()
+
+    def stats(self) -> Dict[str, Any]:
+        return {model: limiter.stats() for model, limiter in self._limiters.items()}
@@ -0,0 +1,254 @@
+"""
+Metrics - Contadores e histogramas en memoria exportados en formato de texto de Prometheus
+"""
+import os
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Límites de los buckets (segundos y bytes); el bucket +Inf se añade siempre
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Contador monótono con etiquetas (una serie por combinación de valores)"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}"
+                for labels, value in sorted(values)]
+
+
+class Histogram:
+    """Histograma de buckets fijos con etiquetas.
+
+    observe() solo busca el bucket (bisect) e incrementa un contador bajo el lock; los
+    acumulados que exige Prometheus se calculan al exportar, no en cada observación.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por serie: [cuentas por bucket (+Inf al final), suma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            snapshot = [(labels, list(series[0]), series[1], series[2]) for labels, series in self._series.items()]
+        lines = []
+        for labels, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Registro de métricas del proceso.
+
+    Las métricas son por proceso: con varios workers (gunicorn/uvicorn -w N) cada uno
+    expone las suyas y Prometheus las agrega al consultar.
+    """
+
+    def __init__(self, enabled: bool = True, prefix: str = "ralt"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._metrics: Dict[str, object] = {}
+
+    @classmethod
+    def from_env(cls) -> "MetricsRegistry":
+        return cls(enabled=os.environ.get("METRICS_ENABLED", "true").lower() != "false")
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(f"{self.prefix}_{name}_total", documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(f"{self.prefix}_{name}", documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Todas las métricas en formato de exposición de texto de Prometheus (0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            samples = metric.samples()
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry.from_env()
+
+HTTP_REQUESTS = metrics.counter("http_requests", "Peticiones HTTP atendidas", ("method", "route", "status"))
+HTTP_LATENCY = metrics.histogram("http_request_duration_seconds", "Duración de las peticiones HTTP",
+                                 ("method", "route"))
+HTTP_REQUEST_SIZE = metrics.histogram("http_request_size_bytes", "Tamaño del cuerpo de las peticiones",
+                                      ("route",), SIZE_BUCKETS)
+HTTP_RESPONSE_SIZE = metrics.histogram("http_response_size_bytes", "Tamaño del cuerpo de las respuestas",
+                                       ("route",), SIZE_BUCKETS)
+CHAT_STAGE_LATENCY = metrics.histogram("chat_stage_duration_seconds",
+                                       "Duración de cada etapa de una respuesta de chat", ("agent_type", "stage"))
+SERVICE_LATENCY = metrics.histogram("service_duration_seconds", "Duración de process() de cada servicio",
+                                    ("agent_type", "service"))
+LLM_LATENCY = metrics.histogram("llm_request_duration_seconds", "Duración de cada intento de llamada a OpenRouter",
+                                ("model", "outcome"))
+LLM_TOKENS = metrics.histogram("llm_tokens", "Tokens por llamada a OpenRouter (según `usage`)",
+                               ("model", "kind"), TOKEN_BUCKETS)
+ERRORS = metrics.counter("errors", "Errores por componente y tipo", ("component", "kind"))
+BATCH_ITEMS = metrics.counter("chat_batch_items",
+                              "Respuestas a los elementos de /api/chat/batch (incluidos los 429 reintentados)",
+                              ("status",))
+JOB_QUEUE_WAIT = metrics.histogram("job_queue_wait_seconds", "Espera en cola de los trabajos en segundo plano",
+                                   ("agent_type",), JOB_BUCKETS)
+JOB_RUN_TIME = metrics.histogram("job_run_duration_seconds", "Duración de la ejecución de los trabajos",
+                                 ("agent_type", "status"), JOB_BUCKETS)
+JOBS = metrics.counter("jobs", "Trabajos en segundo plano por resultado (incluidos los reencolados)", ("status",))
+
+
+def observe_http(method: str, route: str, status: int, seconds: float,
+                 request_size: Optional[int] = None, response_size: Optional[int] = None) -> None:
+    """Registra una petición HTTP; `route` es la plantilla de la ruta, no la URL (cardinalidad acotada)"""
+    if not metrics.enabled:
+        return
+    HTTP_REQUESTS.inc(method, route, str(status))
+    HTTP_LATENCY.observe(seconds, method, route)
+    if request_size is not None:
+        HTTP_REQUEST_SIZE.observe(request_size, route)
+    if response_size is not None:
+        HTTP_RESPONSE_SIZE.observe(response_size, route)
+    if status >= 500:
+        ERRORS.inc("http", str(status))
+
+
+def observe_chat_timings(agent_type: str, timings: Dict, service_results: Dict) -> None:
+    """Registra las etapas de metadata.timings_ms de una respuesta de chat y los servicios que fallaron"""
+    if not metrics.enabled:
+        return
+    for stage, value in timings.items():
+        if stage == "services":
+            for service, ms in value.items():
+                SERVICE_LATENCY.observe(ms / 1000, agent_type, service)
+        else:
+            CHAT_STAGE_LATENCY.observe(value / 1000, agent_type, stage)
+    for service, result in service_results.items():
+        if isinstance(result, dict) and result.get("error"):
+            ERRORS.inc(f"service:{service}", "timeout" if "timeout" in str(result["error"]) else "error")
+
+
+def observe_batch_item(status: int, retries: int) -> None:
+    """Registra un elemento de un lote de chat; los reintentos por cola llena cuentan como 429"""
+    if not metrics.enabled:
+        return
+    BATCH_ITEMS.inc(str(status))
+    if retries:
+        BATCH_ITEMS.inc("429", amount=retries)
+
+
+def observe_job(agent_type: str, status: str, queue_wait: float, run_time: float) -> None:
+    """Registra un trabajo en segundo plano terminado (tiempos en segundos)"""
+    if not metrics.enabled:
+        return
+    JOBS.inc(status)
+    JOB_QUEUE_WAIT.observe(queue_wait, agent_type)
+    JOB_RUN_TIME.observe(run_time, agent_type, status)
+    if status == "failed":
+        ERRORS.inc("job", "failed")
+
+
+def observe_llm(model: str, outcome: str, seconds: float) -> None:
+    """Registra un intento de llamada a OpenRouter"""
+    if not metrics.enabled:
+        return
+    LLM_LATENCY.observe(seconds, model, outcome)
+    if outcome != "ok":
+        ERRORS.inc("llm", outcome)
+
+
+def observe_tokens(model: str, usage: Optional[Dict]) -> None:
+    """Registra el consumo de tokens del campo `usage` de una respuesta de OpenRouter"""
+    if metrics.enabled and isinstance(usage, dict):
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if isinstance(usage.get(kind), (int, float)):
+                LLM_TOKENS.observe(usage[kind], model, kind.split("_", 1)[0])
+
+
+def server_timing(timings: Dict, **extra: float) -> str:
+    """Cabecera Server-Timing a partir de metadata.timings_ms (y otras duraciones en ms)"""
+    entries = []
+    for stage, value in {**timings, **extra}.items():
+        if stage == "services":
+            entries.extend(f"svc-{service};dur={ms}" for service, ms in value.items())
+        elif isinstance(value, (int, float)):
+            entries.append(f"{stage};dur={value}")
+    return ", ".join(entries)
@@ -0,0 +1,208 @@
+"""
+Model Registry - Catálogo de modelos de OpenRouter en memoria, con refresco en segundo plano
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Any, List, Optional
+
+
+def _price(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def summarize_model(model: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos del modelo que expone /api/models (precios en USD por token)"""
+    model_id = model.get("id", "")
+    pricing = model.get("pricing") or {}
+    architecture = model.get("architecture") or {}
+    return {
+        "id": model_id,
+        "name": model.get("name", model_id),
+        "provider": model_id.split("/", 1)[0] if "/" in model_id else None,
+        "context_length": model.get("context_length") or 0,
+        "prompt_price": _price(pricing.get("prompt")),
+        "completion_price": _price(pricing.get("completion")),
+        "modality": architecture.get("modality")
+    }
+
+
+class ModelRegistry:
+    """Catálogo de modelos indexado por id, proveedor, contexto y precio.
+
+    Al arrancar se carga la última instantánea guardada en disco (arranque rápido y uso
+    sin red) y un hilo en segundo plano la refresca cada `refresh_interval` segundos.
+    Las consultas se sirven siempre desde memoria.
+    """
+
+    def __init__(self, service, snapshot_path: str, refresh_interval: float = 3600.0):
+        self.service = service
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.fetched_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.expected_models: List[str] = []
+        self.unresolved_models: List[str] = []
+        self._index([])
+        self.load_snapshot()
+
+    @classmethod
+    def from_env(cls, service) -> "ModelRegistry":
+        default_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "database", "model_catalog.json")
+        return cls(service,
+                   snapshot_path=os.environ.get("MODEL_CATALOG_PATH", default_path),
+                   refresh_interval=float(os.environ.get("MODEL_CATALOG_REFRESH", 3600)))
+
+    def _index(self, models: List[Dict[str, Any]]) -> None:
+        """Reconstruye los índices y los publica de una vez (las lecturas no toman el lock)"""
+        summaries = [summarize_model(model) for model in models if model.get("id")]
+        by_id = {model["id"]: model for model in summaries}
+        by_provider: Dict[str, List[Dict]] = {}
+        for model in summaries:
+            by_provider.setdefault(model["provider"] or "", []).append(model)
+        by_context = sorted(summaries, key=lambda model: model["context_length"])
+        # Índice por nombre corto ("gpt-4o" -> "openai/gpt-4o") para validar AGENT_TYPES
+        by_short_id: Dict[str, List[str]] = {}
+        for model_id in by_id:
+            by_short_id.setdefault(model_id.split("/", 1)[-1], []).append(model_id)
+
+        self._by_id, self._by_provider, self._by_short_id = by_id, by_provider, by_short_id
+        self._by_context = (by_context, [model["context_length"] for model in by_context])
+
+    def load_snapshot(self) -> bool:
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self._index(snapshot["models"])
+            self.fetched_at = snapshot.get("fetched_at")
+            self._resolve_expected()
+            return True
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError) as e:
+            print(f"No se pudo leer la instantánea del catálogo de modelos: {e}")
+            return False
+
+    def _save_snapshot(self, models: List[Dict[str, Any]]) -> None:
+        """Escritura atómica: fichero temporal + rename"""
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": self.fetched_at, "models": models}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"No se pudo guardar la instantánea del catálogo de modelos: {e}")
+
+    def refresh(self) -> bool:
+        """Descarga el catálogo (bloqueante; se llama desde el hilo de refresco)"""
+        models = self.service.http.run_sync(self.service.get_models)
+        if not models:
+            # get_models ya registra el error; se conserva el catálogo anterior
+            self.last_error = "catálogo vacío o no disponible"
+            return False
+        with self._lock:
+            self.fetched_at = time.time()
+            self.last_error = None
+            self._index(models)
+            self._save_snapshot(models)
+        self._resolve_expected()
+        return True
+
+    def start(self) -> None:
+        """Arranca (una sola vez) el hilo de refresco en segundo plano"""
+        if self._thread is not None or self.refresh_interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="model-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        # Si la instantánea es reciente, se espera al siguiente intervalo en lugar de descargar ya
+        age = time.time() - self.fetched_at if self.fetched_at else None
+        wait = self.refresh_interval - age if age is not None and age < self.refresh_interval else 0
+        while not self._stop.wait(wait):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error refrescando el catálogo de modelos: {e}")
+            wait = self.refresh_interval
+
+    def get(self, model_id: str) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(model_id)
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Id completo de un modelo a partir de su id o de su nombre corto (si no es ambiguo)"""
+        if name in self._by_id:
+            return name
+        candidates = self._by_short_id.get(name, [])
+        return candidates[0] if len(candidates) == 1 else None
+
+    def search(self, provider: Optional[str] = None, min_context: Optional[int] = None,
+               max_prompt_price: Optional[float] = None, query: Optional[str] = None,
+               sort: str = "id", limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Filtra el catálogo usando el índice más selectivo disponible"""
+        if provider is not None:
+            models = self._by_provider.get(provider, [])
+        elif min_context:
+            by_context, context_keys = self._by_context
+            models = by_context[bisect_left(context_keys, min_context):]
+        else:
+            models = list(self._by_id.values())
+
+        if min_context:
+            models = [model for model in models if model["context_length"] >= min_context]
+        if max_prompt_price is not None:
+            models = [model for model in models
+                      if model["prompt_price"] is not None and model["prompt_price"] <= max_prompt_price]
+        if query:
+            query = query.lower()
+            models = [model for model in models if query in model["id"].lower() or query in model["name"].lower()]
+
+        if sort == "context_length":
+            models = sorted(models, key=lambda model: model["context_length"], reverse=True)
+        elif sort == "price":
+            models = sorted(models, key=lambda model: (model["prompt_price"] is None, model["prompt_price"] or 0))
+        else:
+            models = sorted(models, key=lambda model: model["id"])
+        return models[:limit] if limit else models
+
+    def expect(self, names: List[str]) -> None:
+        """Modelos que usa la aplicación: se traducen a ids del catálogo para las llamadas a OpenRouter"""
+        self.expected_models = list(dict.fromkeys(names))
+        self._resolve_expected()
+
+    def _resolve_expected(self) -> None:
+        """Publica en el servicio el id del catálogo de cada modelo esperado (tras cargar o refrescar).
+
+        Los que no están en el catálogo se envían con su nombre tal cual y quedan en
+        `unresolved_models` (visible en /api/health y /api/models).
+        """
+        resolved = self.validate(self.expected_models)
+        self.unresolved_models = [name for name, model_id in resolved.items() if model_id is None]
+        self.service.model_ids = {name: model_id for name, model_id in resolved.items() if model_id}
+        if self.unresolved_models:
+            print(f"Modelos configurados que no existen en el catálogo de OpenRouter: "
+                  f"{', '.join(self.unresolved_models)}")
+
+    def validate(self, names: List[str]) -> Dict[str, Optional[str]]:
+        """Id del catálogo de cada nombre de modelo (None si no existe); vacío si no hay catálogo"""
+        if not self._by_id:
+            return {}
+        return {name: self.resolve(name) for name in names}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"models": len(self._by_id), "providers": len(self._by_provider),
+                "fetched_at": self.fetched_at, "refresh_interval": self.refresh_interval,
+                "unresolved_models": self.unresolved_models, "last_error": self.last_error}
@@ -1,40 +1,366 @@
 import os
-import requests
 import json
-from typing import Dict, Any, Optional, List
+import asyncio
+import time
+import aiohttp
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple
+from src.services.http_client import AsyncHTTPClient
+from src.services.response_cache import ResponseCache
+from src.services.llm_scheduler import LLMScheduler, PRIORITIES, QueueFullError
+from src.services.retry_policy import RetryPolicy, LatencyTracker, outcome_of
+from src.services.circuit_breaker import CircuitBreakerRegistry, CircuitOpenError
+from src.services.metrics import observe_llm, observe_tokens
+from src.services.tracing import tracer
 
 class OpenRouterService:
     def __init__(self):
         self.api_key = os.environ.get("OPENROUTER_API_KEY")
-        self.base_url = "https://openrouter.ai/api/v1"
+        self.base_url = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        # Cliente HTTP compartido: pool keep-alive, timeouts y concurrencia acotada
+        self.timeout = float(os.environ.get("OPENROUTER_TIMEOUT", 60))
+        self.http = AsyncHTTPClient(
+            pool_size=int(os.environ.get("OPENROUTER_POOL_SIZE", 100)),
+            max_concurrency=int(os.environ.get("OPENROUTER_MAX_CONCURRENCY", 64)),
+            timeout=self.timeout,
+            connect_timeout=float(os.environ.get("OPENROUTER_CONNECT_TIMEOUT", 10)),
+            name="openrouter"
+        )
+        # Caché de respuestas idénticas (modelo + mensajes)
+        self.cache = ResponseCache.from_env()
+        # Límites de concurrencia por modelo y cola con prioridad (lanza QueueFullError)
+        self.scheduler = LLMScheduler.from_env()
+        # Reintentos con backoff y hedging hacia el modelo alternativo (desactivado con percentil 0)
+        self.retry_policy = RetryPolicy.from_env()
+        self.latencies = LatencyTracker()
+        self.hedge_percentile = float(os.environ.get("LLM_HEDGE_PERCENTILE", 0))
+        self.hedge_after = float(os.environ.get("LLM_HEDGE_AFTER", 0))
+        # Circuit breaker por modelo: los modelos degradados se saltan en la cadena de alternativos
+        self.breakers = CircuitBreakerRegistry.from_env()
+        # Id del catálogo de cada nombre configurado ("gpt-4o" -> "openai/gpt-4o"); lo publica el
+        # ModelRegistry. Límites, breakers y caché siguen usando el nombre configurado
+        self.model_ids: Dict[str, str] = {}
 
     def is_available(self) -> bool:
         """Verifica si el servicio de OpenRouter está configurado y disponible"""
         return self.api_key is not None and self.api_key != "your-openrouter-api-key"
 
-    async def generate_response(self, 
-                                user_input: str, 
-                                model: str = "openai/gpt-4o", 
-                                agent_context: Optional[str] = None, 
+    async def generate_response(self,
+                                user_input: str,
+                                model: str = "openai/gpt-4o",
+                                agent_context: Optional[str] = None,
                                 service_results: Optional[Dict] = None,
-                                chat_history: Optional[List[Dict]] = None) -> str:
-        """Genera una respuesta utilizando un modelo de OpenRouter"""
+                                chat_history: Optional[List[Dict]] = None,
+                                timeout: Optional[float] = None,
+                                use_cache: bool = True,
+                                priority: int = PRIORITIES["normal"],
+                                fallback_models: Optional[List[str]] = None,
+                                attempts: Optional[List[Dict]] = None,
+                                outcome: Optional[Dict] = None) -> str:
+        """Genera una respuesta utilizando un modelo de OpenRouter.
+
+        Los fallos transitorios (429, 5xx, timeouts) se reintentan con backoff y, si el
+        modelo sigue fallando, se pasa a los de `fallback_models`. Con hedging activado,
+        si el modelo principal tarda más que el percentil configurado de sus latencias
+        recientes se lanza también el primer alternativo y gana la primera respuesta.
+        Cada intento se añade a `attempts` (modelo, resultado y latencia). Si falla se devuelve
+        un texto de error para el usuario; `outcome` recibe `ok`, `complete` y el `model` que
+        respondió, para distinguir una respuesta real de ese texto.
+        """
+        outcome = outcome if outcome is not None else {}
+        outcome.update(ok=False, complete=False, model=None)
         if not self.is_available():
             return "Error: OPENROUTER_API_KEY no configurada. Por favor, configura tu clave API."
 
+        messages = self._build_messages(user_input, agent_context, service_results, chat_history)
+        cache_key = self.cache.make_key(model, messages) if use_cache else None
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                outcome.update(ok=True, complete=True, model=model)
+                return cached
+
+        attempts = attempts if attempts is not None else []
+        chain = [model] + [fallback for fallback in fallback_models or [] if fallback != model]
+        try:
+            content, used_model = await self._complete_with_fallbacks(chain, messages, timeout, priority, attempts)
+        except QueueFullError:
+            raise
+        except Exception as e:
+            return self._error_message(e, model)
+
+        outcome.update(ok=True, complete=True, model=used_model)
+        # Solo se cachean respuestas del modelo pedido, no de los alternativos
+        if cache_key and used_model == model:
+            self.cache.set(cache_key, content)
+        return content
+
+    async def _request_completion(self, model: str, messages: List[Dict],
+                                  timeout: Optional[float], priority: int) -> str:
+        """Un único intento de completion; lanza la excepción del fallo"""
+        async with self.scheduler.slot(model, priority):
+            data = await self.http.request_json("POST", f"{self.base_url}/chat/completions",
+                                                headers=self.headers,
+                                                json={"model": self.model_ids.get(model, model), "messages": messages},
+                                                timeout=timeout)
+        try:
+            observe_tokens(model, data.get("usage"))
+            return data["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            print(f"Respuesta inesperada de OpenRouter API: {data}")
+            raise ValueError("Respuesta inesperada del modelo de IA")
+
+    async def _complete_with_retries(self, model: str, messages: List[Dict], timeout: Optional[float],
+                                     priority: int, attempts: List[Dict], hedged: bool = False) -> str:
+        """Intenta un modelo, reintentando los errores transitorios según la política"""
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.perf_counter()
+            try:
+                self.breakers.allow(model)
+            except CircuitOpenError as e:
+                self._record_attempt(attempts, model, attempt, started, e, hedged)
+                raise
+            try:
+                content = await self._request_completion(model, messages, timeout, priority)
+            except (asyncio.CancelledError, Exception) as e:
+                self._record_health(model, started, e)
+                self._record_attempt(attempts, model, attempt, started, e, hedged)
+                if (isinstance(e, asyncio.CancelledError) or attempt > self.retry_policy.retries
+                        or not self.retry_policy.is_retryable(e)):
+                    raise
+                await asyncio.sleep(self.retry_policy.delay(attempt, e))
+                continue
+            self._record_health(model, started, None)
+            self._record_attempt(attempts, model, attempt, started, None, hedged)
+            self.latencies.record(model, time.perf_counter() - started)
+            return content
+
+    async def _complete_with_fallbacks(self, chain: List[str], messages: List[Dict], timeout: Optional[float],
+                                       priority: int, attempts: List[Dict]) -> Tuple[str, str]:
+        """Recorre la cadena de modelos; devuelve (contenido, modelo que respondió)"""
+        remaining, last_error = chain, None
+        hedge_after = self._hedge_delay(chain[0]) if len(chain) > 1 else None
+        if hedge_after is not None:
+            try:
+                return await self._hedged(chain[0], chain[1], hedge_after, messages, timeout, priority, attempts)
+            except Exception as e:
+                remaining, last_error = chain[2:], e
+
+        for model in remaining:
+            try:
+                return await self._complete_with_retries(model, messages, timeout, priority, attempts), model
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    async def _hedged(self, primary: str, backup: str, delay: float, messages: List[Dict],
+                      timeout: Optional[float], priority: int, attempts: List[Dict]) -> Tuple[str, str]:
+        """Lanza `backup` si `primary` no ha respondido en `delay` segundos; gana el primero que acierte"""
+        tasks = {asyncio.create_task(self._complete_with_retries(primary, messages, timeout, priority,
+                                                                 attempts)): primary}
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=delay)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), primary
+            last_error = next(iter(done)).exception() if done else None
+
+            tasks[asyncio.create_task(self._complete_with_retries(backup, messages, timeout, priority,
+                                                                  attempts, hedged=True))] = backup
+            pending = {task for task in tasks if not task.done()}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), tasks[task]
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            # Cancelar el perdedor y esperar a que registre su intento
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _hedge_delay(self, model: str) -> Optional[float]:
+        """Segundos tras los que lanzar la petición de respaldo, o None si no hay hedging"""
+        if self.hedge_percentile <= 0:
+            return None
+        delay = self.latencies.percentile(model, self.hedge_percentile)
+        if delay is None:
+            return self.hedge_after or None
+        return delay
+
+    def _record_health(self, model: str, started: float, error: Optional[BaseException]) -> None:
+        """Informa al circuit breaker: solo los fallos del proveedor cuentan como error"""
+        seconds = time.perf_counter() - started
+        if error is None:
+            self.breakers.record(model, True, seconds)
+        elif not isinstance(error, asyncio.CancelledError) and self.retry_policy.is_retryable(error):
+            self.breakers.record(model, False, seconds)
+        else:
+            self.breakers.release(model)
+
+    @staticmethod
+    def _record_attempt(attempts: List[Dict], model: str, attempt: int, started: float,
+                        error: Optional[BaseException], hedged: bool = False) -> None:
+        seconds = time.perf_counter() - started
+        record = {"model": model, "attempt": attempt, "outcome": outcome_of(error),
+                  "latency_ms": round(seconds * 1000, 2)}
+        observe_llm(model, record["outcome"], seconds)
+        end_ns = time.time_ns()
+        tracer.record_span("openrouter.completion", end_ns - int(seconds * 1e9), end_ns,
+                           {"llm.model": model, "llm.attempt": attempt, "llm.outcome": record["outcome"],
+                            "llm.hedged": hedged}, error=error, kind="client")
+        if hedged:
+            record["hedged"] = True
+        attempts.append(record)
+
+    @staticmethod
+    def _error_message(error: BaseException, model: str) -> str:
+        """Texto de error que se devuelve al usuario cuando fallan todos los intentos"""
+        if isinstance(error, CircuitOpenError):
+            print(f"Sin modelos disponibles para {model}: {error}")
+            return "Error: el modelo de IA no está disponible temporalmente. Inténtalo de nuevo en unos segundos."
+        if isinstance(error, asyncio.TimeoutError):
+            print(f"Timeout al llamar a OpenRouter API (modelo {model})")
+            return "Error al conectar con el modelo de IA: tiempo de espera agotado"
+        if isinstance(error, aiohttp.ClientError):
+            print(f"Error al llamar a OpenRouter API: {error}")
+            return f"Error al conectar con el modelo de IA: {error}"
+        return "Error: Respuesta inesperada del modelo de IA."
+
+    async def stream_response(self,
+                              user_input: str,
+                              model: str = "openai/gpt-4o",
+                              agent_context: Optional[str] = None,
+                              service_results: Optional[Dict] = None,
+                              chat_history: Optional[List[Dict]] = None,
+                              timeout: Optional[float] = None,
+                              use_cache: bool = True,
+                              priority: int = PRIORITIES["normal"],
+                              fallback_models: Optional[List[str]] = None,
+                              attempts: Optional[List[Dict]] = None,
+                              outcome: Optional[Dict] = None) -> AsyncIterator[str]:
+        """Genera una respuesta en streaming, devolviendo los fragmentos de texto según llegan.
+
+        Reintentos y modelos alternativos solo se aplican antes del primer fragmento; una
+        vez enviado texto al cliente, un fallo termina el stream con un mensaje de error.
+        `outcome` es como en generate_response; `complete` solo si el stream terminó con [DONE].
+        """
+        outcome = outcome if outcome is not None else {}
+        outcome.update(ok=False, complete=False, model=None)
+        if not self.is_available():
+            yield "Error: OPENROUTER_API_KEY no configurada. Por favor, configura tu clave API."
+            return
+
+        messages = self._build_messages(user_input, agent_context, service_results, chat_history)
+
+        # Un acierto de caché se entrega como un único fragmento
+        cache_key = self.cache.make_key(model, messages) if use_cache else None
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                outcome.update(ok=True, complete=True, model=model)
+                yield cached
+                return
+
+        attempts = attempts if attempts is not None else []
+        chain = [model] + [fallback for fallback in fallback_models or [] if fallback != model]
+        last_error = None
+        for current in chain:
+            attempt = 0
+            while True:
+                attempt += 1
+                started = time.perf_counter()
+                chunks, state, error = [], {"done": False}, None
+                try:
+                    self.breakers.allow(current)
+                except CircuitOpenError as e:
+                    self._record_attempt(attempts, current, attempt, started, e)
+                    last_error = e
+                    break
+                try:
+                    async for delta in self._stream_completion(current, messages, timeout, priority, state):
+                        chunks.append(delta)
+                        yield delta
+                except Exception as e:
+                    error = e
+                except BaseException:
+                    # El cliente cerró el stream o se canceló: no cuenta para el circuito
+                    self.breakers.release(current)
+                    raise
+                self._record_health(current, started, error)
+                self._record_attempt(attempts, current, attempt, started, error)
+
+                if error is None:
+                    outcome.update(ok=True, complete=bool(chunks) and state["done"], model=current)
+                    # Solo se cachean respuestas completas (terminadas con [DONE]) del modelo pedido
+                    if cache_key and chunks and state["done"] and current == model:
+                        self.cache.set(cache_key, "".join(chunks))
+                    return
+                last_error = error
+                if chunks:
+                    yield self._error_message(error, current)
+                    return
+                if attempt > self.retry_policy.retries or not self.retry_policy.is_retryable(error):
+                    break
+                await asyncio.sleep(self.retry_policy.delay(attempt, error))
+
+        if isinstance(last_error, QueueFullError):
+            raise last_error
+        yield self._error_message(last_error, model)
+
+    async def _stream_completion(self, model: str, messages: List[Dict], timeout: Optional[float],
+                                 priority: int, state: Dict) -> AsyncIterator[str]:
+        """Un único intento en streaming; marca state["done"] al recibir [DONE]"""
+        payload = {"model": self.model_ids.get(model, model), "messages": messages, "stream": True,
+                   "usage": {"include": True}}
+        async with self.scheduler.slot(model, priority):
+            async for raw_line in self.http.stream_lines("POST", f"{self.base_url}/chat/completions",
+                                                         headers=self.headers, json=payload, timeout=timeout):
+                line = raw_line.decode("utf-8").strip()
+                # OpenRouter envía comentarios SSE (": OPENROUTER PROCESSING") como keep-alive
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    state["done"] = True
+                    break
+                try:
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        # Con usage.include, OpenRouter envía el consumo en el último fragmento
+                        observe_tokens(model, chunk["usage"])
+                    delta = chunk["choices"][0].get("delta", {}).get("content") if chunk["choices"] else None
+                except (ValueError, KeyError, IndexError, AttributeError):
+                    print(f"Fragmento inesperado de OpenRouter API: {data}")
+                    continue
+                if delta:
+                    yield delta
+
+    def _build_messages(self,
+                        user_input: str,
+                        agent_context: Optional[str] = None,
+                        service_results: Optional[Dict] = None,
+                        chat_history: Optional[List[Dict]] = None) -> List[Dict]:
+        """Construye la lista de mensajes para la API de chat"""
         messages = []
         if agent_context:
             messages.append({"role": "system", "content": agent_context})
-        
+
         if chat_history:
             for msg in chat_history:
-                if msg["type"] == "user":
+                # Acepta tanto mensajes ya formateados (role) como los del frontend (type)
+                if "role" in msg:
+                    messages.append({"role": msg["role"], "content": msg["content"]})
+                elif msg.get("type") == "user":
                     messages.append({"role": "user", "content": msg["content"]})
-                elif msg["type"] == "agent":
+                elif msg.get("type") == "agent":
                     messages.append({"role": "assistant", "content": msg["content"]})
 
         messages.append({"role": "user", "content": user_input})
@@ -46,31 +372,16 @@ class OpenRouterService:
                 service_info += f"- {service_name.capitalize()} Service: {json.dumps(result, indent=2)}\n"
             messages.append({"role": "system", "content": service_info})
 
-        payload = {
-            "model": model,
-            "messages": messages
-        }
-
-        try:
-            response = requests.post(f"{self.base_url}/chat/completions", headers=self.headers, json=payload)
-            response.raise_for_status()  # Lanza una excepción para códigos de estado HTTP erróneos
-            return response.json()["choices"][0]["message"]["content"]
-        except requests.exceptions.RequestException as e:
-            print(f"Error al llamar a OpenRouter API: {e}")
-            return f"Error al conectar con el modelo de IA: {e}"
-        except KeyError:
-            print(f"Respuesta inesperada de OpenRouter API: {response.json()}")
-            return "Error: Respuesta inesperada del modelo de IA."
+        return messages
 
     async def get_models(self) -> List[Dict]:
         """Obtiene la lista de modelos disponibles en OpenRouter"""
         if not self.is_available():
             return []
         try:
-            response = requests.get(f"{self.base_url}/models", headers=self.headers)
-            response.raise_for_status()
-            return response.json()["data"]
-        except requests.exceptions.RequestException as e:
+            data = await self.http.request_json("GET", f"{self.base_url}/models", headers=self.headers)
+            return data["data"]
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError) as e:
             print(f"Error al obtener modelos de OpenRouter: {e}")
             return []
 
@@ -0,0 +1,74 @@
+"""
+Orchestrator - Ejecución concurrente de servicios especializados con timeouts
+"""
+import asyncio
+import time
+from typing import Dict, Any, Iterable, List, Optional
+from src.services.tracing import tracer
+
+
+class ServiceRun:
+    """Conjunto de servicios lanzados en paralelo para una petición"""
+
+    def __init__(self, tasks: Dict[str, asyncio.Task]):
+        self.tasks = tasks
+        self.timings: Dict[str, float] = {}
+
+    async def wait(self, names: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Espera a que terminen los servicios indicados y devuelve sus resultados"""
+        pending = [self.tasks[name] for name in names if name in self.tasks]
+        if pending:
+            await asyncio.wait(pending)
+        return self.results()
+
+    async def finish(self) -> Dict[str, Dict[str, Any]]:
+        """Espera a todos los servicios (cada uno acotado por su timeout)"""
+        return await self.wait(self.tasks)
+
+    def results(self) -> Dict[str, Dict[str, Any]]:
+        """Resultados de los servicios ya terminados, en el orden en que se lanzaron"""
+        return {name: task.result() for name, task in self.tasks.items() if task.done() and not task.cancelled()}
+
+    def cancel(self) -> None:
+        for task in self.tasks.values():
+            task.cancel()
+
+
+class ServiceOrchestrator:
+    """Lanza varios servicios a la vez, cada uno con su propio timeout y cancelación"""
+
+    def __init__(self, services: Dict[str, Any], default_timeout: float = 10.0):
+        self.services = services
+        self.default_timeout = default_timeout
+
+    def available(self, names: Iterable[str]) -> List[str]:
+        """Filtra (sin duplicados y en orden) los servicios existentes y disponibles"""
+        selected = []
+        for name in names:
+            service = self.services.get(name)
+            if service is not None and service.is_available() and name not in selected:
+                selected.append(name)
+        return selected
+
+    def start(self, names: Iterable[str], message: str, context, timeout: Optional[float] = None) -> ServiceRun:
+        """Lanza los servicios indicados como tareas concurrentes"""
+        run = ServiceRun({})
+        for name in self.available(names):
+            run.tasks[name] = asyncio.create_task(
+                self._run_service(run, name, message, context, timeout or self.default_timeout)
+            )
+        return run
+
+    async def _run_service(self, run: ServiceRun, name: str, message: str, context, timeout: float) -> Dict[str, Any]:
+        started = time.perf_counter()
+        with tracer.span(f"service.{name}.process", {"service": name}) as span:
+            try:
+                return await asyncio.wait_for(self.services[name].process(message, context), timeout)
+            except asyncio.TimeoutError as e:
+                span.record_error(e)
+                return {"type": name, "error": f"timeout tras {timeout}s", "processed": False}
+            except Exception as e:
+                span.record_error(e)
+                return {"type": name, "error": str(e), "processed": False}
+            finally:
+                run.timings[name] = round((time.perf_counter() - started) * 1000, 2)
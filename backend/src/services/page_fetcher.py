@@ -0,0 +1,373 @@
+"""
+Page Fetcher - Descarga concurrente de páginas web, extracción de texto y caché condicional en disco
+"""
+import asyncio
+import codecs
+import hashlib
+import ipaddress
+import json
+import os
+import re
+import socket
+import time
+from html.parser import HTMLParser
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import DefaultResolver
+
+from src.services.http_client import AsyncHTTPClient
+from src.services.response_cache import ResponseCache, SQLiteCacheBackend
+from src.services.tracing import tracer
+
+# Etiquetas cuyo contenido no es texto visible
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "canvas", "object"}
+# Etiquetas que separan bloques de texto
+BLOCK_TAGS = {"p", "div", "br", "li", "ul", "ol", "tr", "table", "section", "article", "header", "footer", "nav",
+              "main", "aside", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "hr", "dd", "dt", "form"}
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+TEXT_TYPES = HTML_TYPES + ("text/plain", "text/markdown", "text/xml", "application/xml", "application/json")
+REDIRECT_STATUS = {301, 302, 303, 307, 308}
+
+_URL_IN_TEXT = re.compile(r"https?://[^\s<>\"'`]+", re.IGNORECASE)
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+_SPACES = re.compile(r"[ \t\r\f\v]+")
+
+
+class FetchError(Exception):
+    """La página no se pudo descargar (HTTP de error, tipo no soportado, destino no permitido)"""
+
+
+def find_urls(text: str) -> List[str]:
+    """URLs http(s) que aparecen en un texto, sin la puntuación final ni duplicados"""
+    urls = [match.rstrip(".,;:!?)]}") for match in _URL_IN_TEXT.findall(text)]
+    return list(dict.fromkeys(url for url in urls if urlsplit(url).hostname))
+
+
+def is_public_address(host: str) -> bool:
+    """False para direcciones privadas, locales, reservadas o multicast"""
+    address = ipaddress.ip_address(host)
+    return not (address.is_private or address.is_loopback or address.is_link_local or address.is_reserved
+                or address.is_multicast or address.is_unspecified)
+
+
+class PublicResolver(AbstractResolver):
+    """Resolver del conector que rechaza los hosts con alguna dirección privada o local (SSRF).
+
+    La comprobación se hace sobre las mismas direcciones a las que aiohttp se conecta:
+    resolver por separado y conectar después dejaba pasar un DNS rebinding (primero
+    una IP pública y, en la conexión, 127.0.0.1). El Host y el SNI siguen siendo el nombre.
+    """
+
+    def __init__(self):
+        self._resolver = DefaultResolver()
+
+    async def resolve(self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET):
+        hosts = await self._resolver.resolve(host, port, family)
+        for entry in hosts:
+            if not is_public_address(entry["host"].split("%")[0]):
+                raise FetchError(f"Destino no permitido (red privada o local): {host}")
+        return hosts
+
+    async def close(self) -> None:
+        await self._resolver.close()
+
+
+def normalize_url(url: str) -> str:
+    """Añade https:// si falta el esquema; lanza FetchError si no es una URL http(s) válida"""
+    url = url.strip().strip("<>\"'")
+    if "://" not in url:
+        url = f"https://{url}"
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise FetchError(f"URL no válida: {url}")
+    return parts._replace(fragment="").geturl()
+
+
+class HTMLTextExtractor(HTMLParser):
+    """Texto visible, título y enlaces de un HTML que se recibe por fragmentos.
+
+    Se alimenta con feed() según llegan los bytes decodificados; `done` se activa al
+    alcanzar `max_chars` para que el llamador deje de leer la respuesta.
+    """
+
+    def __init__(self, max_chars: int = 8000, max_links: int = 50):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.max_links = max_links
+        self.title = ""
+        self.links: List[Dict[str, str]] = []
+        self.done = False
+        self._parts: List[str] = []
+        self._chars = 0
+        self._skip_depth = 0
+        self._in_title = False
+        self._link: Optional[Dict[str, str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "a" and len(self.links) < self.max_links:
+            href = dict(attrs).get("href") or ""
+            if href and not href.startswith(("#", "javascript:", "mailto:", "tel:")):
+                self._link = {"url": href, "text": ""}
+        if tag in BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "title":
+            self._in_title = False
+        elif tag == "a" and self._link is not None:
+            self._link["text"] = " ".join(self._link["text"].split())
+            self.links.append(self._link)
+            self._link = None
+        if tag in BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._in_title:
+            self.title += data
+            return
+        if self._link is not None:
+            self._link["text"] += data
+        if self.done:
+            return
+        text = _SPACES.sub(" ", data)
+        if text.strip():
+            text = text[:self.max_chars - self._chars]
+            self._parts.append(text)
+            self._chars += len(text)
+            self.done = self._chars >= self.max_chars
+
+    @property
+    def text(self) -> str:
+        lines = (line.strip() for line in "".join(self._parts).split("\n"))
+        return _BLANK_LINES.sub("\n\n", "\n".join(line for line in lines if line)).strip()
+
+
+class PageFetcher:
+    """Descarga páginas con un cliente HTTP compartido y las convierte en texto.
+
+    - Varias URLs se descargan a la vez, con un máximo de `per_host` por host.
+    - El cuerpo se lee por bloques y se extrae el texto sobre la marcha; se deja de
+      leer al llegar a `max_bytes` descargados o a `max_chars` de texto.
+    - Las páginas se guardan en una caché SQLite con su ETag/Last-Modified: durante
+      `fresh_for` segundos se sirven sin red y después se revalidan con un GET
+      condicional (un 304 reutiliza el texto guardado).
+    - Por defecto no se accede a direcciones privadas o locales (WEB_ALLOW_PRIVATE).
+    """
+
+    def __init__(self, http: Optional[AsyncHTTPClient] = None, cache_path: Optional[str] = None,
+                 per_host: int = 4, max_bytes: int = 2 * 1024 * 1024, max_chars: int = 8000,
+                 timeout: float = 15.0, fresh_for: float = 300.0, cache_ttl: float = 7 * 24 * 3600,
+                 cache_max_bytes: int = 100 * 1024 * 1024, max_redirects: int = 5,
+                 allow_private: bool = False, user_agent: str = "RALT-Agent/2.0 (+https://github.com/RussellRalt/ralt-agent)"):
+        self.http = http or AsyncHTTPClient(pool_size=50, max_concurrency=32, timeout=timeout, name="web")
+        if not allow_private:
+            # Los nombres se comprueban al resolverlos en el conector, justo antes de conectar
+            self.http.resolver_factory = PublicResolver
+        self.cache_path = cache_path
+        self.per_host = per_host
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.timeout = timeout
+        self.fresh_for = fresh_for
+        self.cache_ttl = cache_ttl
+        self.cache_max_bytes = cache_max_bytes
+        self.max_redirects = max_redirects
+        self.allow_private = allow_private
+        self.user_agent = user_agent
+        self._cache: Optional[ResponseCache] = None
+        # Semáforos por host; se crean en el loop de E/S y se rehacen si el cliente cambia de loop
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._slots_loop = None
+        self.conditional_requests = 0
+        self.not_modified = 0
+
+    @classmethod
+    def from_env(cls) -> "PageFetcher":
+        timeout = float(os.environ.get("WEB_FETCH_TIMEOUT", 15))
+        default_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "database", "page_cache.db")
+        return cls(
+            http=AsyncHTTPClient(pool_size=int(os.environ.get("WEB_POOL_SIZE", 50)),
+                                 max_concurrency=int(os.environ.get("WEB_MAX_CONCURRENCY", 32)),
+                                 timeout=timeout, name="web"),
+            cache_path=os.environ.get("WEB_CACHE_PATH", default_path)
+            if os.environ.get("WEB_CACHE_ENABLED", "true").lower() != "false" else None,
+            per_host=int(os.environ.get("WEB_PER_HOST", 4)),
+            max_bytes=int(os.environ.get("WEB_MAX_BYTES", 2 * 1024 * 1024)),
+            max_chars=int(os.environ.get("WEB_MAX_CHARS", 8000)),
+            timeout=timeout,
+            fresh_for=float(os.environ.get("WEB_CACHE_FRESH", 300)),
+            cache_ttl=float(os.environ.get("WEB_CACHE_TTL", 7 * 24 * 3600)),
+            allow_private=os.environ.get("WEB_ALLOW_PRIVATE", "false").lower() == "true"
+        )
+
+    def get_cache(self) -> Optional[ResponseCache]:
+        """Caché de páginas (se abre bajo demanda; None si está desactivada)"""
+        if self._cache is None and self.cache_path:
+            backend = SQLiteCacheBackend(self.cache_path, max_entries=50000,
+                                         max_bytes=self.cache_max_bytes, table="web_pages")
+            self._cache = ResponseCache(backend, ttl=self.cache_ttl)
+        return self._cache
+
+    @staticmethod
+    def cache_key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    async def fetch_many(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """Descarga varias URLs en paralelo (respetando el límite por host), en el orden recibido"""
+        return list(await asyncio.gather(*(self.fetch(url) for url in dict.fromkeys(urls))))
+
+    async def fetch(self, url: str) -> Dict[str, Any]:
+        """Texto de una página; nunca lanza: los fallos se devuelven en "error" """
+        started = time.perf_counter()
+        with tracer.span("web.fetch", {"url": url}) as span:
+            try:
+                url = normalize_url(url)
+            except FetchError as e:
+                return {"url": url, "error": str(e), "elapsed_ms": 0.0}
+
+            cache = self.get_cache()
+            key = self.cache_key(url)
+            cached = None
+            if cache:
+                entry = await asyncio.to_thread(cache.get, key)
+                cached = json.loads(entry) if entry else None
+            if cached and time.time() - cached["fetched_at"] < self.fresh_for:
+                span.set_attribute("cache", "hit")
+                return self._result(cached, "hit", started)
+
+            try:
+                page = await self.http.run(self._fetch_on_loop, url, cached)
+            except (aiohttp.ClientError, asyncio.TimeoutError, FetchError, OSError, ValueError) as e:
+                error = str(e) or type(e).__name__
+                span.set_attribute("error", error)
+                if cached:
+                    # Sin red o error del servidor: mejor el texto anterior que nada
+                    return {**self._result(cached, "stale", started), "error": error}
+                return {"url": url, "error": error, "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+            if page is None:
+                self.not_modified += 1
+                page, state = cached, "revalidated"
+            else:
+                page["url"], state = url, "miss"
+            page["fetched_at"] = time.time()
+            if cache:
+                await asyncio.to_thread(cache.set, key, json.dumps(page, ensure_ascii=False))
+            span.set_attributes({"cache": state, "bytes_read": page.get("bytes_read", 0)})
+            return self._result(page, state, started)
+
+    def _result(self, page: Dict[str, Any], cache_state: str, started: float) -> Dict[str, Any]:
+        result = {key: value for key, value in page.items() if key not in ("etag", "last_modified", "fetched_at")}
+        result.update(cache=cache_state, elapsed_ms=round((time.perf_counter() - started) * 1000, 2))
+        return result
+
+    def _host_slot(self, host: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            self._host_slots, self._slots_loop = {}, loop
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.per_host)
+        return self._host_slots[host]
+
+    def _check_target(self, url: str) -> None:
+        """Impide acceder a la red interna con IPs literales (SSRF); los nombres los filtra PublicResolver"""
+        if self.allow_private:
+            return
+        host = urlsplit(url).hostname
+        try:
+            public = is_public_address(host)
+        except ValueError:
+            return  # es un nombre: aiohttp solo se salta el resolver con IPs literales
+        if not public:
+            raise FetchError(f"Destino no permitido (red privada o local): {host}")
+
+    async def _fetch_on_loop(self, url: str, cached: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Sigue las redirecciones a mano (comprobando cada destino); None si el servidor responde 304"""
+        async with self._host_slot(urlsplit(url).hostname):
+            current = url
+            for _ in range(self.max_redirects + 1):
+                self._check_target(current)
+                headers = {"User-Agent": self.user_agent, "Accept": "text/html,application/xhtml+xml,text/plain;q=0.9,*/*;q=0.5"}
+                if cached and cached.get("final_url") == current:
+                    if cached.get("etag"):
+                        headers["If-None-Match"] = cached["etag"]
+                    if cached.get("last_modified"):
+                        headers["If-Modified-Since"] = cached["last_modified"]
+                    self.conditional_requests += "If-None-Match" in headers or "If-Modified-Since" in headers
+                kind, value = await self.http.request_with("GET", current, self._read_response, headers=headers,
+                                                           timeout=self.timeout, allow_redirects=False)
+                if kind == "redirect":
+                    current = urljoin(current, value)
+                    continue
+                return value
+            raise FetchError(f"Demasiadas redirecciones desde {url}")
+
+    async def _read_response(self, response: aiohttp.ClientResponse) -> Tuple[str, Any]:
+        """Lee la respuesta por bloques extrayendo el texto; para al agotar el presupuesto"""
+        if response.status in REDIRECT_STATUS and response.headers.get("Location"):
+            return "redirect", response.headers["Location"]
+        if response.status == 304:
+            return "not_modified", None
+        if response.status >= 400:
+            raise FetchError(f"HTTP {response.status} en {response.url}")
+
+        content_type = response.content_type or "text/html"
+        if content_type not in TEXT_TYPES:
+            raise FetchError(f"Tipo de contenido no soportado: {content_type}")
+
+        decoder = codecs.getincrementaldecoder(self._charset(response))(errors="replace")
+        extractor = HTMLTextExtractor(self.max_chars) if content_type in HTML_TYPES else None
+        text_parts, text_chars, bytes_read, truncated = [], 0, 0, False
+        async for chunk in response.content.iter_chunked(16 * 1024):
+            bytes_read += len(chunk)
+            data = decoder.decode(chunk)
+            if extractor is not None:
+                extractor.feed(data)
+                full = extractor.done
+            else:
+                text_parts.append(data[:self.max_chars - text_chars])
+                text_chars += len(text_parts[-1])
+                full = text_chars >= self.max_chars
+            if full or bytes_read >= self.max_bytes:
+                truncated = True
+                break
+
+        if extractor is not None:
+            extractor.close()
+            title, text = " ".join(extractor.title.split()), extractor.text
+            links = [{"url": urljoin(str(response.url), link["url"]), "text": link["text"]}
+                     for link in extractor.links]
+        else:
+            title, text, links = "", "".join(text_parts).strip(), []
+        return "ok", {
+            "final_url": str(response.url), "status": response.status, "content_type": content_type,
+            "title": title, "text": text, "links": links, "truncated": truncated, "bytes_read": bytes_read,
+            "etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")
+        }
+
+    @staticmethod
+    def _charset(response: aiohttp.ClientResponse) -> str:
+        charset = response.charset or "utf-8"
+        try:
+            codecs.lookup(charset)
+            return charset
+        except LookupError:
+            return "utf-8"
+
+    def stats(self) -> Dict[str, Any]:
+        cache = self.get_cache()
+        return {"cache": cache.stats() if cache else {"enabled": False},
+                "conditional_requests": self.conditional_requests, "not_modified": self.not_modified,
+                "per_host": self.per_host, "max_bytes": self.max_bytes, "max_chars": self.max_chars,
+                "in_flight": self.http.in_flight}
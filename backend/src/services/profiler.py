@@ -0,0 +1,188 @@
+"""
+Profiler - Perfilado por muestreo de peticiones individuales en formato de pilas colapsadas
+"""
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+# Hojas de pila de hilos ociosos (pools esperando trabajo, temporizadores): no aportan nada
+IDLE_LEAVES = {("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("thread.py", "_worker")}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    # Rutas relativas al paquete de la aplicación; basename para librerías y stdlib
+    marker = f"{os.sep}src{os.sep}"
+    short = "src/" + filename.split(marker, 1)[1] if marker in filename else os.path.basename(filename)
+    return f"{code.co_name} ({short}:{code.co_firstlineno})".replace(";", ",")
+
+
+class ProfileSession:
+    """Muestreo de las pilas de todos los hilos mientras dura una petición.
+
+    Se muestrean todos los hilos y no solo el de la petición porque el trabajo de una
+    petición de chat se reparte entre el hilo/loop de la vista, el loop del cliente HTTP
+    (espera a OpenRouter) y el pool de procesos/hilos de VisionService. El resultado es
+    de tiempo de reloj: una espera de red aparece como tiempo en select().
+    """
+
+    def __init__(self, profiler: "RequestProfiler", method: str, path: str, reason: str):
+        self.profiler = profiler
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name=f"profiler-{self.id}", daemon=True)
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        self._thread.start()
+
+    def _sample(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.profiler.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.profiler.max_depth:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names.update({thread.ident: thread.name.replace(";", ",").replace(" ", "_")
+                                  for thread in threading.enumerate()})
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def finish(self, status: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Detiene el muestreo y guarda el perfil; devuelve sus metadatos"""
+        self._stop.set()
+        self._thread.join()
+        duration = time.perf_counter() - self._started
+        meta = {
+            "id": self.id, "method": self.method, "path": self.path, "status": status, "reason": self.reason,
+            "started_at": self.started_at, "duration_ms": round(duration * 1000, 2),
+            "cpu_ms": round((time.process_time() - self._cpu_started) * 1000, 2),
+            "interval_ms": self.profiler.interval * 1000, "samples": sum(self.samples.values())
+        }
+        self.profiler.save(self, meta)
+        return meta
+
+
+class RequestProfiler:
+    """Perfilado opt-in de peticiones: por cabecera `X-Profile: 1` o por muestreo aleatorio.
+
+    Desactivado no cuesta nada más que comprobar `enabled`. Solo hay un perfil en curso a
+    la vez (el muestreo de todos los hilos mezclaría peticiones concurrentes); el resto
+    de peticiones se atienden sin perfilar. Cada perfil se guarda en `directory` como
+    `<id>.folded` (pilas colapsadas, para flamegraph.pl o speedscope.app) junto con
+    `<id>.json` con sus metadatos; se conservan los `max_profiles` más recientes.
+    """
+
+    def __init__(self, directory: str, enabled: bool = False, sample_rate: float = 0.0,
+                 interval: float = 0.005, max_depth: int = 128, max_profiles: int = 50,
+                 admin_token: Optional[str] = None):
+        self.directory = directory
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_depth = max_depth
+        self.max_profiles = max_profiles
+        self.admin_token = admin_token
+        self._active: Optional[ProfileSession] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RequestProfiler":
+        default_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "database", "profiles")
+        profiler = cls(
+            directory=os.environ.get("PROFILE_DIR", default_dir),
+            enabled=os.environ.get("PROFILING_ENABLED", "false").lower() == "true",
+            sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0)),
+            interval=float(os.environ.get("PROFILE_INTERVAL_MS", 5)) / 1000,
+            max_profiles=int(os.environ.get("PROFILE_MAX_FILES", 50)),
+            admin_token=os.environ.get("PROFILE_ADMIN_TOKEN") or None
+        )
+        if profiler.enabled and profiler.admin_token is None:
+            print("Perfilado sin PROFILE_ADMIN_TOKEN: solo por muestreo; la cabecera X-Profile y "
+                  "/api/admin/profiles quedan desactivados")
+        return profiler
+
+    def authorized(self, token: Optional[str]) -> bool:
+        """La cabecera X-Admin-Token debe coincidir con PROFILE_ADMIN_TOKEN (sin token, nadie)"""
+        return self.admin_token is not None and hmac.compare_digest(token or "", self.admin_token)
+
+    def start(self, method: str, path: str, header: Optional[str],
+              token: Optional[str] = None) -> Optional[ProfileSession]:
+        """Empieza a perfilar la petición si lo pide la cabecera o le toca por muestreo"""
+        if header and header.lower() in ("1", "true", "yes") and self.authorized(token):
+            reason = "header"
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            reason = "sampled"
+        else:
+            return None
+        with self._lock:
+            if self._active is not None:
+                return None
+            self._active = ProfileSession(self, method, path, reason)
+            return self._active
+
+    def save(self, session: ProfileSession, meta: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._active is session:
+                self._active = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{session.id}.folded"), "w", encoding="utf-8") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in session.samples.most_common())
+            with open(os.path.join(self.directory, f"{session.id}.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            self._prune()
+        except OSError as e:
+            print(f"No se pudo guardar el perfil {session.id}: {e}")
+
+    def _prune(self) -> None:
+        for meta in self.list()[self.max_profiles:]:
+            for extension in ("folded", "json"):
+                try:
+                    os.remove(os.path.join(self.directory, f"{meta['id']}.{extension}"))
+                except FileNotFoundError:
+                    pass
+
+    def list(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Metadatos de los perfiles guardados, del más reciente al más antiguo"""
+        profiles = []
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(".json")]
+        except FileNotFoundError:
+            return []
+        for name in names:
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        profiles.sort(key=lambda meta: meta.get("started_at", 0), reverse=True)
+        return profiles[:limit] if limit else profiles
+
+    def path_for(self, profile_id: str) -> Optional[str]:
+        """Ruta del fichero .folded de un perfil (None si el id no es válido o no existe)"""
+        if not re.fullmatch(r"[0-9a-f]{12}", profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.folded")
+        return path if os.path.exists(path) else None
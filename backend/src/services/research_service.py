@@ -1,37 +1,50 @@
-import json
+import asyncio
+import os
 from typing import Dict, Any, Optional
+from src.services.document_index import DocumentIndex
+from src.services.intent_classifier import intent_classifier
+from src.services.tracing import tracer
 
 class ResearchService:
-    def __init__(self):
-        pass
+    def __init__(self, index: Optional[DocumentIndex] = None):
+        # Índice local de documentos (ficheros, páginas descargadas y respuestas anteriores)
+        self.index = index
+        self.top_k = int(os.environ.get("RESEARCH_TOP_K", 5))
 
     def is_available(self) -> bool:
         """Verifica si el servicio de investigación está disponible"""
         return True
 
     async def process(self, user_input: str, context: Optional[Dict] = None) -> Dict[str, Any]:
-        """Procesa una solicitud de investigación"""
+        """Procesa una solicitud de investigación recuperando pasajes relevantes del índice local"""
         # Detectar tipo de investigación
-        research_types = {
-            "academic": ["académico", "paper", "estudio", "investigación científica"],
-            "market": ["mercado", "competencia", "industria", "análisis de mercado"],
-            "technical": ["técnico", "tecnología", "implementación", "arquitectura"],
-            "historical": ["historia", "histórico", "evolución", "cronología"]
-        }
-        
-        detected_type = "general"
-        for research_type, keywords in research_types.items():
-            if any(keyword in user_input.lower() for keyword in keywords):
-                detected_type = research_type
-                break
+        detected_type = intent_classifier.classify(user_input).label("research.type", "general")
         
         # Extraer tema de investigación
         topic = user_input.replace("investigar", "").replace("analizar", "").strip()
-        
+
+        passages = []
+        if self.index is not None:
+            with tracer.span("research.search", {"top_k": self.top_k}) as span:
+                passages = await asyncio.to_thread(self.index.search, topic or user_input, self.top_k)
+                span.set_attribute("results", len(passages))
+
+        if passages:
+            # Los pasajes van en `result`, que llega al prompt de OpenRouter con el resto de resultados
+            result = f"Fragmentos de documentos locales relevantes para '{topic}':\n\n" + "\n\n".join(
+                f"[{i}] {passage['title'] or passage['doc_id']}"
+                f"{' (' + passage['url'] + ')' if passage['url'] else ''}\n{passage['text']}"
+                for i, passage in enumerate(passages, 1))
+        else:
+            result = f"No hay documentos locales relevantes para '{topic}'; responde con tu propio conocimiento."
+
         return {
             "type": "research",
             "research_type": detected_type,
             "topic": topic,
-            "result": f"Iniciando investigación {detected_type} sobre: \'{topic}\'. Recopilando información de múltiples fuentes."
+            "sources": [{key: passage[key] for key in ("doc_id", "title", "url", "source", "score")}
+                        for passage in passages],
+            # La respuesta la redacta el LLM a partir de los fragmentos recuperados
+            "needs_llm": True,
+            "result": result
         }
-
@@ -0,0 +1,209 @@
+"""
+Response Cache - Caché de respuestas del LLM con TTL y expulsión LRU
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List
+
+
+class MemoryCacheBackend:
+    """Almacén en memoria del proceso (OrderedDict como lista LRU)"""
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 50 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, size = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (value, time.time() + ttl, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "entries": len(self._entries), "bytes": self._bytes,
+                "max_entries": self.max_entries, "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+
+class SQLiteCacheBackend:
+    """Almacén en un fichero SQLite local, compartido entre workers del mismo host"""
+
+    def __init__(self, path: str, max_entries: int = 10000, max_bytes: int = 200 * 1024 * 1024,
+                 table: str = "response_cache"):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.table}_last_access ON {self.table} (last_access)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, last_access, size)"
+                " VALUES (?, ?, ?, ?, ?)", (key, value, now + ttl, now, size)
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        """Elimina entradas caducadas y, si se superan los límites, las menos usadas recientemente"""
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+        entries, total = self._conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        while entries > self.max_entries or total > self.max_bytes:
+            row = self._conn.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (row[0],))
+            entries, total = entries - 1, total - row[1]
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+            ).fetchone()
+        return {"backend": "sqlite", "path": self.path, "table": self.table, "entries": entries, "bytes": total,
+                "max_entries": self.max_entries, "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+
+class ResponseCache:
+    """Caché de respuestas idénticas del LLM, indexada por hash de modelo + mensajes"""
+
+    def __init__(self, backend=None, ttl: float = 3600, enabled: bool = True):
+        self.backend = backend or MemoryCacheBackend()
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        """Crea la caché según las variables de entorno RESPONSE_CACHE_*"""
+        backend_name = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")
+        max_entries = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+        max_bytes = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+        ttl = float(os.environ.get("RESPONSE_CACHE_TTL", 3600))
+
+        if backend_name == "sqlite":
+            default_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "database", "response_cache.db")
+            backend = SQLiteCacheBackend(os.environ.get("RESPONSE_CACHE_PATH", default_path),
+                                         max_entries=max_entries, max_bytes=max_bytes)
+        else:
+            backend = MemoryCacheBackend(max_entries=max_entries, max_bytes=max_bytes)
+        return cls(backend, ttl=ttl, enabled=backend_name != "none")
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict]) -> str:
+        """Hash estable del modelo y los mensajes normalizados"""
+        normalized = [
+            {"role": str(msg.get("role", "")).strip().lower(), "content": str(msg.get("content", "")).strip()}
+            for msg in messages
+        ]
+        raw = json.dumps({"model": model, "messages": normalized}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(key)
+        except sqlite3.Error as e:
+            print(f"Error leyendo la caché de respuestas: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        if not self.enabled:
+            return
+        try:
+            self.backend.set(key, value, self.ttl)
+        except sqlite3.Error as e:
+            print(f"Error escribiendo en la caché de respuestas: {e}")
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos/fallos y estado del almacén"""
+        lookups = self.hits + self.misses
+        stats = {
+            "enabled": self.enabled,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+        if self.enabled:
+            stats.update(self.backend.stats())
+        return stats
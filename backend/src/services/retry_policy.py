@@ -0,0 +1,99 @@
+"""
+Retry Policy - Reintentos con backoff exponencial y jitter, y latencias para hedging
+"""
+import asyncio
+import os
+import random
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+import aiohttp
+
+# Códigos HTTP que merece la pena reintentar (límite de tasa y errores del proveedor)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def outcome_of(error: Optional[BaseException]) -> str:
+    """Etiqueta corta del resultado de un intento, para metadata"""
+    if error is None:
+        return "ok"
+    if getattr(error, "outcome", None):
+        return error.outcome
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(error, aiohttp.ClientResponseError):
+        return f"http_{error.status}"
+    if isinstance(error, aiohttp.ClientError):
+        return "connection_error"
+    return type(error).__name__
+
+
+class RetryPolicy:
+    """Cuántas veces y cuánto esperar antes de repetir una llamada fallida.
+
+    Usa "full jitter" (espera aleatoria entre 0 y base·2^n, acotada a max_delay) para
+    que los reintentos de muchas peticiones no lleguen a la vez, y respeta Retry-After
+    cuando el proveedor lo envía.
+    """
+
+    def __init__(self, retries: int = 2, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        return cls(
+            retries=int(os.environ.get("LLM_RETRIES", 2)),
+            base_delay=float(os.environ.get("LLM_RETRY_BASE_DELAY", 0.5)),
+            max_delay=float(os.environ.get("LLM_RETRY_MAX_DELAY", 8))
+        )
+
+    def is_retryable(self, error: BaseException) -> bool:
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status in RETRYABLE_STATUS
+        return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))
+
+    def delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """Espera antes del reintento número `attempt` (empezando en 1)"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    @staticmethod
+    def _retry_after(error: Optional[BaseException]) -> Optional[float]:
+        headers = getattr(error, "headers", None)
+        if not headers:
+            return None
+        try:
+            return float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return None
+
+
+class LatencyTracker:
+    """Latencias recientes con éxito por modelo, para calcular el umbral de hedging"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model: str, pct: float) -> Optional[float]:
+        """Percentil `pct` (0-100) de las latencias del modelo, o None si hay pocas muestras"""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
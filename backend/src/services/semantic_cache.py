@@ -0,0 +1,392 @@
+"""
+Semantic Cache - Respuestas anteriores indexadas por embedding del mensaje, para preguntas parecidas
+"""
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from typing import Dict, Any, List, NamedTuple, Optional
+
+import numpy as np
+
+from src.services.document_index import STOPWORDS
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+
+def strip_accents(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+# Interrogativos: se conservan porque distinguen preguntas ("cuándo nació" / "dónde nació")
+QUESTION_WORDS = {"que", "como", "cual", "cuando", "donde", "quien", "por", "what", "how", "which", "when", "where",
+                  "who", "why"}
+# Negaciones: se conservan porque invierten la pregunta ("es seguro" / "no es seguro")
+NEGATIONS = {"no", "ni", "sin", "nunca", "jamas", "tampoco", "not", "never", "without", "nor"}
+# Palabras vacías y fórmulas de petición que no cambian la pregunta ("dime", "explícame"...)
+EMBEDDING_STOPWORDS = {strip_accents(word) for word in STOPWORDS} - QUESTION_WORDS - NEGATIONS | {
+    "dime", "dame", "explica", "explicame", "explicalo", "quiero", "saber", "puedes", "podrias", "favor",
+    "please", "tell", "me", "explain", "give", "can", "you", "s"}
+
+
+class HashingEmbedder:
+    """Embeddings sin modelo: palabras, pares de palabras y trigramas de caracteres
+    proyectados con el truco del hashing (con signo) y normalizados.
+
+    Detecta reformulaciones con las mismas palabras en otro orden, con otras palabras
+    vacías, plurales o erratas; para sinónimos hace falta un modelo (SEMANTIC_CACHE_MODEL).
+    Tampoco distingue el sentido ("celsius a fahrenheit" / "fahrenheit a celsius" se
+    parecen un 0.92), así que solo aporta contexto: nunca responde desde la caché.
+    """
+
+    name = "hashing-v2"
+    can_answer = False
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _features(self, text: str):
+        words = [word for word in _WORDS.findall(strip_accents(text.lower())) if word not in EMBEDDING_STOPWORDS]
+        for word in words:
+            yield word, 1.0
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                yield "#" + padded[i:i + 3], 0.35
+        for first, second in zip(words, words[1:]):
+            yield f"{first} {second}", 0.5
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            indices, weights = [], []
+            for feature, weight in self._features(text):
+                digest = zlib.crc32(feature.encode("utf-8"))
+                indices.append(digest % self.dim)
+                weights.append(weight if digest & 0x80000000 else -weight)
+            if indices:
+                vector = np.bincount(indices, weights=weights, minlength=self.dim)
+                norm = np.linalg.norm(vector)
+                if norm:
+                    vectors[row] = vector / norm
+        return vectors
+
+
+class SentenceTransformerEmbedder:
+    """Modelo de sentence-transformers en CPU (dependencia opcional, como el del router de agentes)"""
+
+    can_answer = True
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.name = model_name
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, normalize_embeddings=True).astype(np.float32)
+
+
+class VectorIndex:
+    """Vectores normalizados en float16 con búsqueda por similitud coseno.
+
+    Hasta `train_size` entradas se recorren todas. A partir de ahí se agrupan con
+    k-means en ~2·√n listas (IVF) y cada búsqueda solo puntúa las `nprobe` listas
+    con el centroide más parecido; el agrupamiento se rehace cuando el número de
+    entradas se duplica. Con capacidad llena, cada alta sustituye a la más antigua.
+
+    El llamador serializa add/install/search; train solo lee los vectores, así que puede
+    ejecutarse sin bloquear las búsquedas mientras no haya altas.
+    """
+
+    def __init__(self, dim: int, capacity: int = 100_000, nprobe: int = 8, train_size: int = 2048):
+        self.dim = dim
+        self.capacity = capacity
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.count = 0
+        self.trained_on = 0
+        self._next = 0
+        self._vectors = np.zeros((min(capacity, 1024), dim), dtype=np.float16)
+        self._created = np.zeros(len(self._vectors), dtype=np.float64)
+        self._scopes = np.zeros(len(self._vectors), dtype=np.int16)
+        self._lists = np.zeros(len(self._vectors), dtype=np.int32)
+        self._centroids: Optional[np.ndarray] = None
+
+    def _grow(self) -> None:
+        size = min(self.capacity, len(self._vectors) * 2)
+        for name in ("_vectors", "_created", "_scopes", "_lists"):
+            old = getattr(self, name)
+            new = np.zeros((size,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, vector: np.ndarray, scope: int, created: float, slot: Optional[int] = None) -> int:
+        """Guarda un vector y devuelve su posición (la de la entrada más antigua si está lleno)"""
+        if slot is None:
+            slot = self._next
+            self._next = (self._next + 1) % self.capacity
+        while slot >= len(self._vectors):
+            self._grow()
+        self._vectors[slot] = vector
+        self._created[slot] = created
+        self._scopes[slot] = scope
+        if self._centroids is not None:
+            self._lists[slot] = int(np.argmax(self._centroids @ vector))
+        self.count = max(self.count, slot + 1)
+        return slot
+
+    def needs_training(self) -> bool:
+        return self.count >= self.train_size and self.count >= 2 * self.trained_on
+
+    def train(self, iterations: int = 8, sample: int = 65536) -> tuple:
+        """k-means esférico sobre una muestra y lista de cada entrada; se activa con install()"""
+        n = self.count
+        nlist = max(8, int(2 * n ** 0.5))
+        rng = np.random.default_rng(0)
+        rows = rng.choice(n, min(n, max(sample, nlist * 8)), replace=False)
+        data = self._vectors[rows].astype(np.float32)
+        centroids = data[rng.choice(len(data), nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, data)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Las listas vacías conservan su centroide anterior
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+        lists = np.empty(len(self._lists), dtype=np.int32)
+        for start in range(0, n, 16384):
+            block = self._vectors[start:min(n, start + 16384)].astype(np.float32)
+            lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return centroids, lists, n
+
+    def install(self, trained: tuple) -> None:
+        centroids, lists, n = trained
+        self._centroids, self._lists, self.trained_on = centroids, lists, n
+
+    def search(self, vector: np.ndarray, k: int = 5, scope: Optional[int] = None,
+               min_created: float = 0.0) -> List[tuple]:
+        """Las k entradas más parecidas como (posición, similitud), de mayor a menor"""
+        n = self.count
+        if n == 0:
+            return []
+        centroids, lists = self._centroids, self._lists
+        if centroids is None:
+            candidates = np.arange(n)
+        else:
+            probes = np.argpartition(centroids @ vector, -min(self.nprobe, len(centroids)))[-self.nprobe:]
+            selected = np.zeros(len(centroids), dtype=bool)
+            selected[probes] = True
+            candidates = np.flatnonzero(selected[lists[:n]])
+        if scope is not None:
+            candidates = candidates[self._scopes[candidates] == scope]
+        if min_created:
+            candidates = candidates[self._created[candidates] >= min_created]
+        if len(candidates) == 0:
+            return []
+        scores = self._vectors[candidates].astype(np.float32) @ vector
+        best = np.argpartition(scores, -min(k, len(scores)))[-k:]
+        best = best[np.argsort(scores[best])[::-1]]
+        return [(int(candidates[i]), float(scores[i])) for i in best]
+
+    def memory_bytes(self) -> int:
+        arrays = (self._vectors, self._created, self._scopes, self._lists)
+        return sum(array.nbytes for array in arrays) + (self._centroids.nbytes if self._centroids is not None else 0)
+
+
+class SemanticMatch(NamedTuple):
+    message: str
+    answer: str
+    similarity: float
+    answered: bool
+
+
+class SemanticCache:
+    """Caché de respuestas por similitud del mensaje (complementa la caché exacta de ResponseCache).
+
+    Cada respuesta del LLM a una pregunta sin historial se guarda con el embedding de
+    la pregunta, por agente y modelo. Una pregunta nueva con similitud ≥ `answer_threshold`
+    se responde con la respuesta guardada sin llamar a OpenRouter (solo con un embedder que
+    pueda responder, es decir, un modelo); con similitud ≥ `context_threshold` la pareja
+    anterior se pasa al LLM como contexto.
+
+    Los vectores viven en memoria (VectorIndex); las preguntas y respuestas en SQLite,
+    de donde se recargan al arrancar. Las altas se encolan y las aplica un hilo aparte.
+    """
+
+    def __init__(self, path: str, embedder=None, model_name: Optional[str] = None,
+                 answer_threshold: float = 0.9, context_threshold: float = 0.75, ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 100_000, nprobe: int = 8, enabled: bool = True):
+        self.path = path
+        self.embedder = embedder
+        self.model_name = model_name
+        self.answer_threshold = answer_threshold
+        self.context_threshold = context_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.nprobe = nprobe
+        self.enabled = enabled
+        self.index: Optional[VectorIndex] = None
+        self.lookups = 0
+        self.answered = 0
+        self.context_hits = 0
+        self.lookup_ms = 0.0
+        self.last_error: Optional[str] = None
+        self._scopes: Dict[str, int] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "SemanticCache":
+        default_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "database", "semantic_cache.db")
+        return cls(os.environ.get("SEMANTIC_CACHE_PATH", default_path),
+                   model_name=os.environ.get("SEMANTIC_CACHE_MODEL") or None,
+                   answer_threshold=float(os.environ.get("SEMANTIC_CACHE_ANSWER_THRESHOLD", 0.9)),
+                   context_threshold=float(os.environ.get("SEMANTIC_CACHE_CONTEXT_THRESHOLD", 0.75)),
+                   ttl=float(os.environ.get("SEMANTIC_CACHE_TTL", 7 * 24 * 3600)),
+                   max_entries=int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 100_000)),
+                   nprobe=int(os.environ.get("SEMANTIC_CACHE_NPROBE", 8)),
+                   enabled=os.environ.get("SEMANTIC_CACHE_ENABLED", "true").lower() == "true")
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self.index is not None
+
+    def start(self) -> None:
+        """Arranca (una sola vez) el hilo que carga el modelo y las entradas guardadas y aplica las altas"""
+        if not self.enabled or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="semantic-cache", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            self._load()
+        except Exception as e:
+            self.last_error = str(e)
+            self.enabled = False
+            print(f"Caché semántica no disponible: {e}")
+            return
+        while True:
+            scope, message, answer, vector = self._queue.get()
+            try:
+                self._store(scope, message, answer, vector)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error guardando en la caché semántica: {e}")
+
+    def _load(self) -> None:
+        if self.embedder is None:
+            self.embedder = (SentenceTransformerEmbedder(self.model_name) if self.model_name
+                             else HashingEmbedder())
+        index = VectorIndex(self.embedder.dim, capacity=self.max_entries, nprobe=self.nprobe)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (slot INTEGER PRIMARY KEY, scope TEXT NOT NULL,"
+            " message TEXT NOT NULL, answer TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        # Vectores de otro modelo (u otra dimensión) no son comparables: se descartan
+        embedder_id = f"{self.embedder.name}:{self.embedder.dim}"
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'embedder'").fetchone()
+        if row is None or row[0] != embedder_id:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embedder', ?)", (embedder_id,))
+        cutoff = time.time() - self.ttl
+        self._conn.execute("DELETE FROM entries WHERE created_at < ? OR slot >= ?", (cutoff, self.max_entries))
+        newest, newest_at = -1, 0.0
+        for slot, scope, blob, created_at in self._conn.execute(
+                "SELECT slot, scope, vector, created_at FROM entries ORDER BY slot"):
+            index.add(np.frombuffer(blob, dtype=np.float16), self._scope_id(scope), created_at, slot=slot)
+            if created_at >= newest_at:
+                newest, newest_at = slot, created_at
+        if index.needs_training():
+            index.install(index.train())
+        # Las altas siguen donde se quedaron (detrás de la entrada más reciente)
+        index._next = (newest + 1) % self.max_entries
+        self.index = index
+
+    def _scope_id(self, scope: str) -> int:
+        if scope not in self._scopes:
+            self._scopes[scope] = len(self._scopes) + 1
+        return self._scopes[scope]
+
+    def embed(self, message: str) -> Optional[np.ndarray]:
+        if not self.ready:
+            return None
+        return self.embedder.encode([message])[0]
+
+    def lookup(self, message: str, scope: str, vector: Optional[np.ndarray] = None) -> Optional[SemanticMatch]:
+        """Pregunta guardada más parecida del mismo ámbito (agente y modelo) por encima de context_threshold"""
+        if not self.ready or scope not in self._scopes:
+            return None
+        started = time.perf_counter()
+        vector = self.embed(message) if vector is None else vector
+        match = None
+        with self._lock:
+            results = self.index.search(vector, k=1, scope=self._scopes[scope], min_created=time.time() - self.ttl)
+            row = None
+            if results and results[0][1] >= self.context_threshold:
+                row = self._conn.execute("SELECT message, answer FROM entries WHERE slot = ?",
+                                         (results[0][0],)).fetchone()
+        if row is not None:
+            similarity = results[0][1]
+            answered = self.embedder.can_answer and similarity >= self.answer_threshold
+            match = SemanticMatch(row[0], row[1], round(min(similarity, 1.0), 4), answered)
+            if answered:
+                self.answered += 1
+            else:
+                self.context_hits += 1
+        self.lookups += 1
+        self.lookup_ms += (time.perf_counter() - started) * 1000
+        return match
+
+    def submit(self, message: str, scope: str, answer: str, vector: Optional[np.ndarray] = None) -> None:
+        """Encola una pregunta respondida (el embedding se calcula en el hilo de la caché si no se pasa)"""
+        if self.ready and message.strip() and answer:
+            self._queue.put((scope, message.strip(), answer, vector))
+
+    def _store(self, scope: str, message: str, answer: str, vector: Optional[np.ndarray]) -> None:
+        vector = self.embed(message) if vector is None else vector
+        now = time.time()
+        with self._lock:
+            slot = self.index.add(vector.astype(np.float16), self._scope_id(scope), now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (slot, scope, message, answer, vector, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (slot, scope, message, answer, vector.astype(np.float16).tobytes(), now)
+            )
+        if self.index.needs_training():
+            # Solo este hilo hace altas: se agrupa sin el lock y las búsquedas siguen mientras tanto
+            trained = self.index.train()
+            with self._lock:
+                self.index.install(trained)
+
+    def stats(self) -> Dict[str, Any]:
+        index = self.index
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "embedder": getattr(self.embedder, "name", self.model_name),
+            "answers": bool(getattr(self.embedder, "can_answer", False)),
+            "entries": index.count if index else 0,
+            "max_entries": self.max_entries,
+            "ivf_lists": len(index._centroids) if index is not None and index._centroids is not None else 0,
+            "memory_bytes": index.memory_bytes() if index else 0,
+            "lookups": self.lookups,
+            "answered": self.answered,
+            "context_hits": self.context_hits,
+            "avg_lookup_ms": round(self.lookup_ms / self.lookups, 3) if self.lookups else None,
+            "pending": self._queue.qsize(),
+            "last_error": self.last_error
+        }
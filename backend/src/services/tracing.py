@@ -0,0 +1,328 @@
+"""
+Tracing - Spans compatibles con OpenTelemetry (trace/span ids de W3C y exportación OTLP/JSON)
+"""
+import abc
+import atexit
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, List, NamedTuple, Optional
+
+import requests
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Códigos de estado y tipos de span de OTLP
+STATUS_OK, STATUS_ERROR = 1, 2
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class SpanContext(NamedTuple):
+    """Padre remoto recibido en la cabecera `traceparent`"""
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+
+class Span:
+    """Un tramo de trabajo con nombre, duración, atributos y estado"""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "kind",
+                 "start_ns", "end_ns", "attributes", "status", "status_message")
+
+    sampled = True
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str],
+                 kind: str = "internal", attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_OK
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+            self.tracer.exporter.submit(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class NoopSpan:
+    """Span que no registra nada: tracing desactivado o traza no muestreada"""
+
+    trace_id = span_id = ""
+    sampled = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+# Span activo en la tarea/hilo actual (las tareas de asyncio y asyncio.to_thread heredan el contexto)
+_current_span: ContextVar = ContextVar("ralt_current_span", default=None)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(spans: List[Span], service_name: str) -> Dict[str, Any]:
+    """Spans en el formato JSON de OTLP (ExportTraceServiceRequest)"""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{
+            "scope": {"name": "ralt-agent"},
+            "spans": [{
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": SPAN_KINDS.get(span.kind, 1),
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                "status": {"code": span.status, "message": span.status_message}
+            } for span in spans]
+        }]
+    }]}
+
+
+class SpanExporter(abc.ABC):
+    """Exporta los spans terminados por lotes desde un hilo en segundo plano (fuera del camino de la petición)"""
+
+    def __init__(self, service_name: str, batch_size: int = 512, interval: float = 1.0):
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, span: Span) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+        self._queue.put(span)
+
+    def _drain(self, timeout: Optional[float]) -> List[Span]:
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._drain(self.interval)
+            if batch:
+                self._safe_export(batch)
+
+    def flush(self) -> None:
+        """Exporta lo pendiente (al apagar el proceso)"""
+        while True:
+            batch = self._drain(None)
+            if not batch:
+                return
+            self._safe_export(batch)
+
+    def _safe_export(self, batch: List[Span]) -> None:
+        try:
+            self.export(batch)
+        except Exception as e:
+            print(f"Error exportando {len(batch)} spans: {e}")
+
+    @abc.abstractmethod
+    def export(self, spans: List[Span]) -> None:
+        """Envía un lote de spans al destino; las subclases lo implementan"""
+
+
+class ConsoleSpanExporter(SpanExporter):
+    """Una línea por span en stdout (desarrollo)"""
+
+    def export(self, spans: List[Span]) -> None:
+        for span in spans:
+            attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+            error = f" ERROR {span.status_message}" if span.status == STATUS_ERROR else ""
+            print(f"[trace {span.trace_id[:8]}] {span.name} {span.duration_ms:.2f}ms {attributes}{error}")
+
+
+class FileSpanExporter(SpanExporter):
+    """Un ExportTraceServiceRequest de OTLP/JSON por línea (formato del file exporter del Collector)"""
+
+    def __init__(self, path: str, service_name: str, **kwargs):
+        super().__init__(service_name, **kwargs)
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(otlp_payload(spans, self.service_name)) + "\n")
+
+
+class OTLPHTTPSpanExporter(SpanExporter):
+    """Envía los spans a un OpenTelemetry Collector (o Jaeger, Tempo...) por OTLP/HTTP con JSON"""
+
+    def __init__(self, endpoint: str, service_name: str, **kwargs):
+        super().__init__(service_name, **kwargs)
+        self.endpoint = endpoint
+
+    def export(self, spans: List[Span]) -> None:
+        response = requests.post(self.endpoint, json=otlp_payload(spans, self.service_name), timeout=5)
+        response.raise_for_status()
+
+
+class Tracer:
+    """Crea spans y los enlaza con el span activo del contexto.
+
+    Sin exportador (TRACING_EXPORTER=none) todos los spans son NOOP_SPAN y el coste es
+    una comprobación por span. La decisión de muestreo se toma en el span raíz (o se
+    hereda del `traceparent` recibido) y la comparten todos sus descendientes.
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None, sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        service_name = os.environ.get("TRACING_SERVICE_NAME", "ralt-agent-backend")
+        kind = os.environ.get("TRACING_EXPORTER", "none").lower()
+        if kind == "console":
+            exporter = ConsoleSpanExporter(service_name)
+        elif kind == "file":
+            default_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "database", "traces.jsonl")
+            exporter = FileSpanExporter(os.environ.get("TRACING_FILE", default_path), service_name)
+        elif kind == "otlp":
+            exporter = OTLPHTTPSpanExporter(
+                os.environ.get("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"), service_name)
+        else:
+            exporter = None
+        return cls(exporter, sample_rate=float(os.environ.get("TRACING_SAMPLE_RATE", 1.0)))
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start_span(self, name: str, attributes: Optional[Dict[str, Any]] = None, parent=None,
+                   kind: str = "internal", start_ns: Optional[int] = None):
+        """Crea un span sin activarlo (hijo de `parent` o, si no se indica, del span activo)"""
+        if self.exporter is None:
+            return NOOP_SPAN
+        parent = parent if parent is not None else _current_span.get()
+        if parent is None:
+            if self.sample_rate < 1 and random.random() >= self.sample_rate:
+                return NOOP_SPAN
+            return Span(self, name, os.urandom(16).hex(), None, kind, attributes, start_ns)
+        if not parent.sampled:
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, kind, attributes, start_ns)
+
+    @contextmanager
+    def span(self, name: str, attributes: Optional[Dict[str, Any]] = None, parent=None,
+             kind: str = "internal") -> Iterator:
+        """Span activo durante el bloque; las excepciones lo marcan como error"""
+        with self.use_span(self.start_span(name, attributes, parent, kind)) as span:
+            yield span
+
+    @contextmanager
+    def use_span(self, span) -> Iterator:
+        """Activa durante el bloque un span ya creado con start_span y lo termina al salir"""
+        if self.exporter is None:
+            yield span
+            return
+        # También se activa NOOP_SPAN, para que los hijos de una traza no muestreada no creen otra
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Generador asíncrono cerrado desde otro contexto (p. ej. desconexión del cliente)
+                pass
+            span.end()
+
+    def record_span(self, name: str, start_ns: int, end_ns: int, attributes: Optional[Dict[str, Any]] = None,
+                    parent=None, error: Optional[BaseException] = None, kind: str = "internal") -> None:
+        """Span ya terminado con tiempos medidos en otro sitio (p. ej. en un proceso del pool)"""
+        span = self.start_span(name, attributes, parent, kind, start_ns=start_ns)
+        if error is not None:
+            span.record_error(error)
+        span.end(end_ns)
+
+
+def extract_context(headers) -> Optional[SpanContext]:
+    """Padre remoto de la cabecera W3C `traceparent` (None si no viene o no es válida)"""
+    match = _TRACEPARENT.match((headers.get("traceparent") or "").strip().lower()) if headers else None
+    if not match:
+        return None
+    return SpanContext(match.group(1), match.group(2), sampled=int(match.group(3), 16) & 1 == 1)
+
+
+def format_traceparent(span) -> Optional[str]:
+    """Cabecera W3C `traceparent` de un span, para continuar su traza en otro proceso o más tarde"""
+    if not span.sampled:
+        return None
+    return f"00-{span.trace_id}-{span.span_id}-01"
+
+
+def request_id_for(headers, span) -> str:
+    """Id de la petición: la cabecera X-Request-Id del cliente si es válida; si no, el trace id o uno nuevo"""
+    incoming = (headers.get("x-request-id") or "").strip() if headers else ""
+    if _REQUEST_ID.match(incoming):
+        return incoming
+    return span.trace_id or os.urandom(16).hex()
+
+
+tracer = Tracer.from_env()
@@ -1,22 +1,102 @@
 """
 Vision Service - Maneja el procesamiento y análisis de imágenes
 """
+import asyncio
+import atexit
 import base64
+import binascii
+import hashlib
 import io
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 from PIL import Image
 import requests
 from typing import Dict, Any, Optional, List
+from src.services.response_cache import ResponseCache, SQLiteCacheBackend
+from src.services.tracing import tracer
+
+# Instancia usada dentro de los procesos del pool de análisis
+_worker_service = None
+
+# Tamaño de los bloques al decodificar base64 o descargar imágenes (múltiplo de 4)
+_CHUNK_SIZE = 64 * 1024
+_WHITESPACE = re.compile(r"\s")
+
+SUPPORTED_FORMATS = ["jpg", "jpeg", "png", "gif", "bmp", "webp"]
+
+class ImageTooLargeError(ValueError):
+    """La imagen supera max_image_size"""
+
+def is_image_file(filename: str) -> bool:
+    """Verifica si un nombre de archivo tiene una extensión de imagen soportada"""
+    return bool(filename) and "." in filename and filename.lower().rsplit(".", 1)[-1] in SUPPORTED_FORMATS
+
+def context_images(context) -> List[Dict]:
+    """Imágenes adjuntas al contexto de una petición de chat.
+
+    El contexto es la lista de mensajes (type/content); cada mensaje puede llevar `images`
+    (lista de {name, base64|url|path}), `image` o `image_url` (una sola imagen o su URL) y
+    `files`/`attachments` (se toman los de extensión de imagen). También se acepta el
+    formato antiguo: un único diccionario con `images` y `files`.
+    """
+    entries = [context] if isinstance(context, dict) else context or []
+    images = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        images.extend(image for image in entry.get("images") or [] if isinstance(image, dict))
+        for key in ("image", "image_url"):
+            image = entry.get(key)
+            if isinstance(image, str):
+                image = {"url": image, "name": image.rsplit("/", 1)[-1].split("?")[0] or "image"}
+            if isinstance(image, dict):
+                images.append(image)
+        for key in ("files", "attachments"):
+            images.extend(file_info for file_info in entry.get(key) or []
+                          if isinstance(file_info, dict) and is_image_file(file_info.get("name", "")))
+    return images
+
+def _analyze_in_worker(image_data: Dict, user_query: str, with_thumbnail: bool = False) -> Dict[str, Any]:
+    """Punto de entrada en los procesos del pool: análisis síncrono de una imagen"""
+    global _worker_service
+    if _worker_service is None:
+        _worker_service = VisionService()
+    return _worker_service._analyze_image_sync(image_data, user_query, with_thumbnail)
 
 class VisionService:
     def __init__(self):
-        self.supported_formats = ["jpg", "jpeg", "png", "gif", "bmp", "webp"]
-        self.max_image_size = 10 * 1024 * 1024  # 10MB
+        self.max_image_size = int(os.environ.get("VISION_MAX_IMAGE_SIZE", 10 * 1024 * 1024))  # 10MB
+        # Lado máximo que necesita el análisis; los JPEG se decodifican a escala reducida
+        self.analysis_size = int(os.environ.get("VISION_ANALYSIS_SIZE", 512))
+        # Pool de procesos para decodificar y analizar imágenes fuera del event loop
+        self.workers = int(os.environ.get("VISION_WORKERS", os.cpu_count() or 1))
+        self.image_timeout = float(os.environ.get("VISION_IMAGE_TIMEOUT", 30))
+        self.queue_size = int(os.environ.get("VISION_QUEUE_SIZE", max(1, self.workers) * 4))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._queue_slots: Optional[asyncio.Semaphore] = None
+        self._queue_loop = None
+        # Caché en disco de análisis indexada por hash del contenido (se abre bajo demanda,
+        # nunca en los procesos del pool)
+        self.cache_enabled = os.environ.get("VISION_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+        self.cache_path = os.environ.get(
+            "VISION_CACHE_PATH",
+            os.path.join(os.path.dirname(os.path.dirname(__file__)), "database", "image_cache.db")
+        )
+        self.cache_max_bytes = int(os.environ.get("VISION_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+        self.cache_ttl = float(os.environ.get("VISION_CACHE_TTL", 7 * 24 * 3600))
+        self.thumbnail_size = int(os.environ.get("VISION_THUMBNAIL_SIZE", 256))
+        self._cache: Optional[ResponseCache] = None
         
     def is_available(self) -> bool:
         """Verifica si el servicio está disponible"""
         return True
     
-    async def process(self, user_input: str, context: Optional[Dict] = None) -> Dict[str, Any]:
+    async def process(self, user_input: str, context: Optional[List[Dict]] = None) -> Dict[str, Any]:
         """Procesa una solicitud relacionada con visión"""
         try:
             result = {
@@ -29,13 +109,13 @@ class VisionService:
             }
             
             # Buscar imágenes en el contexto
-            images = self._extract_images_from_context(context)
+            images = context_images(context)
             
             if images:
-                for image_data in images:
-                    analysis = await self._analyze_image(image_data, user_input)
-                    result["images_analyzed"].append(analysis)
-                    result["processed"] = True
+                # Las imágenes se analizan en paralelo en el pool de procesos
+                analyses = await asyncio.gather(*(self._analyze_image(image_data, user_input) for image_data in images))
+                result["images_analyzed"].extend(analyses)
+                result["processed"] = True
             
             return result
             
@@ -46,34 +126,175 @@ class VisionService:
                 "processed": False
             }
     
-    def _extract_images_from_context(self, context: Optional[Dict]) -> List[Dict]:
-        """Extrae imágenes del contexto proporcionado"""
-        images = []
-        
-        if not context:
-            return images
-        
-        # Buscar imágenes en diferentes formatos del contexto
-        if "images" in context:
-            images.extend(context["images"])
-        
-        if "files" in context:
-            for file_info in context["files"]:
-                if self._is_image_file(file_info.get("name", "")):
-                    images.append(file_info)
-        
-        return images
-    
-    def _is_image_file(self, filename: str) -> bool:
-        """Verifica si un archivo es una imagen soportada"""
-        if not filename:
-            return False
-        
-        extension = filename.lower().split(".")[-1]
-        return extension in self.supported_formats
-    
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Crea bajo demanda el pool de procesos (None si VISION_WORKERS=0)"""
+        if self._pool is None and self.workers > 0:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            atexit.register(self.shutdown)
+        return self._pool
+
+    def _get_queue_slots(self) -> asyncio.Semaphore:
+        """Semáforo que acota las imágenes en cola o en análisis (uno por event loop)"""
+        loop = asyncio.get_running_loop()
+        if self._queue_slots is None or self._queue_loop is not loop:
+            self._queue_slots = asyncio.Semaphore(self.queue_size)
+            self._queue_loop = loop
+        return self._queue_slots
+
+    @staticmethod
+    def _release_slot(slots: asyncio.Semaphore, future: asyncio.Future) -> None:
+        slots.release()
+        if not future.cancelled():
+            # Marcar como leída la excepción de un análisis abandonado por timeout
+            future.exception()
+
+    def shutdown(self) -> None:
+        """Detiene el pool de procesos"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get_cache(self) -> Optional[ResponseCache]:
+        """Caché de análisis (None si está desactivada)"""
+        if self._cache is None and self.cache_enabled:
+            backend = SQLiteCacheBackend(self.cache_path, max_entries=100000,
+                                         max_bytes=self.cache_max_bytes, table="image_analysis")
+            self._cache = ResponseCache(backend, ttl=self.cache_ttl)
+        return self._cache
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Métricas de la caché de análisis (aciertos, fallos, tamaño)"""
+        cache = self.get_cache()
+        return cache.stats() if cache else {"enabled": False}
+
+    def _content_key(self, image_data: Dict) -> Optional[str]:
+        """Hash del contenido de la imagen, o None si no se puede identificar sin descargarla.
+
+        Para base64 se hashea el texto codificado (equivalente a los bytes, sin decodificar);
+        para URLs, la URL con su ETag/Last-Modified; para ficheros, ruta, tamaño y mtime.
+        """
+        if "base64" in image_data:
+            data = image_data["base64"]
+            if data.startswith("data:"):
+                data = data[data.index(",") + 1:]
+            return "b64:" + hashlib.sha256(data.strip().encode("ascii", "ignore")).hexdigest()
+
+        if "url" in image_data:
+            response = requests.head(image_data["url"], timeout=5, allow_redirects=True)
+            validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+            if not response.ok or not validator:
+                return None
+            return "url:" + hashlib.sha256(f"{image_data['url']}|{validator}".encode("utf-8")).hexdigest()
+
+        if "path" in image_data:
+            stat = os.stat(image_data["path"])
+            raw = f"{os.path.abspath(image_data['path'])}|{stat.st_size}|{stat.st_mtime_ns}"
+            return "path:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+        return None
+
+    @staticmethod
+    def thumbnail_url(content_hash: str) -> str:
+        return f"/api/vision/thumbnails/{content_hash}"
+
+    def get_cached_thumbnail(self, content_hash: str) -> Optional[bytes]:
+        """Miniatura JPEG guardada junto al análisis de una imagen (GET /api/vision/thumbnails/<hash>)"""
+        cache = self.get_cache()
+        cached = cache.backend.get(content_hash) if cache else None
+        if not cached:
+            return None
+        thumbnail = json.loads(cached).get("thumbnail")
+        return base64.b64decode(thumbnail) if thumbnail else None
+
     async def _analyze_image(self, image_data: Dict, user_query: str) -> Dict[str, Any]:
-        """Analiza una imagen específica"""
+        """Analiza una imagen en el pool de procesos, con timeout por imagen.
+
+        Si el contenido ya se analizó antes, se devuelve el análisis guardado sin decodificar.
+        """
+        with tracer.span("vision.analyze_image", {"image.name": image_data.get("name", "unknown")}) as span:
+            started = time.perf_counter()
+            cache = self.get_cache()
+            content_hash = None
+            try:
+                if cache:
+                    try:
+                        with tracer.span("vision.content_hash"):
+                            content_hash = await asyncio.to_thread(self._content_key, image_data)
+                    except (OSError, requests.RequestException) as e:
+                        print(f"Error calculando el hash de la imagen: {e}")
+                    if content_hash:
+                        with tracer.span("vision.cache_get"):
+                            cached = await asyncio.to_thread(cache.get, content_hash)
+                        if cached is not None:
+                            entry = json.loads(cached)
+                            analysis = entry["analysis"]
+                            # El análisis guardado lleva el nombre de la primera subida
+                            analysis.update(filename=image_data.get("name", "unknown"), content_hash=content_hash,
+                                            cache_hit=True,
+                                            wall_time_ms=round((time.perf_counter() - started) * 1000, 2))
+                            if entry.get("thumbnail"):
+                                analysis["thumbnail_url"] = self.thumbnail_url(content_hash)
+                            span.set_attribute("cache_hit", True)
+                            return analysis
+
+                # El timeout cuenta desde que la imagen entra en cola, no desde que consigue sitio
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + self.image_timeout
+                queued_ns = time.time_ns()
+                slots = self._get_queue_slots()
+                await asyncio.wait_for(slots.acquire(), self.image_timeout)
+                tracer.record_span("vision.queue_wait", queued_ns, time.time_ns())
+                try:
+                    pool = self._get_pool()
+                    with_thumbnail = content_hash is not None
+                    if pool is not None:
+                        work = loop.run_in_executor(pool, _analyze_in_worker, image_data, user_query, with_thumbnail)
+                    else:
+                        work = asyncio.ensure_future(
+                            asyncio.to_thread(self._analyze_image_sync, image_data, user_query, with_thumbnail))
+                except BaseException:
+                    slots.release()
+                    raise
+                # Tras un timeout el análisis sigue en el pool: el hueco se libera cuando termina de
+                # verdad, para que VISION_QUEUE_SIZE acote la carga real del pool
+                work.add_done_callback(lambda future: self._release_slot(slots, future))
+                analysis = await asyncio.wait_for(asyncio.shield(work), max(0.0, deadline - loop.time()))
+
+                thumbnail = analysis.pop("thumbnail", None)
+                # Pasos medidos dentro del worker (carga y análisis), como spans hijos
+                for step, (step_start, step_end) in analysis.pop("_steps", {}).items():
+                    tracer.record_span(f"vision.{step}", step_start, step_end)
+                if content_hash and "error" not in analysis:
+                    entry = json.dumps({"analysis": analysis, "thumbnail": thumbnail})
+                    await asyncio.to_thread(cache.set, content_hash, entry)
+                    analysis.update(content_hash=content_hash, cache_hit=False)
+                    if thumbnail:
+                        analysis["thumbnail_url"] = self.thumbnail_url(content_hash)
+            except asyncio.TimeoutError:
+                analysis = {
+                    "filename": image_data.get("name", "unknown"),
+                    "error": f"Tiempo de análisis agotado ({self.image_timeout}s)"
+                }
+            except BrokenProcessPool as e:
+                # Un worker murió (p. ej. por memoria); se recrea el pool en la siguiente imagen
+                self._pool = None
+                analysis = {
+                    "filename": image_data.get("name", "unknown"),
+                    "error": f"Pool de análisis reiniciado: {e}"
+                }
+            except Exception as e:
+                analysis = {
+                    "filename": image_data.get("name", "unknown"),
+                    "error": str(e)
+                }
+            analysis["wall_time_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            span.set_attribute("cache_hit", False)
+            if "error" in analysis:
+                span.set_attribute("error", analysis["error"])
+            return analysis
+
+    def _analyze_image_sync(self, image_data: Dict, user_query: str, with_thumbnail: bool = False) -> Dict[str, Any]:
+        """Analiza una imagen específica (con with_thumbnail añade una miniatura JPEG en base64)"""
         try:
             analysis = {
                 "filename": image_data.get("name", "unknown"),
@@ -87,17 +308,33 @@ class VisionService:
                 "metadata": {}
             }
             
-            # Cargar la imagen
+            # Cargar la imagen (los tiempos de cada paso se devuelven en "_steps" para tracing)
+            steps = analysis["_steps"] = {}
+            step_start = time.time_ns()
             image = self._load_image(image_data)
+            steps["load_image"] = (step_start, time.time_ns())
             if image:
+                step_start = time.time_ns()
                 analysis["dimensions"] = image.size
                 analysis["format"] = image.format
+
+                # Solo se necesitan miniaturas y colores: decodificación reducida si el formato lo permite
+                image.draft("RGB", (self.analysis_size, self.analysis_size))
                 
                 # Análisis básico de la imagen
-                analysis["description"] = self._generate_description(image, user_query)
-                analysis["colors"] = self._extract_dominant_colors(image)
+                palette = self._color_palette(image)
+                analysis["description"] = self._generate_description(image, user_query, palette,
+                                                                     dimensions=analysis["dimensions"])
+                analysis["colors"] = [entry["color"] for entry in palette]
+                analysis["color_percentages"] = [entry["percentage"] for entry in palette]
                 analysis["text"] = self._extract_text_ocr(image)
                 analysis["objects"] = self._detect_objects(image)
+                steps["analyze"] = (step_start, time.time_ns())
+
+                if with_thumbnail:
+                    step_start = time.time_ns()
+                    analysis["thumbnail"] = self._make_thumbnail(image)
+                    steps["thumbnail"] = (step_start, time.time_ns())
             
             return analysis
             
@@ -107,76 +344,151 @@ class VisionService:
                 "error": str(e)
             }
     
+    def _make_thumbnail(self, image: Image.Image) -> str:
+        """Miniatura JPEG (base64) de lado máximo thumbnail_size"""
+        thumbnail = image.copy()
+        thumbnail.thumbnail((self.thumbnail_size, self.thumbnail_size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+        if thumbnail.mode != "RGB":
+            thumbnail = thumbnail.convert("RGB")
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, "JPEG", quality=80)
+        return base64.b64encode(buffer.getvalue()).decode("ascii")
+
     def _load_image(self, image_data: Dict) -> Optional[Image.Image]:
-        """Carga una imagen desde los datos proporcionados"""
+        """Carga una imagen desde los datos proporcionados.
+
+        Los bytes se leen por bloques comprobando max_image_size sobre la marcha y se
+        escriben en un único buffer; Image.open solo lee la cabecera (decodificación perezosa).
+        """
         try:
             if "base64" in image_data:
                 # Imagen en base64
-                image_bytes = base64.b64decode(image_data["base64"])
-                return Image.open(io.BytesIO(image_bytes))
+                return Image.open(self._decode_base64(image_data["base64"]))
             
             elif "url" in image_data:
                 # Imagen desde URL
-                response = requests.get(image_data["url"], timeout=10)
-                response.raise_for_status()
-                return Image.open(io.BytesIO(response.content))
+                return Image.open(self._download(image_data["url"]))
             
             elif "path" in image_data:
                 # Imagen desde archivo local
+                self._check_size(os.path.getsize(image_data["path"]))
                 return Image.open(image_data["path"])
             
             return None
             
+        except ImageTooLargeError:
+            raise
         except Exception as e:
             print(f"Error loading image: {e}")
             return None
+
+    def _check_size(self, size: int) -> None:
+        if size > self.max_image_size:
+            raise ImageTooLargeError(
+                f"La imagen supera el tamaño máximo permitido ({size} > {self.max_image_size} bytes)"
+            )
+
+    def _decode_base64(self, data: str) -> io.BytesIO:
+        """Decodifica base64 por bloques en un único buffer, validando el tamaño antes de empezar"""
+        if data.startswith("data:"):
+            # data URL: "data:image/png;base64,...."
+            data = data[data.index(",") + 1:]
+        if _WHITESPACE.search(data):
+            data = _WHITESPACE.sub("", data)
+
+        padding = len(data) - len(data.rstrip("="))
+        self._check_size(len(data) * 3 // 4 - padding)
+
+        buffer = io.BytesIO()
+        for start in range(0, len(data), _CHUNK_SIZE):
+            buffer.write(binascii.a2b_base64(data[start:start + _CHUNK_SIZE]))
+        buffer.seek(0)
+        return buffer
+
+    def _download(self, url: str) -> io.BytesIO:
+        """Descarga una imagen en streaming, abortando en cuanto supera max_image_size"""
+        with requests.get(url, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            content_length = response.headers.get("Content-Length")
+            if content_length and content_length.isdigit():
+                self._check_size(int(content_length))
+
+            buffer = io.BytesIO()
+            for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                buffer.write(chunk)
+                self._check_size(buffer.tell())
+        buffer.seek(0)
+        return buffer
     
-    def _generate_description(self, image: Image.Image, user_query: str) -> str:
+    def _generate_description(self, image: Image.Image, user_query: str,
+                              palette: Optional[List[Dict]] = None,
+                              dimensions: Optional[tuple] = None) -> str:
         """Genera una descripción de la imagen"""
-        # Análisis básico de la imagen
-        width, height = image.size
+        # Análisis básico de la imagen (dimensiones originales, aunque se haya decodificado reducida)
+        width, height = dimensions or image.size
         mode = image.mode
         
         description = f"Imagen de {width}x{height} píxeles en modo {mode}."
         
         # Análisis de contenido básico (esto se mejoraría con un modelo de visión real)
-        if image.mode == "RGB":
-            # Análisis de colores dominantes
-            colors = image.getcolors(maxcolors=256*256*256)
-            if colors:
-                dominant_color = max(colors, key=lambda x: x[0])
-                description += f" Color dominante detectado."
+        if palette is None:
+            palette = self._color_palette(image, top=1)
+        if palette:
+            # Color dominante calculado sobre la imagen reducida, no a resolución completa
+            description += f" Color dominante detectado: {palette[0]['color']} ({palette[0]['percentage']}%)."
         
         # Aquí se integraría con un modelo de visión real como GPT-4V o Claude Vision
         description += " Para un análisis más detallado, se requiere integración con modelo de visión."
         
         return description
     
-    def _extract_dominant_colors(self, image: Image.Image) -> List[str]:
+    def _extract_dominant_colors(self, image: Image.Image, top: int = 5) -> List[str]:
         """Extrae los colores dominantes de la imagen"""
+        return [entry["color"] for entry in self._color_palette(image, top)]
+
+    def _color_palette(self, image: Image.Image, top: int = 5,
+                       sample_size: int = 150, bits: int = 5) -> List[Dict[str, Any]]:
+        """Paleta de colores dominantes con el porcentaje de píxeles de cada uno.
+
+        Reduce la imagen a ~sample_size px de lado, cuantiza cada canal a `bits` bits y
+        cuenta los píxeles por celda con un histograma de NumPy; el color de cada celda es
+        la media real de sus píxeles.
+        """
         try:
-            # Convertir a RGB si es necesario
-            if image.mode != "RGB":
+            if image.mode not in ("RGB", "RGBA", "L"):
                 image = image.convert("RGB")
-            
-            # Reducir el tamaño para análisis más rápido
-            image = image.resize((150, 150))
-            
-            # Obtener colores
-            colors = image.getcolors(maxcolors=256*256*256)
-            if not colors:
+
+            # Reducir el tamaño (manteniendo proporción) antes de convertir y contar
+            sample = image.copy()
+            sample.thumbnail((sample_size, sample_size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+            if sample.mode != "RGB":
+                sample = sample.convert("RGB")
+
+            pixels = np.asarray(sample, dtype=np.uint8).reshape(-1, 3)
+            if pixels.size == 0:
                 return []
-            
-            # Ordenar por frecuencia y tomar los top 5
-            colors.sort(key=lambda x: x[0], reverse=True)
-            dominant_colors = []
-            
-            for count, color in colors[:5]:
-                hex_color = f"#{color[0]:02x}{color[1]:02x}{color[2]:02x}"
-                dominant_colors.append(hex_color)
-            
-            return dominant_colors
-            
+
+            shift = 8 - bits
+            quantized = (pixels >> shift).astype(np.int32)
+            bins = (quantized[:, 0] << (2 * bits)) | (quantized[:, 1] << bits) | quantized[:, 2]
+            counts = np.bincount(bins, minlength=1 << (3 * bits))
+
+            occupied = np.count_nonzero(counts)
+            k = min(top, occupied)
+            best = np.argpartition(counts, -k)[-k:]
+            best = best[np.argsort(counts[best])[::-1]]
+
+            palette = []
+            total = pixels.shape[0]
+            for index in best:
+                members = pixels[bins == index]
+                r, g, b = members.mean(axis=0).round().astype(int)
+                palette.append({
+                    "color": f"#{r:02x}{g:02x}{b:02x}",
+                    "percentage": round(float(counts[index]) * 100 / total, 2)
+                })
+            return palette
+
         except Exception as e:
             print(f"Error extracting colors: {e}")
             return []
@@ -1,9 +1,20 @@
-import json
-from typing import Dict, Any, Optional
+import os
+from typing import Dict, Any, List, Optional
+from urllib.parse import parse_qs, quote_plus, urlsplit
+from src.services.intent_classifier import intent_classifier
+from src.services.document_index import Document, DocumentIndex
+from src.services.page_fetcher import PageFetcher, FetchError, find_urls, normalize_url
 
 class WebService:
-    def __init__(self):
-        pass
+    def __init__(self, fetcher: Optional[PageFetcher] = None, index: Optional[DocumentIndex] = None):
+        self.fetcher = fetcher or PageFetcher.from_env()
+        # Las páginas descargadas se añaden al índice local del agente de investigación
+        self.index = index
+        # Plantilla de la página de resultados (HTML) del buscador; {query} se sustituye
+        self.search_url = os.environ.get("WEB_SEARCH_URL", "https://html.duckduckgo.com/html/?q={query}")
+        self.max_urls = int(os.environ.get("WEB_MAX_URLS", 5))
+        self.max_results = int(os.environ.get("WEB_SEARCH_RESULTS", 8))
+        self.excerpt_chars = int(os.environ.get("WEB_EXCERPT_CHARS", 1500))
 
     def is_available(self) -> bool:
         """Verifica si el servicio web está disponible"""
@@ -11,22 +22,32 @@ class WebService:
 
     async def process(self, user_input: str, context: Optional[Dict] = None) -> Dict[str, Any]:
         """Procesa una solicitud relacionada con navegación web"""
-        # Simulación de funcionalidad web
-        if "buscar" in user_input.lower() or "investigar" in user_input.lower():
+        intent = intent_classifier.classify(user_input).best("web.action")
+        action = intent.label if intent else None
+        urls = find_urls(user_input)
+        if action == "search" and not urls:
             query = user_input.replace("buscar", "").replace("investigar", "").strip()
-            return {
-                "type": "web",
-                "action": "search",
-                "query": query,
-                "result": f"Simulando búsqueda web para: \'{query}\'. Resultados reales requerirían un navegador headless."
-            }
-        elif "navegar" in user_input.lower() or "ir a" in user_input.lower():
-            url = user_input.split("a")[-1].strip()
+            return await self._search(query)
+        elif action == "navigate" or urls:
+            if not urls:
+                # Destino: lo que sigue a "navegar"/"ir a" (p. ej. "ir a python.org")
+                target = user_input[intent.end:].strip().removeprefix("a ").strip()
+                urls = [target.split()[0]] if target else []
+            if not urls:
+                return {
+                    "type": "web",
+                    "action": "navigate",
+                    "url": "",
+                    "result": "Indica la dirección de la página que quieres abrir (por ejemplo: 'ir a https://python.org')."
+                }
+            pages = await self.fetcher.fetch_many(urls[:self.max_urls])
+            self._index_pages(pages)
             return {
                 "type": "web",
                 "action": "navigate",
-                "url": url,
-                "result": f"Simulando navegación a: \'{url}\'. Acceso real a la web no implementado."
+                "url": pages[0].get("final_url") or pages[0]["url"],
+                "pages": pages,
+                "result": self._describe_pages(pages)
             }
         else:
             return {
@@ -35,4 +56,69 @@ class WebService:
                 "result": "Como agente web, puedo navegar, buscar información y automatizar tareas web. Por favor, especifica tu solicitud."
             }
 
+    async def _search(self, query: str) -> Dict[str, Any]:
+        """Busca en la web descargando la página de resultados del buscador configurado"""
+        if not query:
+            return {"type": "web", "action": "search", "query": query, "results": [],
+                    "result": "Indica qué quieres buscar."}
+        page = await self.fetcher.fetch(self.search_url.format(query=quote_plus(query)))
+        if page.get("error") and not page.get("links"):
+            return {"type": "web", "action": "search", "query": query, "results": [],
+                    "result": f"Error en la búsqueda web de '{query}': {page['error']}"}
+
+        results = self._search_results(page, self.max_results)
+        lines = [f"{i}. {item['title']} - {item['url']}" for i, item in enumerate(results, 1)]
+        return {
+            "type": "web",
+            "action": "search",
+            "query": query,
+            "results": results,
+            "result": f"Resultados de la búsqueda '{query}':\n" + "\n".join(lines) if lines
+                      else f"No se encontraron resultados para '{query}'."
+        }
+
+    def _index_pages(self, pages: List[Dict[str, Any]]) -> None:
+        """Encola las páginas descargadas para el índice local (se escriben en segundo plano)"""
+        if self.index is None:
+            return
+        for page in pages:
+            if page.get("text") and not page.get("error"):
+                url = page.get("final_url") or page["url"]
+                self.index.submit(Document(f"web:{url}", page["text"], page.get("title") or url, "web", url))
+
+    @staticmethod
+    def _search_results(page: Dict[str, Any], limit: int) -> List[Dict[str, str]]:
+        """Enlaces externos de una página de resultados (deshaciendo las redirecciones del buscador)"""
+        search_host = urlsplit(page.get("final_url") or page["url"]).hostname
+        results, seen = [], set()
+        for link in page.get("links", []):
+            url = link["url"]
+            # DuckDuckGo y otros envuelven el destino real en /l/?uddg=<url>
+            target = parse_qs(urlsplit(url).query).get("uddg")
+            if target:
+                url = target[0]
+            try:
+                url = normalize_url(url)
+            except FetchError:
+                continue
+            if (not target and urlsplit(url).hostname == search_host) or url in seen or not link["text"]:
+                continue
+            seen.add(url)
+            results.append({"title": link["text"], "url": url})
+            if len(results) >= limit:
+                break
+        return results
 
+    def _describe_pages(self, pages: List[Dict[str, Any]]) -> str:
+        """Resumen legible de las páginas descargadas (título, dirección y extracto del texto)"""
+        parts = []
+        for page in pages:
+            if page.get("error") and not page.get("text"):
+                parts.append(f"No se pudo abrir {page['url']}: {page['error']}")
+                continue
+            excerpt = page.get("text", "")[:self.excerpt_chars]
+            if page.get("truncated") or len(page.get("text", "")) > self.excerpt_chars:
+                excerpt += " [...]"
+            title = page.get("title") or page.get("final_url") or page["url"]
+            parts.append(f"{title}\n{page.get('final_url') or page['url']}\n\n{excerpt}")
+        return "\n\n---\n\n".join(parts)
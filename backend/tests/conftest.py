@@ -0,0 +1,51 @@
+"""
+Configuración común de los tests: entorno aislado (cachés y bases de datos en un
+directorio temporal, sin workers en segundo plano) y servidores locales de prueba
+"""
+import os
+import tempfile
+
+import pytest
+
+# Debe fijarse antes de importar src.*: los servicios leen el entorno al crearse
+_TMP = tempfile.mkdtemp(prefix="ralt-tests-")
+os.environ.update({
+    "OPENROUTER_API_KEY": "test-key",
+    "RESPONSE_CACHE_BACKEND": "none",
+    "SEMANTIC_CACHE_ENABLED": "false",
+    "WEB_CACHE_ENABLED": "false",
+    "VISION_CACHE_ENABLED": "false",
+    "VISION_WORKERS": "0",
+    "JOB_WORKERS": "0",
+    "LLM_RETRIES": "0",
+    "CIRCUIT_BREAKER_ENABLED": "false",
+    "RESEARCH_INDEX_PATH": os.path.join(_TMP, "documents.db"),
+    "MODEL_CATALOG_PATH": os.path.join(_TMP, "models.json"),
+})
+
+from benchmarks import stub_openrouter, web_fixture  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def failing_models():
+    """Modelos a los que el stub responde 503; los tests la modifican en caliente"""
+    return []
+
+
+@pytest.fixture(scope="session")
+def stub_url(failing_models):
+    """Stub de OpenRouter en un puerto libre"""
+    return stub_openrouter.start_in_thread("127.0.0.1", port=0, latency=0.01, failing_models=failing_models)
+
+
+@pytest.fixture
+def failing(failing_models):
+    """Lista de modelos caídos que se vacía al terminar el test"""
+    yield failing_models
+    failing_models.clear()
+
+
+@pytest.fixture(scope="session")
+def web_url():
+    """Servidor local de páginas (ETag, redirecciones, respuestas grandes) en un puerto libre"""
+    return web_fixture.start_in_thread("127.0.0.1", port=0, latency=0.0)
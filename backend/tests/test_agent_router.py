@@ -0,0 +1,80 @@
+"""Enrutado automático de agentes e imágenes del contexto (mismo criterio en router y visión)"""
+import asyncio
+
+import pytest
+
+from src.services.agent_router import AgentRouter
+from src.services.intent_classifier import intent_classifier
+from src.services.vision_service import context_images
+
+AGENTS = ["general", "vision", "web", "code", "research", "creative"]
+
+
+@pytest.fixture
+def router():
+    return AgentRouter(AGENTS)
+
+
+def route(router, message, context=None):
+    return asyncio.run(router.route(message, context))
+
+
+def test_context_images_from_messages():
+    context = [
+        {"type": "user", "content": "hola"},
+        {"type": "user", "content": "mira", "images": [{"name": "a.png", "base64": "AAAA"}, "no-es-un-dict"]},
+        {"type": "user", "content": "y esta", "image_url": "https://example.com/fotos/b.jpg?size=2"},
+        {"type": "user", "content": "adjuntos", "attachments": [{"name": "c.webp"}, {"name": "informe.pdf"}]},
+    ]
+    assert [image["name"] for image in context_images(context)] == ["a.png", "b.jpg", "c.webp"]
+
+
+def test_context_images_from_legacy_dict():
+    context = {"images": [{"name": "a.png"}], "files": [{"name": "b.gif"}, {"name": "notas.txt"}]}
+    assert [image["name"] for image in context_images(context)] == ["a.png", "b.gif"]
+
+
+@pytest.mark.parametrize("context", [None, [], {}, [{"type": "user", "content": "sin imágenes"}], ["texto"]])
+def test_context_without_images(context):
+    assert context_images(context) == []
+    assert not AgentRouter.has_images("hola", context)
+
+
+def test_has_images_from_message_or_context():
+    assert AgentRouter.has_images("¿qué hay en captura.PNG?")
+    assert AgentRouter.has_images("describe", [{"type": "user", "image": "https://example.com/x.jpg"}])
+    assert AgentRouter.has_images("describe", {"files": [{"name": "x.jpeg"}]})
+
+
+def test_images_route_to_vision_for_both_context_shapes(router):
+    for context in ([{"type": "user", "images": [{"name": "a.png"}]}], {"images": [{"name": "a.png"}]}):
+        decision = route(router, "¿qué ves?", context)
+        assert decision["agent_type"] == "vision"
+        assert decision["source"] == "keywords"
+
+
+def test_keywords_pick_the_agent(router):
+    assert route(router, "Corrige este bug en mi función de python")["agent_type"] == "code"
+    assert route(router, "Escribe un poema sobre el mar")["agent_type"] == "creative"
+    assert route(router, "Hola, ¿qué tal?")["agent_type"] == "general"
+
+
+def test_decisions_are_cached_per_message_and_images(router):
+    assert route(router, "Hola   QUÉ tal")["cache_hit"] is False
+    assert route(router, "hola qué tal")["cache_hit"] is True
+    assert route(router, "hola qué tal", {"images": [{"name": "a.png"}]})["cache_hit"] is False
+
+
+@pytest.mark.parametrize("message, table, label", [
+    ("escribe poemas de amor", "creative.type", "poem"),
+    ("dos cuentos cortos", "creative.type", "story"),
+    ("letras de canciones", "creative.type", "song_lyrics"),
+    ("un programa en go", "code.language", "go"),
+])
+def test_intent_keywords_and_listed_plurals(message, table, label):
+    assert intent_classifier.classify(message).label(table, None) == label
+
+
+@pytest.mark.parametrize("message", ["it goes well", "busca en google", "los técnicoes", "ajsdf"])
+def test_intent_keywords_need_whole_words(message):
+    assert intent_classifier.classify(message).matches == ()
@@ -0,0 +1,69 @@
+"""Reanudación del batch CLI: el fichero de resultados hace de checkpoint"""
+import json
+import sys
+
+from src import batch_cli
+
+
+def write_lines(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+
+
+def test_checkpoint_keeps_only_successful_results(tmp_path):
+    output = tmp_path / "results.jsonl"
+    write_lines(output, [
+        json.dumps({"id": 1, "status": 200}),
+        json.dumps({"id": 2, "status": 502, "metadata": {"llm_failed": True}}),
+        json.dumps({"id": 3, "status": 200}),
+        json.dumps({"id": 3, "status": 429}),
+        json.dumps({"id": 4, "status": 200, "metadata": {"llm_failed": True}}),
+        json.dumps({"id": 5, "status": 500}),
+        json.dumps({"id": 5, "status": 200}),
+        json.dumps({"id": "a", "status": 200}),
+        json.dumps({"summary": {"items": 6}}),
+    ])
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"id": 6, "sta')  # línea a medio escribir de una ejecución interrumpida
+
+    assert batch_cli.load_checkpoint(str(output)) == {"1", "5", '"a"'}
+
+
+def test_missing_output_is_an_empty_checkpoint(tmp_path):
+    assert batch_cli.load_checkpoint(str(tmp_path / "nada.jsonl")) == set()
+
+
+def test_items_default_to_line_numbers(tmp_path):
+    source = tmp_path / "prompts.jsonl"
+    write_lines(source, [json.dumps("hola"), "", json.dumps({"id": "x", "message": "adiós", "agent_type": "code"})])
+    items = batch_cli.load_items(str(source), {"agent_type": "general", "priority": "low"})
+    assert items == [
+        {"agent_type": "general", "priority": "low", "id": 1, "message": "hola"},
+        {"agent_type": "code", "priority": "low", "id": "x", "message": "adiós"},
+    ]
+
+
+def test_rerun_sends_only_pending_items(tmp_path, monkeypatch):
+    source, output = tmp_path / "prompts.jsonl", tmp_path / "results.jsonl"
+    write_lines(source, [json.dumps(f"mensaje {n}") for n in range(1, 6)])
+    write_lines(output, [json.dumps({"id": 1, "status": 200}), json.dumps({"id": 2, "status": 502})])
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"id": 3, "sta')
+    sent = []
+
+    def run_chunk(runner, items):
+        sent.extend(item["id"] for item in items)
+        for item in items:
+            runner.write({"id": item["id"], "status": 200})
+        return len(items)
+
+    monkeypatch.setattr(batch_cli.BatchRunner, "run_chunk", run_chunk)
+    monkeypatch.setattr(sys, "argv", ["batch_cli", str(source), "--output", str(output), "--chunk-size", "2"])
+    assert batch_cli.main() == 0
+    assert sorted(sent) == [2, 3, 4, 5]
+    assert batch_cli.load_checkpoint(str(output)) == {"1", "2", "3", "4", "5"}
+    # La línea interrumpida queda separada de los resultados nuevos
+    assert output.read_text(encoding="utf-8").splitlines()[2] == '{"id": 3, "sta'
+
+    sent.clear()
+    assert batch_cli.main() == 0
+    assert sent == []
@@ -0,0 +1,93 @@
+"""Rutas de chat contra el stub de OpenRouter: validación del contexto, imágenes y 429 por cola llena"""
+import asyncio
+import base64
+import io
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+from src.models.user import db
+from src.routes import chat
+from src.services.llm_scheduler import LLMScheduler
+
+
+def png_base64() -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), (200, 30, 30)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+@pytest.fixture
+def client(stub_url, monkeypatch):
+    monkeypatch.setattr(chat.openrouter_service, "base_url", stub_url)
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    app.register_blueprint(chat.chat_bp, url_prefix="/api")
+    return app.test_client()
+
+
+@pytest.mark.parametrize("context, error", [
+    ("hola", "context must be a list of messages"),
+    (["hola"], "context entries must be objects"),
+    ([{"type": "user", "content": "hola"}], None),
+    ({"images": []}, None),
+])
+def test_validate_context(context, error):
+    assert chat.validate_chat_request({"message": "hola", "context": context}) == error
+
+
+def test_legacy_dict_context_is_not_chat_history():
+    context = chat.normalize_context({"files": [{"name": "a.png"}]})
+    assert context == [{"files": [{"name": "a.png"}]}]
+    history = [{"type": "user", "content": "hola"}, {"type": "agent", "content": "¿qué tal?"}] + context
+    assert chat.format_chat_history(history) == [{"role": "user", "content": "hola"},
+                                                 {"role": "assistant", "content": "¿qué tal?"}]
+
+
+def test_invalid_context_is_a_400(client):
+    response = client.post("/api/chat", json={"message": "hola", "context": "hola"})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "context must be a list of messages"
+
+
+@pytest.mark.parametrize("context", [
+    [{"type": "user", "content": "mira", "images": [{"name": "rojo.png", "base64": png_base64()}]}],
+    {"images": [{"name": "rojo.png", "base64": png_base64()}]},
+])
+def test_auto_routes_context_images_to_vision(client, context):
+    response = client.post("/api/chat", json={"message": "¿qué ves?", "agent_type": "auto",
+                                              "context": context, "cache": False})
+    body = response.get_json()
+    assert response.status_code == 200, body
+    assert body["agent_type"] == "vision"
+    assert len(body["metadata"]["service_results"]["vision"]["images_analyzed"]) == 1
+
+
+def test_full_model_queue_returns_429(client, monkeypatch):
+    scheduler = LLMScheduler(default_concurrency=1, max_queue=0)
+    monkeypatch.setattr(chat.openrouter_service, "scheduler", scheduler)
+    # El 429 solo llega si también está lleno el modelo alternativo
+    config = chat.AGENT_TYPES["general"]
+    limiters = [scheduler.limiter(model) for model in [config["model"]] + config["fallback_models"]]
+    for limiter in limiters:
+        asyncio.run(limiter.acquire())
+    try:
+        response = client.post("/api/chat", json={"message": "hola", "cache": False})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert response.get_json()["retry_after"] >= 1
+
+        stream = client.post("/api/chat/stream", json={"message": "hola", "cache": False})
+        assert stream.status_code == 429
+        stream.get_data()
+    finally:
+        for limiter in limiters:
+            limiter.release()
+
+    response = client.post("/api/chat", json={"message": "hola", "cache": False})
+    assert response.status_code == 200
+    assert response.get_json()["response"] == "Respuesta simulada del stub."
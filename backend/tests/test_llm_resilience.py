@@ -0,0 +1,107 @@
+"""Reintentos, modelos alternativos y circuit breaker del OpenRouterService contra el stub"""
+import asyncio
+import time
+
+import pytest
+
+from src.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry, CircuitOpenError
+from src.services.llm_scheduler import LLMScheduler
+from src.services.openrouter_service import OpenRouterService
+from src.services.retry_policy import RetryPolicy
+
+
+@pytest.fixture
+def service(stub_url):
+    service = OpenRouterService()
+    service.base_url = stub_url
+    service.scheduler = LLMScheduler(default_concurrency=8)
+    service.retry_policy = RetryPolicy(retries=2, base_delay=0.0)
+    service.breakers = CircuitBreakerRegistry(min_calls=3, error_threshold=0.5, cooldown=60)
+    yield service
+    service.http.close()
+
+
+def generate(service, model, fallbacks=()):
+    attempts, outcome = [], {}
+    content = asyncio.run(service.generate_response("hola", model=model, fallback_models=list(fallbacks),
+                                                    use_cache=False, attempts=attempts, outcome=outcome))
+    return content, attempts, outcome
+
+
+def test_retries_then_falls_back(service, failing):
+    failing.append("down")
+    content, attempts, outcome = generate(service, "down", ["up"])
+    assert content == "Respuesta simulada del stub."
+    assert outcome == {"ok": True, "complete": True, "model": "up"}
+    assert [(a["model"], a["attempt"], a["outcome"]) for a in attempts] == [
+        ("down", 1, "http_503"), ("down", 2, "http_503"), ("down", 3, "http_503"), ("up", 1, "ok")]
+
+
+def test_failure_without_fallback_is_reported_in_outcome(service, failing):
+    failing.append("down")
+    content, attempts, outcome = generate(service, "down")
+    assert content.startswith("Error")
+    assert outcome["ok"] is False
+    assert len(attempts) == 3
+
+
+def test_open_circuit_skips_the_model(service, failing):
+    failing.append("down")
+    generate(service, "down", ["up"])
+    assert service.breakers.get("down").state == OPEN
+
+    content, attempts, outcome = generate(service, "down", ["up"])
+    assert outcome["model"] == "up"
+    assert [(a["model"], a["outcome"]) for a in attempts] == [("down", "circuit_open"), ("up", "ok")]
+    assert not service.breakers.healthy()
+
+
+def test_breaker_closes_after_successful_probes():
+    breaker = CircuitBreaker("m", min_calls=2, error_threshold=0.5, cooldown=0.05, half_open_probes=2)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    time.sleep(0.06)
+    breaker.allow()
+    assert breaker.state == HALF_OPEN
+    breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()  # solo half_open_probes sondeos a la vez
+    breaker.record(True, 0.01)
+    assert breaker.state == HALF_OPEN
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker("m", min_calls=1, error_threshold=0.5, cooldown=0.05, half_open_probes=1)
+    breaker.allow()
+    breaker.record(False, 0.01)
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+
+
+def test_slow_calls_open_the_breaker():
+    breaker = CircuitBreaker("m", min_calls=2, slow_call_seconds=0.5, slow_threshold=0.5)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record(True, 1.0)
+    assert breaker.state == OPEN
+
+
+def test_cancelled_probe_is_released():
+    breaker = CircuitBreaker("m", min_calls=1, cooldown=0.05, half_open_probes=1)
+    breaker.allow()
+    breaker.record(False, 0.01)
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.release()
+    breaker.allow()
+    assert breaker.state == HALF_OPEN
@@ -0,0 +1,79 @@
+"""Límites por modelo del LLMScheduler: cola acotada, espera máxima y prioridad"""
+import asyncio
+
+import pytest
+
+from src.services.llm_scheduler import LLMScheduler, ModelLimiter, PRIORITIES, QueueFullError
+
+
+def test_rejects_when_queue_is_full():
+    limiter = ModelLimiter("m", max_concurrency=1, max_queue=0)
+
+    async def scenario():
+        await limiter.acquire()
+        with pytest.raises(QueueFullError) as error:
+            await limiter.acquire()
+        limiter.release()
+        return error.value
+
+    error = asyncio.run(scenario())
+    assert error.model == "m"
+    assert error.retry_after >= 1
+    assert limiter.rejected == 1
+    assert limiter.active == 0
+
+
+def test_check_admission_fails_fast_without_queueing():
+    limiter = ModelLimiter("m", max_concurrency=1, max_queue=0)
+    asyncio.run(limiter.acquire())
+    with pytest.raises(QueueFullError):
+        limiter.check_admission()
+    limiter.release()
+    limiter.check_admission()
+    assert limiter.queued == 0
+
+
+def test_queue_timeout_becomes_queue_full():
+    limiter = ModelLimiter("m", max_concurrency=1, max_queue=4, queue_timeout=0.05)
+
+    async def scenario():
+        await limiter.acquire()
+        try:
+            with pytest.raises(QueueFullError, match="espera agotada"):
+                await limiter.acquire()
+        finally:
+            limiter.release()
+
+    asyncio.run(scenario())
+    assert limiter.timed_out == 1
+    assert limiter.queued == 0
+    assert limiter.active == 0
+
+
+def test_waiters_are_served_by_priority():
+    scheduler = LLMScheduler(default_concurrency=1, max_queue=8)
+    order = []
+
+    async def worker(name, priority):
+        async with scheduler.slot("m", priority):
+            order.append(name)
+
+    async def scenario():
+        async with scheduler.slot("m"):
+            tasks = [asyncio.create_task(worker("low", PRIORITIES["low"])),
+                     asyncio.create_task(worker("high", PRIORITIES["high"])),
+                     asyncio.create_task(worker("normal", PRIORITIES["normal"]))]
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["high", "normal", "low"]
+
+
+def test_configure_keeps_the_strictest_limits():
+    scheduler = LLMScheduler(default_concurrency=8)
+    scheduler.configure("m", max_concurrency=16, rate_per_sec=0)
+    scheduler.configure("m", max_concurrency=4, rate_per_sec=2)
+    limiter = scheduler.limiter("m")
+    assert limiter.max_concurrency == 4
+    assert limiter.rate_per_sec == 2
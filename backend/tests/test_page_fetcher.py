@@ -0,0 +1,81 @@
+"""PageFetcher contra el servidor local de páginas: caché condicional, presupuesto de bytes,
+redirecciones y destinos privados"""
+import asyncio
+
+import pytest
+
+from src.services.page_fetcher import PageFetcher
+
+
+@pytest.fixture
+def make_fetcher(tmp_path):
+    fetchers = []
+
+    def make(**kwargs):
+        kwargs.setdefault("allow_private", True)
+        kwargs.setdefault("cache_path", str(tmp_path / "page_cache.db"))
+        fetchers.append(PageFetcher(**kwargs))
+        return fetchers[-1]
+
+    yield make
+    for fetcher in fetchers:
+        fetcher.http.close()
+
+
+def fetch(fetcher, url):
+    return asyncio.run(fetcher.fetch(url))
+
+
+def test_extracts_visible_text(make_fetcher, web_url):
+    page = fetch(make_fetcher(cache_path=None), f"{web_url}/page/1")
+    assert page["title"] == "Página 1"
+    assert "Párrafo 0 de la página 1." in page["text"]
+    assert "tracking" not in page["text"]
+    assert page["links"][0]["url"] == f"{web_url}/page/2"
+
+
+def test_fresh_pages_are_served_from_cache(make_fetcher, web_url):
+    fetcher = make_fetcher(fresh_for=60)
+    assert fetch(fetcher, f"{web_url}/page/2")["cache"] == "miss"
+    assert fetch(fetcher, f"{web_url}/page/2")["cache"] == "hit"
+    assert fetcher.conditional_requests == 0
+
+
+def test_stale_pages_are_revalidated_with_etag(make_fetcher, web_url):
+    fetcher = make_fetcher(fresh_for=0)
+    first = fetch(fetcher, f"{web_url}/page/3")
+    second = fetch(fetcher, f"{web_url}/page/3")
+    assert (first["cache"], second["cache"]) == ("miss", "revalidated")
+    assert second["text"] == first["text"]
+    assert fetcher.conditional_requests == 1
+    assert fetcher.not_modified == 1
+
+
+def test_stops_reading_at_byte_budget(make_fetcher, web_url):
+    fetcher = make_fetcher(cache_path=None, max_bytes=64 * 1024, max_chars=10 ** 7)
+    page = fetch(fetcher, f"{web_url}/big")
+    assert page["truncated"] is True
+    assert 64 * 1024 <= page["bytes_read"] < 64 * 1024 + 16 * 1024
+    assert page["title"] == "Grande"
+
+
+def test_follows_redirects_up_to_the_limit(make_fetcher, web_url):
+    page = fetch(make_fetcher(cache_path=None, max_redirects=1), f"{web_url}/redirect/4")
+    assert page["final_url"] == f"{web_url}/page/4"
+    assert page["title"] == "Página 4"
+
+    page = fetch(make_fetcher(cache_path=None, max_redirects=0), f"{web_url}/redirect/4")
+    assert page["error"].startswith("Demasiadas redirecciones")
+
+
+def test_rejects_unsupported_content_types(make_fetcher, web_url):
+    page = fetch(make_fetcher(cache_path=None), f"{web_url}/image.png")
+    assert page["error"] == "Tipo de contenido no soportado: image/png"
+
+
+@pytest.mark.parametrize("host", ["localhost", "127.0.0.1", "[::1]"])
+def test_private_targets_are_blocked(make_fetcher, web_url, host):
+    port = web_url.rsplit(":", 1)[1]
+    page = fetch(make_fetcher(cache_path=None, allow_private=False), f"http://{host}:{port}/page/1")
+    assert page["error"].startswith("Destino no permitido")
+
@@ -49,6 +49,54 @@ class ApiService {
     })
   }
 
+  // Chat en streaming (SSE): llama a onDelta con cada fragmento y devuelve el evento final
+  async streamMessage(message, agentType, context = [], onDelta = () => {}) {
+    const response = await fetch(`${this.baseURL}/api/chat/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({
+        message,
+        agent_type: agentType,
+        context
+      })
+    })
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    let result = null
+
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+
+      const events = buffer.split('\n\n')
+      buffer = events.pop()
+      for (const rawEvent of events) {
+        const lines = rawEvent.split('\n')
+        const event = lines.find(line => line.startsWith('event:'))?.slice(6).trim()
+        const data = JSON.parse(lines.find(line => line.startsWith('data:'))?.slice(5) || '{}')
+
+        if (event === 'delta') {
+          onDelta(data.content)
+        } else if (event === 'done') {
+          result = data
+        } else if (event === 'error') {
+          throw new Error(data.error)
+        }
+      }
+    }
+
+    return result
+  }
+
   async getAgents() {
     return this.request('/api/agents')
   }